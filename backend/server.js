@@ -10,6 +10,10 @@ const { v4: uuidv4 } = require("uuid");
 const db = require("./db");
 require("dotenv").config();
 
+// Aponte para scripts/worker_service.py (ex.: http://127.0.0.1:8765) para transcrever localmente
+const ASSEMBLYAI_BASE_URL =
+  process.env.ASSEMBLYAI_BASE_URL || "https://api.assemblyai.com";
+
 // Add request logging middleware
 const app = express();
 app.use((req, res, next) => {
@@ -450,7 +454,7 @@ async function sendToAssemblyAI(filePath) {
     const fileData = fs.readFileSync(filePath);
 
     // Upload to AssemblyAI
-    const uploadResponse = await fetch("https://api.assemblyai.com/v2/upload", {
+    const uploadResponse = await fetch(`${ASSEMBLYAI_BASE_URL}/v2/upload`, {
       method: "POST",
       headers: {
         authorization: process.env.ASSEMBLYAI_API_KEY,
@@ -482,7 +486,7 @@ async function sendToAssemblyAI(filePath) {
 async function checkTranscriptionStatus(assemblyAiId) {
   try {
     const response = await fetch(
-      `https://api.assemblyai.com/v2/transcript/${assemblyAiId}`,
+      `${ASSEMBLYAI_BASE_URL}/v2/transcript/${assemblyAiId}`,
       {
         method: "GET",
         headers: {
@@ -802,7 +806,7 @@ async function createTranscription(audioUrl) {
 
   try {
     const response = await fetch(
-      "https://api.assemblyai.com/v2/transcript",
+      `${ASSEMBLYAI_BASE_URL}/v2/transcript`,
       options
     );
 
@@ -0,0 +1,77 @@
+"""Attribute Whisper words to diarization speaker turns.
+
+Words (with timestamps) and pyannote turns are merged in one sweep over
+both lists sorted by start time: turns enter an active heap when they start
+before the current word ends and leave it (ordered by end) once they end
+before the current word starts, so each turn is pushed and popped once and
+the cost is O((words + turns) log turns) instead of words × turns. A word
+goes to the active turn it overlaps the most or, when it falls in a gap, to
+the nearest turn. Consecutive words of the same speaker then become one
+utterance, in the segment format used everywhere else
+({'start', 'end', 'speaker', 'text'}).
+"""
+import heapq
+
+
+def assign_speakers(words, turns):
+    """Speaker label of each word (None when there are no turns).
+
+    words and turns are dicts with 'start' and 'end'; turns also have
+    'speaker'. Neither needs to be sorted, and turns may overlap.
+    """
+    turns = sorted(turns, key=lambda turn: turn['start'])
+    order = sorted(range(len(words)), key=lambda i: words[i]['start'])
+    speakers = [None] * len(words)
+    if not turns:
+        return speakers
+
+    active = []        # (fim, índice) dos turnos que começaram
+    previous = None    # turno já encerrado que terminou mais tarde
+    upcoming = 0       # primeiro turno que ainda não começou
+    for i in order:
+        word = words[i]
+        while upcoming < len(turns) and turns[upcoming]['start'] < word['end']:
+            heapq.heappush(active, (turns[upcoming]['end'], upcoming))
+            upcoming += 1
+        # Palavras seguintes começam depois desta: turnos encerrados não voltam
+        while active and active[0][0] <= word['start']:
+            _, ended = heapq.heappop(active)
+            if previous is None or turns[ended]['end'] > turns[previous]['end']:
+                previous = ended
+
+        best, best_overlap = None, 0.0
+        for end, idx in active:
+            overlap = min(end, word['end']) - max(turns[idx]['start'], word['start'])
+            # Empate: fica com o turno que começou antes
+            if overlap > best_overlap or (overlap == best_overlap and best is not None and idx < best):
+                best, best_overlap = idx, overlap
+        if best is None:
+            # No silêncio entre turnos, fica com o mais próximo. Os ativos que
+            # não se sobrepõem começam depois da palavra (entraram por uma
+            # palavra anterior mais longa)
+            candidates = [idx for _, idx in active]
+            candidates += [idx for idx in (previous, upcoming) if idx is not None and idx < len(turns)]
+            best = min(candidates, key=lambda idx: (max(turns[idx]['start'] - word['end'],
+                                                        word['start'] - turns[idx]['end']), idx))
+        speakers[i] = turns[best]['speaker']
+    return speakers
+
+
+def utterances(words, speakers):
+    """Merge consecutive words of the same speaker into segments"""
+    segments = []
+    for word, speaker in zip(words, speakers):
+        if segments and segments[-1]['speaker'] == speaker:
+            segments[-1]['end'] = word['end']
+            segments[-1]['text'] += word['word']
+        else:
+            segments.append({'start': word['start'], 'end': word['end'],
+                             'speaker': speaker, 'text': word['word']})
+    for segment in segments:
+        segment['text'] = segment['text'].strip()
+    return segments
+
+
+def align(words, turns):
+    """Speaker-attributed utterances from timestamped words and speaker turns"""
+    return utterances(words, assign_speakers(words, turns))
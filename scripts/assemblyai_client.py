@@ -0,0 +1,264 @@
+"""Cliente assíncrono da API REST da AssemblyAI.
+
+Envia vários arquivos em paralelo (com limite de transcrições em andamento),
+reutiliza um único pool de conexões HTTP para uploads e consultas, e usa um
+único laço de polling com backoff para todas as transcrições pendentes, em
+vez de uma espera bloqueante por arquivo. Uploads e envios recusados com 429
+ou 5xx são repetidos após Retry-After (ou com backoff), e uma transcrição
+que não termina em max_wait segundos falha com TimeoutError.
+"""
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = os.getenv("ASSEMBLYAI_BASE_URL", "https://api.assemblyai.com")
+UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+# Tentativas de upload/envio recusados com 429 ou 5xx
+MAX_RETRIES = 5
+RETRY_BACKOFF = 2.0
+# Espera máxima por uma transcrição que continua em fila/processando
+MAX_WAIT_SECONDS = 3 * 3600
+
+
+def format_entry(file_name, text, utterances=None, content_safety_results=None, iab_results=None):
+    """
+    Monta a entrada de transcriptions.txt para um arquivo.
+
+    Args:
+        file_name (str): Nome do arquivo de áudio.
+        text (str): Texto completo da transcrição.
+        utterances (list): Pares (falante, texto), quando há diarização.
+        content_safety_results (list): Resultados de conteúdo sensível.
+        iab_results (list): Textos das categorias IAB detectadas.
+    """
+    # Formata a saída com os rótulos dos falantes (diarização)
+    if utterances:
+        formatted_transcription = "".join(
+            f"[Speaker {speaker}]: {utterance}\n" for speaker, utterance in utterances)
+    else:
+        formatted_transcription = text
+
+    entry = f"\n# {file_name}\n\n"
+    entry += formatted_transcription
+    entry += "\n\n"
+
+    if content_safety_results:
+        entry += "\nConteúdo sensível detectado:\n"
+        logger.info("Conteúdo sensível detectado:")
+
+    if iab_results:
+        entry += "\nCategorias IAB detectadas:\n"
+        logger.info("Categorias IAB detectadas:")
+        for result in iab_results:
+            entry += f"  - {result}\n"
+            logger.info(f" - {result}")
+
+    entry += "\n" + "-"*50 + "\n"  # Separador entre transcrições
+    return entry
+
+
+def entry_from_json(audio_path, transcript, speaker_labels=True, content_safety=False, iab_categories=False):
+    """Entrada de transcriptions.txt a partir da resposta JSON da API."""
+    utterances = None
+    if speaker_labels and transcript.get("utterances"):
+        utterances = [(u["speaker"], u["text"]) for u in transcript["utterances"]]
+    safety = (transcript.get("content_safety_labels") or {}).get("results") if content_safety else None
+    iab = (transcript.get("iab_categories_result") or {}).get("results") if iab_categories else None
+    return format_entry(os.path.basename(audio_path), transcript.get("text") or "", utterances,
+                        safety, [result["text"] for result in iab or []])
+
+
+def segments_from_json(transcript):
+    """Segmentos (início/fim em segundos, falante, texto) da resposta JSON da API."""
+    if transcript.get("utterances"):
+        return [{"start": u["start"] / 1000, "end": u["end"] / 1000,
+                 "speaker": u["speaker"], "text": u["text"]} for u in transcript["utterances"]]
+    text = transcript.get("text") or ""
+    return [{"start": None, "end": None, "speaker": None, "text": text}] if text else []
+
+
+async def _file_chunks(path, chunk_size=UPLOAD_CHUNK_SIZE):
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+class AsyncTranscriber:
+    """
+    Transcreve muitos arquivos de uma vez pela API REST.
+
+    Args:
+        api_key (str): Sua chave da API da AssemblyAI.
+        max_in_flight (int): Máximo de arquivos entre upload e conclusão.
+        base_url (str): URL base da API (útil para um servidor local de testes).
+        poll_interval (float): Intervalo inicial entre consultas, em segundos.
+        max_poll_interval (float): Intervalo máximo após o backoff.
+        max_wait (float): Tempo máximo de uma transcrição após o envio.
+        retry_backoff (float): Espera inicial antes de repetir um 429/5xx.
+    """
+
+    def __init__(self, api_key, max_in_flight=8, base_url=DEFAULT_BASE_URL,
+                 poll_interval=3.0, max_poll_interval=30.0, max_wait=MAX_WAIT_SECONDS,
+                 retry_backoff=RETRY_BACKOFF):
+        self.api_key = api_key
+        self.max_in_flight = max_in_flight
+        self.base_url = base_url.rstrip("/")
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.max_wait = max_wait
+        self.retry_backoff = retry_backoff
+        self._pending = {}  # id da transcrição -> (future, prazo)
+
+    async def _post(self, client, url, **kwargs):
+        """POST repetido enquanto a API responde 429 ou 5xx.
+
+        content pode ser uma função que devolve o corpo, recriado a cada tentativa.
+        """
+        delay = self.retry_backoff
+        for attempt in range(MAX_RETRIES + 1):
+            request = {key: value() if callable(value) else value for key, value in kwargs.items()}
+            response = await client.post(url, **request)
+            if response.status_code != 429 and response.status_code < 500 or attempt == MAX_RETRIES:
+                break
+            try:
+                wait = float(response.headers.get("Retry-After", delay))
+            except ValueError:
+                wait = delay
+            logger.warning(f"{url}: HTTP {response.status_code}, nova tentativa em {wait:.1f}s")
+            await asyncio.sleep(wait)
+            delay = min(delay * 2, self.max_poll_interval)
+        response.raise_for_status()
+        return response
+
+    async def _upload(self, client, audio_path):
+        if audio_path.startswith("http://") or audio_path.startswith("https://"):
+            return audio_path
+        if not os.path.exists(audio_path):
+            raise FileNotFoundError(f"Arquivo de áudio não encontrado: {audio_path}")
+        response = await self._post(client, "/v2/upload", content=lambda: _file_chunks(audio_path))
+        return response.json()["upload_url"]
+
+    async def _transcribe_one(self, client, semaphore, audio_path, config):
+        async with semaphore:
+            audio_url = await self._upload(client, audio_path)
+            response = await self._post(client, "/v2/transcript", json={"audio_url": audio_url, **config})
+            transcript_id = response.json()["id"]
+            logger.info(f"Enviado {os.path.basename(audio_path)} (id {transcript_id})")
+
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[transcript_id] = (future, loop.time() + self.max_wait)
+            return await future
+
+    def _finish(self, transcript_id, transcript=None, error=None):
+        future, _ = self._pending.pop(transcript_id)
+        if future.done():
+            return
+        if isinstance(error, asyncio.CancelledError):
+            future.cancel()
+        elif error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(transcript)
+
+    def _fail_pending(self, error):
+        for transcript_id in list(self._pending):
+            self._finish(transcript_id, error=error)
+
+    async def _poll(self, client, done):
+        """Um único laço consulta todas as transcrições pendentes."""
+        interval = self.poll_interval
+        while not (done.is_set() and not self._pending):
+            await asyncio.sleep(interval if self._pending else 0.05)
+            if not self._pending:
+                continue
+
+            ids = list(self._pending)
+            responses = await asyncio.gather(
+                *(client.get(f"/v2/transcript/{transcript_id}") for transcript_id in ids),
+                return_exceptions=True)
+
+            finished = 0
+            now = asyncio.get_running_loop().time()
+            for transcript_id, response in zip(ids, responses):
+                if transcript_id not in self._pending:
+                    continue
+                try:
+                    if isinstance(response, Exception):
+                        raise response
+                    if response.status_code >= 400:
+                        raise RuntimeError(f"HTTP {response.status_code}")
+                    transcript = response.json()
+                    status = transcript["status"]
+                except Exception as e:
+                    # Um corpo inválido ou erro de rede não derruba o laço
+                    logger.warning(f"Falha ao consultar {transcript_id}: {e!r}")
+                    status = None
+                if status in ("completed", "error"):
+                    finished += 1
+                    if status == "error":
+                        self._finish(transcript_id, error=RuntimeError(
+                            f"Erro na transcrição: {transcript.get('error')}"))
+                    else:
+                        self._finish(transcript_id, transcript)
+                elif now > self._pending[transcript_id][1]:
+                    self._finish(transcript_id, error=TimeoutError(
+                        f"Transcrição {transcript_id} não terminou em {self.max_wait:.0f}s"))
+
+            # Backoff enquanto nada termina; volta ao intervalo inicial quando algo conclui
+            interval = (self.poll_interval if finished
+                        else min(interval * 1.5, self.max_poll_interval))
+
+    async def transcribe_many(self, audio_paths, config, on_result=None):
+        """
+        Transcreve os arquivos e devolve [(caminho, transcrição JSON, erro)].
+
+        on_result(caminho, transcrição, erro) é chamado na ordem de audio_paths,
+        assim que todos os anteriores tiverem terminado.
+        """
+        import httpx
+        headers = {"authorization": self.api_key}
+        limits = httpx.Limits(max_connections=self.max_in_flight + 4)
+        async with httpx.AsyncClient(base_url=self.base_url, headers=headers,
+                                     limits=limits, timeout=120) as client:
+            semaphore = asyncio.Semaphore(self.max_in_flight)
+            done = asyncio.Event()
+            poller = asyncio.create_task(self._poll(client, done))
+            tasks = [asyncio.create_task(self._transcribe_one(client, semaphore, path, config))
+                     for path in audio_paths]
+
+            def poller_done(task):
+                # Se o laço de polling morrer, ninguém mais espera para sempre
+                error = task.exception() if not task.cancelled() else None
+                self._fail_pending(RuntimeError(f"Polling interrompido: {error!r}"))
+
+            poller.add_done_callback(poller_done)
+            results = []
+            try:
+                for audio_path, task in zip(audio_paths, tasks):
+                    try:
+                        transcript, error = await task, None
+                    except Exception as e:
+                        transcript, error = None, e
+                        logger.error(f"Falha ao processar {os.path.basename(audio_path)}: {e}")
+                    results.append((audio_path, transcript, error))
+                    if on_result is not None:
+                        on_result(audio_path, transcript, error)
+            finally:
+                # Após uma exceção (ex.: em on_result) nada fica pendurado
+                for task in tasks:
+                    task.cancel()
+                self._fail_pending(asyncio.CancelledError())
+                await asyncio.gather(*tasks, return_exceptions=True)
+                done.set()
+                await asyncio.gather(poller, return_exceptions=True)
+            return results
+
+
+def transcribe_many(api_key, audio_paths, config, max_in_flight=8, base_url=DEFAULT_BASE_URL,
+                    on_result=None, **options):
+    """Versão síncrona de AsyncTranscriber.transcribe_many (options vão para o AsyncTranscriber)."""
+    transcriber = AsyncTranscriber(api_key, max_in_flight=max_in_flight, base_url=base_url, **options)
+    return asyncio.run(transcriber.transcribe_many(audio_paths, config, on_result))
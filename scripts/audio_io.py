@@ -0,0 +1,132 @@
+"""Audio decoding straight into in-memory PCM buffers.
+
+Every file is decoded once into a 16 kHz mono float32 NumPy array, which is
+what faster-whisper and pyannote consume, so no intermediate MP3/WAV files
+are written. stream_audio() decodes the same samples as fixed-size chunks
+instead, for recordings too long to hold in memory at once.
+"""
+import logging
+import time
+import numpy as np
+import metrics
+
+SAMPLE_RATE = 16000
+
+# Tamanho dos blocos entregues por stream_audio
+STREAM_CHUNK_SECONDS = 30
+
+
+def load_audio(path, sampling_rate=SAMPLE_RATE):
+    """Decode any container/codec to a mono float32 buffer in [-1, 1]"""
+    from faster_whisper import decode_audio
+    start = time.perf_counter()
+    with metrics.timer("decode") as stage:
+        audio = decode_audio(path, sampling_rate=sampling_rate)
+        stage["audio_seconds"] = duration_seconds(audio, sampling_rate)
+    logging.info(
+        f"Decoded {path}: {duration_seconds(audio, sampling_rate):.1f}s of audio "
+        f"in {time.perf_counter() - start:.2f}s")
+    return audio
+
+
+def stream_audio(path, chunk_seconds=STREAM_CHUNK_SECONDS, sampling_rate=SAMPLE_RATE):
+    """Decode to mono float32 chunks of chunk_seconds (the last one shorter).
+
+    Same decoder and resampler as load_audio (PyAV, which faster-whisper
+    already depends on), but only one chunk is held at a time.
+    """
+    import av
+    step = int(chunk_seconds * sampling_rate)
+    resampler = av.audio.resampler.AudioResampler(format="s16", layout="mono", rate=sampling_rate)
+    pending = []
+    size = 0
+    with av.open(path, mode="r", metadata_errors="ignore") as container:
+        frames = container.decode(audio=0)
+        while True:
+            try:
+                frame = next(frames, None)
+            except av.error.InvalidDataError:
+                # Quadros corrompidos são ignorados, como em decode_audio
+                continue
+            for resampled in resampler.resample(frame):
+                array = resampled.to_ndarray().reshape(-1)
+                pending.append(array)
+                size += len(array)
+            while size >= step:
+                data = np.concatenate(pending)
+                yield data[:step].astype(np.float32) / 32768
+                pending = [data[step:]]
+                size -= step
+            if frame is None:
+                break
+    if size:
+        yield np.concatenate(pending).astype(np.float32) / 32768
+
+
+def duration_seconds(audio, sampling_rate=SAMPLE_RATE):
+    return len(audio) / sampling_rate
+
+
+def probe_duration(path):
+    """Duration in seconds read from the container header, without decoding.
+
+    None when the header does not tell (or the file is not readable yet).
+    """
+    import av
+    try:
+        with av.open(path, mode="r", metadata_errors="ignore") as container:
+            if container.duration is not None:
+                return container.duration / av.time_base
+            stream = container.streams.audio[0]
+            if stream.duration is not None and stream.time_base is not None:
+                return float(stream.duration * stream.time_base)
+    except (av.error.FFmpegError, IndexError, OSError):
+        pass
+    return None
+
+
+def read_range(path, start, end):
+    """16-bit samples (frames x channels) between start and end, in seconds,
+    at the file's own sample rate; returns (samples, sample_rate).
+
+    Seeks in the container to just before start instead of decoding the
+    recording from the beginning, so cutting a clip near the end of a
+    two-hour meeting costs about as much as cutting one at the start.
+    """
+    import av
+    with av.open(path, mode="r", metadata_errors="ignore") as container:
+        stream = container.streams.audio[0]
+        rate = stream.codec_context.sample_rate
+        channels = stream.codec_context.layout.nb_channels
+        resampler = av.audio.resampler.AudioResampler(format="s16", layout=stream.codec_context.layout,
+                                                      rate=rate)
+        # Vai para o último ponto de acesso antes de start
+        container.seek(int(max(start, 0.0) / stream.time_base), stream=stream)
+        first = last = None
+        chunks = []
+        position = None
+        for frame in container.decode(stream):
+            if position is None:
+                position = float(frame.pts * stream.time_base) if frame.pts is not None else 0.0
+                first = int(round((start - position) * rate))
+                last = int(round((end - position) * rate))
+            for resampled in resampler.resample(frame):
+                chunks.append(resampled.to_ndarray().reshape(-1, channels))
+            if sum(len(chunk) for chunk in chunks) >= last:
+                break
+    if not chunks:
+        return np.zeros((0, channels), dtype=np.int16), rate
+    samples = np.concatenate(chunks)
+    return samples[max(first, 0):max(last, 0)], rate
+
+
+def to_int16(audio):
+    """Convert a float buffer to 16-bit PCM samples"""
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def diarization_input(audio, sampling_rate=SAMPLE_RATE):
+    """Wrap a buffer in the in-memory format accepted by pyannote pipelines"""
+    import torch
+    return {"waveform": torch.from_numpy(np.ascontiguousarray(audio)).unsqueeze(0),
+            "sample_rate": sampling_rate}
@@ -0,0 +1,228 @@
+"""Parallel batch engine for the files in audios/.
+
+Each worker is a separate process that runs an initializer once (typically
+loading a resident Whisper model) and then pulls files from a shared queue.
+Files are scheduled longest-first, results are handed back to the caller in a
+deterministic (sorted by name) order, and a worker whose resident memory grows
+past a ceiling is replaced by a fresh process.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import time
+import metrics
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.ogg', '.opus', '.m4a')
+
+
+def list_audio_files(directory, extensions=None):
+    """List the files of a directory in a deterministic order"""
+    files = sorted(os.listdir(directory))
+    if extensions:
+        files = [f for f in files if f.lower().endswith(extensions)]
+    return files
+
+
+def threads_per_worker(workers):
+    """CPU threads each worker may use without oversubscribing the cores"""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def current_rss_mb():
+    """Resident memory of the current process, in MB"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # Sem /proc (macOS): usa o pico, que é o melhor disponível
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _worker_loop(worker_id, tasks, results, handler, initializer, initargs, memory_limit_mb):
+    start = time.perf_counter()
+    if initializer is not None:
+        initializer(*initargs)
+    results.put(("ready", worker_id, time.perf_counter() - start))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        index, path = task
+        results.put(("start", worker_id, index))
+        start = time.perf_counter()
+        try:
+            result, error = handler(path), None
+        except Exception as e:
+            result, error = None, f"{type(e).__name__}: {e}"
+        results.put(("done", worker_id, index, result, error,
+                     time.perf_counter() - start))
+
+        if memory_limit_mb and current_rss_mb() > memory_limit_mb:
+            results.put(("recycle", worker_id, current_rss_mb()))
+            break
+
+
+def _new_stats():
+    return {"init_time": 0.0, "busy_time": 0.0, "wall_time": 0.0,
+            "completed": 0, "failed": 0, "recycled": 0}
+
+
+def _run_inline(paths, handler, initializer, initargs, emit, stats):
+    start = time.perf_counter()
+    if initializer is not None:
+        initializer(*initargs)
+    stats["init_time"] += time.perf_counter() - start
+
+    for index, path in enumerate(paths):
+        metrics.gauge("queue_depth", len(paths) - index - 1)
+        start = time.perf_counter()
+        try:
+            result, error = handler(path), None
+        except Exception as e:
+            result, error = None, f"{type(e).__name__}: {e}"
+        stats["busy_time"] += time.perf_counter() - start
+        emit(index, result, error)
+
+
+def run_batch(paths, handler, workers=1, initializer=None, initargs=(),
+              memory_limit_mb=None, on_result=None):
+    """Process paths with a pool of worker processes.
+
+    handler(path) runs in the workers and its return value is passed to
+    on_result(path, result, error) in the parent, in the order of paths.
+    With workers <= 1 everything runs in the current process.
+    """
+    paths = list(paths)
+    stats = _new_stats()
+    pending = {}
+    next_index = 0
+    wall_start = time.perf_counter()
+
+    def emit(index, result, error):
+        nonlocal next_index
+        if error is None:
+            stats["completed"] += 1
+        else:
+            stats["failed"] += 1
+            logging.error(f"Failed to process {paths[index]}: {error}")
+        pending[index] = (result, error)
+        # Só entrega resultados em ordem, assim que o prefixo estiver completo
+        while next_index in pending:
+            result, error = pending.pop(next_index)
+            if on_result is not None:
+                on_result(paths[next_index], result, error)
+            next_index += 1
+
+    if not paths:
+        return stats
+
+    if workers <= 1 or len(paths) <= 1:
+        _run_inline(paths, handler, initializer, initargs, emit, stats)
+        stats["wall_time"] = time.perf_counter() - wall_start
+        return stats
+
+    workers = min(workers, len(paths))
+    ctx = multiprocessing.get_context("spawn")
+    tasks = ctx.Queue()
+    results = ctx.Queue()
+
+    # Maiores primeiro: o tamanho do arquivo aproxima a duração
+    order = sorted(range(len(paths)),
+                   key=lambda i: os.path.getsize(paths[i]), reverse=True)
+    for index in order:
+        tasks.put((index, paths[index]))
+    for _ in range(workers):
+        tasks.put(None)
+
+    processes = {}
+    in_flight = {}
+    ready = set()
+    started = 0
+    next_worker_id = 0
+
+    def spawn():
+        nonlocal next_worker_id
+        worker_id = next_worker_id
+        next_worker_id += 1
+        process = ctx.Process(
+            target=_worker_loop,
+            args=(worker_id, tasks, results, handler, initializer, initargs,
+                  memory_limit_mb),
+            daemon=True)
+        process.start()
+        processes[worker_id] = process
+
+    for _ in range(workers):
+        spawn()
+
+    while next_index < len(paths):
+        try:
+            message = results.get(timeout=1)
+        except queue.Empty:
+            # Detecta workers que morreram sem avisar (ex.: OOM killer)
+            for worker_id, process in list(processes.items()):
+                if not process.is_alive():
+                    del processes[worker_id]
+                    index = in_flight.pop(worker_id, None)
+                    if index is not None:
+                        emit(index, None,
+                             f"worker exited with code {process.exitcode}")
+                        spawn()
+                    elif worker_id not in ready:
+                        raise RuntimeError(
+                            f"Worker {worker_id} failed to start (exit code {process.exitcode})")
+                    elif process.exitcode != 0:
+                        # Morreu entre dois arquivos: nenhum resultado perdido, só a vaga
+                        logging.warning(f"Worker {worker_id} exited with code {process.exitcode} "
+                                        f"between files")
+                        if started < len(paths):
+                            spawn()
+            continue
+
+        kind, worker_id = message[0], message[1]
+        if kind == "ready":
+            ready.add(worker_id)
+            stats["init_time"] += message[2]
+        elif kind == "start":
+            in_flight[worker_id] = message[2]
+            started += 1
+            metrics.gauge("queue_depth", len(paths) - started)
+        elif kind == "done":
+            _, _, index, result, error, elapsed = message
+            in_flight.pop(worker_id, None)
+            stats["busy_time"] += elapsed
+            emit(index, result, error)
+        elif kind == "recycle":
+            logging.info(
+                f"Recycling worker {worker_id} at {message[2]:.0f} MB RSS")
+            stats["recycled"] += 1
+            processes.pop(worker_id).join()
+            spawn()
+
+    for process in processes.values():
+        process.join()
+
+    stats["wall_time"] = time.perf_counter() - wall_start
+    return stats
+
+
+def log_stats(stats):
+    """Log the summary of a batch run"""
+    logging.info(
+        f"Batch finished: {stats['completed']} ok, {stats['failed']} failed, "
+        f"{stats['recycled']} worker recycles. Model load time: {stats['init_time']:.2f}s, "
+        f"processing time: {stats['busy_time']:.2f}s, wall time: {stats['wall_time']:.2f}s")
+
+
+def add_batch_arguments(parser):
+    """Add the shared batch options to an argparse parser"""
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes (default: 1, no pool)")
+    parser.add_argument("--max-worker-memory", type=float, default=None, metavar="MB",
+                        help="Recycle a worker whose resident memory exceeds this many MB")
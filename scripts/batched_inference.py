@@ -0,0 +1,93 @@
+"""Batched Whisper decoding of many short speech turns.
+
+transcribe() runs the whole pipeline (mel, encoder, decoder) once per call,
+so meetings with hundreds of short turns pay the fixed per-call cost
+hundreds of times. Here consecutive segments of the same speaker are merged
+into turns of at most 30 s, each turn is turned into a padded 30 s mel
+window, and batch_size windows go through the encoder and the decoder in a
+single CTranslate2 call. Every window holds exactly one speaker turn, so
+the decoded text maps straight back to its turn without word alignment.
+Turns may come from several buffers (files) in the same batch.
+"""
+import numpy as np
+from segment_windows import MAX_WINDOW_SECONDS
+from audio_io import SAMPLE_RATE
+
+# Quadros de mel de uma janela de 30 s (10 ms por quadro), o que o encoder espera
+N_FRAMES = 3000
+DEFAULT_BATCH_SIZE = 8
+MAX_LENGTH = 448
+
+
+def pack_turns(segments, max_window=MAX_WINDOW_SECONDS):
+    """Merge consecutive same-speaker segments into turns of at most max_window.
+
+    Segments longer than max_window are split into max_window pieces.
+    """
+    turns = []
+    for segment in segments:
+        start = segment['start']
+        while segment['end'] - start > max_window:
+            turns.append({'start': start, 'end': start + max_window, 'speaker': segment['speaker']})
+            start += max_window
+        last = turns[-1] if turns else None
+        if (last is not None and last['speaker'] == segment['speaker']
+                and segment['end'] - last['start'] <= max_window):
+            last['end'] = segment['end']
+        else:
+            turns.append({'start': start, 'end': segment['end'], 'speaker': segment['speaker']})
+    return turns
+
+
+class BatchedWhisper:
+    """Decode lists of ≤30 s clips with batched encoder/decoder calls"""
+
+    def __init__(self, model, language="pt", batch_size=DEFAULT_BATCH_SIZE, beam_size=5):
+        from faster_whisper.tokenizer import Tokenizer
+        self.model = model
+        self.batch_size = batch_size
+        self.beam_size = beam_size
+        self.tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual,
+                                   task="transcribe", language=language)
+        self.prompt = list(self.tokenizer.sot_sequence) + [self.tokenizer.no_timestamps]
+
+    def features(self, clip):
+        """Log-mel of a clip, trimmed or zero-padded to one 30 s window"""
+        mel = self.model.feature_extractor(clip)[:, :N_FRAMES]
+        if mel.shape[1] < N_FRAMES:
+            mel = np.pad(mel, ((0, 0), (0, N_FRAMES - mel.shape[1])))
+        return mel
+
+    def decode(self, clips):
+        """Text of each clip; all clips go through the model as one batch"""
+        import ctranslate2
+        features = np.ascontiguousarray(np.stack([self.features(clip) for clip in clips]),
+                                        dtype=np.float32)
+        encoder_output = self.model.model.encode(ctranslate2.StorageView.from_array(features),
+                                                 to_cpu=False)
+        results = self.model.model.generate(
+            encoder_output, [self.prompt] * len(clips), beam_size=self.beam_size,
+            max_length=MAX_LENGTH, suppress_blank=True, suppress_tokens=[-1])
+        return [self.tokenizer.decode(result.sequences_ids[0]).strip() for result in results]
+
+    def transcribe(self, jobs, sampling_rate=SAMPLE_RATE):
+        """Transcribe the turns of several buffers in shared batches.
+
+        jobs is a list of (samples, turns); yields (job index, turn, text) in
+        job and turn order, one batch at a time.
+        """
+        items = [(index, turn) for index, (_, turns) in enumerate(jobs) for turn in turns]
+        for offset in range(0, len(items), self.batch_size):
+            batch = items[offset:offset + self.batch_size]
+            clips = [jobs[index][0][int(turn['start'] * sampling_rate):int(turn['end'] * sampling_rate)]
+                     for index, turn in batch]
+            for (index, turn), text in zip(batch, self.decode(clips)):
+                yield index, turn, text
+
+
+def transcribe_turns(model, samples, segments, language="pt", batch_size=DEFAULT_BATCH_SIZE,
+                     sampling_rate=SAMPLE_RATE):
+    """Batched counterpart of segment_windows.transcribe_windows; yields (turn, text)"""
+    batched = BatchedWhisper(model, language, batch_size)
+    for _, turn, text in batched.transcribe([(samples, pack_turns(segments))], sampling_rate):
+        yield turn, text
@@ -0,0 +1,269 @@
+"""Benchmark harness for the transcription pipeline stages.
+
+Runs decode, silence detection, model load, Whisper inference, diarization,
+word/speaker alignment and the end-to-end main_di.py path on synthetic speech-like audio of several
+lengths (or on given files). Every stage runs in a fresh process so its peak
+RSS is its own. Results are saved as JSON and can be compared against a
+previous run to catch regressions. --max-rss puts a ceiling on the peak RSS
+of the block-by-block stages, which must not grow with the audio length.
+
+    python bench.py --durations 30 300 --output bench_results.json
+    python bench.py --compare bench_results.json --tolerance 0.15
+    python bench.py --durations 600 14400 --stages blocks --max-rss 300
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from audio_io import SAMPLE_RATE, to_int16
+from bench_vad import synthetic_speech
+
+STAGES = ("decode", "vad", "model_load", "transcribe", "windows", "batched", "diarize", "end_to_end",
+          "blocks", "blocks_end_to_end", "align")
+
+# Estágios cujo pico de memória não deve crescer com a duração do áudio
+BOUNDED_STAGES = ("blocks", "blocks_end_to_end")
+
+
+def write_wav(path, samples, sampling_rate=SAMPLE_RATE):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sampling_rate)
+        f.writeframes(to_int16(samples).tobytes())
+
+
+def peak_rss_mb():
+    # ru_maxrss sobrevive ao exec e herdaria o pico do processo pai (que gera
+    # as entradas sintéticas); VmHWM é zerado com o novo espaço de endereços
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _stage_body(stage, audio_path, options):
+    """Prepare the inputs of a stage and return the callable to time"""
+    from audio_io import load_audio
+
+    if stage == "decode":
+        return lambda: load_audio(audio_path)
+
+    if stage == "align":
+        # Uma palavra a cada 0.3 s e um turno de falante a cada ~3 s, sem modelos
+        from alignment import align
+        duration = options["duration"]
+        words = [{'start': t * 0.3, 'end': t * 0.3 + 0.25, 'word': " palavra"}
+                 for t in range(int(duration / 0.3))]
+        turns = [{'start': t * 3.0, 'end': t * 3.0 + 2.8 + (t % 3) * 0.2, 'speaker': f"SPEAKER_{t % 4}"}
+                 for t in range(int(duration / 3))]
+        return lambda: align(words, turns)
+
+    if stage in BOUNDED_STAGES:
+        # Nada de load_audio aqui: o estágio mede justamente o caminho em blocos
+        from long_audio import speech_blocks
+        if stage == "blocks":
+            return lambda: sum(len(segments) for _, _, segments in
+                               speech_blocks(audio_path, block_seconds=options["block_seconds"]))
+        from segment_windows import transcribe_windows
+        from whisper_models import get_whisper_model
+        model = get_whisper_model(options["model_size"], options["compute_type"], options["cpu_threads"])
+        return lambda: [text for _, samples, segments in
+                        speech_blocks(audio_path, block_seconds=options["block_seconds"])
+                        for _, text in transcribe_windows(model, samples, segments)]
+
+    samples = load_audio(audio_path)
+    if stage == "vad":
+        from vad import detect_nonsilent_ranges
+        return lambda: detect_nonsilent_ranges(samples)
+
+    from whisper_models import get_whisper_model, transcribe_segments
+    model_args = (options["model_size"], options["compute_type"], options["cpu_threads"])
+    if stage == "model_load":
+        return lambda: get_whisper_model(*model_args)
+
+    if stage == "diarize":
+        from diarization import diarize, load_pipeline
+        pipeline = load_pipeline()
+        return lambda: diarize(samples, workers=options["workers"], pipeline=pipeline)
+
+    model = get_whisper_model(*model_args)
+    if stage == "transcribe":
+        return lambda: list(transcribe_segments(model, samples))
+
+    if stage in ("windows", "batched"):
+        # Mesmos turnos de fala, decodificados em janelas de 30 s ou em lotes
+        from vad import detect_nonsilent_ranges
+        segments = [{'start': s / 1000, 'end': e / 1000, 'speaker': f"SPEAKER_{i % 2 + 1}"}
+                    for i, (s, e) in enumerate(detect_nonsilent_ranges(samples, 700, -40))]
+        if stage == "batched":
+            from batched_inference import transcribe_turns
+            return lambda: list(transcribe_turns(model, samples, segments,
+                                                 batch_size=options["batch_size"]))
+        from segment_windows import transcribe_windows
+        return lambda: list(transcribe_windows(model, samples, segments))
+
+    if stage == "end_to_end":
+        from segment_windows import transcribe_windows
+        from vad import detect_nonsilent_ranges
+
+        def end_to_end():
+            audio = load_audio(audio_path)
+            segments = [{'start': s / 1000, 'end': e / 1000, 'speaker': "SPEAKER_1"}
+                        for s, e in detect_nonsilent_ranges(audio, 700, -40)]
+            return list(transcribe_windows(model, audio, segments))
+        return end_to_end
+
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def _run_stage(stage, audio_path, duration, options):
+    """Runs inside a fresh process; returns the measurements of one stage"""
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        body = _stage_body(stage, audio_path, {**options, "duration": duration})
+    except Exception as e:
+        return {"stage": stage, "skipped": f"{type(e).__name__}: {e}"}
+
+    cpu_start = cpu_seconds()
+    start = time.perf_counter()
+    body()
+    elapsed = time.perf_counter() - start
+    cpu = cpu_seconds() - cpu_start
+    return {
+        "stage": stage,
+        "audio_seconds": duration,
+        "seconds": elapsed,
+        "rtf": elapsed / duration,
+        "cpu_seconds": cpu,
+        "cores_used": cpu / elapsed if elapsed else 0.0,
+        "audio_seconds_per_core_second": duration / cpu if cpu else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_benchmarks(inputs, stages, options, repeat=1):
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for name, audio_path, duration in inputs:
+        for stage in stages:
+            for _ in range(repeat):
+                # Processo novo por estágio: o pico de RSS não herda os anteriores
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    result = executor.submit(_run_stage, stage, audio_path, duration, options).result()
+                result["input"] = name
+                results.append(result)
+                print(format_result(result), flush=True)
+    return results
+
+
+def format_result(result):
+    if "skipped" in result:
+        return f"{result['input']:>12} {result['stage']:<11} skipped ({result['skipped']})"
+    per_core = result["audio_seconds_per_core_second"]
+    return (f"{result['input']:>12} {result['stage']:<11} {result['seconds']:8.3f}s  "
+            f"RTF {result['rtf']:7.4f}  peak RSS {result['peak_rss_mb']:7.0f} MB  "
+            f"{per_core if per_core is not None else float('nan'):8.1f} audio s/core s")
+
+
+def compare(results, baseline, tolerance):
+    """List the stages whose RTF or peak RSS regressed beyond the tolerance"""
+    previous = {(r["input"], r["stage"]): r for r in baseline["results"] if "skipped" not in r}
+    regressions = []
+    for result in results:
+        old = previous.get((result["input"], result["stage"]))
+        if old is None or "skipped" in result:
+            continue
+        for metric in ("rtf", "peak_rss_mb"):
+            if result[metric] > old[metric] * (1 + tolerance):
+                regressions.append(f"{result['input']} {result['stage']} {metric}: "
+                                   f"{old[metric]:.4f} -> {result[metric]:.4f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the transcription pipeline stages")
+    parser.add_argument("--durations", type=float, nargs="+", default=[30, 120, 600],
+                        help="Lengths of the synthetic inputs, in seconds")
+    parser.add_argument("--audio", nargs="*", default=[],
+                        help="Benchmark these files instead of synthetic audio")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--model-size", default="base")
+    parser.add_argument("--compute-type", default=None)
+    parser.add_argument("--cpu-threads", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="Diarization workers")
+    parser.add_argument("--batch-size", type=int, default=8, help="Turns per batch in the batched stage")
+    parser.add_argument("--block-seconds", type=float, default=120, help="Block size of the blocks stages")
+    parser.add_argument("--max-rss", type=float, metavar="MB",
+                        help=f"Fail if a bounded-memory stage ({', '.join(BOUNDED_STAGES)}) peaks above this")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="Previous results to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed relative slowdown / memory growth (default: 0.2)")
+    args = parser.parse_args()
+
+    options = {"model_size": args.model_size, "compute_type": args.compute_type,
+               "cpu_threads": args.cpu_threads, "workers": args.workers,
+               "batch_size": args.batch_size, "block_seconds": args.block_seconds}
+
+    # Lido antes de salvar, caso --output aponte para o mesmo arquivo
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        inputs = []
+        if args.audio:
+            from audio_io import duration_seconds, load_audio
+            for path in args.audio:
+                inputs.append((os.path.basename(path), path, duration_seconds(load_audio(path))))
+        else:
+            for duration in args.durations:
+                path = os.path.join(temp_dir, f"synthetic_{duration:g}s.wav")
+                write_wav(path, synthetic_speech(duration))
+                inputs.append((f"{duration:g}s", path, duration))
+
+        results = run_benchmarks(inputs, args.stages, options, args.repeat)
+
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "platform": platform.platform(),
+              "python": platform.python_version(), "cpu_count": os.cpu_count(),
+              "options": options, "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+    failures = []
+    if args.max_rss is not None:
+        failures += [f"{r['input']} {r['stage']} peak RSS {r['peak_rss_mb']:.0f} MB > {args.max_rss:.0f} MB"
+                     for r in results
+                     if r["stage"] in BOUNDED_STAGES and "skipped" not in r and r["peak_rss_mb"] > args.max_rss]
+    if baseline is not None:
+        failures += [f"REGRESSION {regression}" for regression in compare(results, baseline, args.tolerance)]
+    for failure in failures:
+        print(failure)
+    if args.max_rss is not None or baseline is not None:
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
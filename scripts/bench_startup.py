@@ -0,0 +1,81 @@
+"""Startup latency guard for the CLI scripts.
+
+Runs each script with --help in a fresh interpreter, several times, and
+reports the median wall time. It fails (exit code 1) when a script takes
+longer than the budget or when a heavy dependency (torch, pyannote,
+faster_whisper, ...) was imported just to print the help.
+
+    python bench_startup.py
+    python bench_startup.py --budget 0.5 --scripts main.py main_di.py
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SCRIPTS = ("main.py", "main_di.py", "main_as.py", "worker_service.py", "watch.py", "dispatch.py", "bench.py")
+
+# Módulos que só devem ser importados quando o caminho de código precisa deles
+HEAVY_MODULES = ("torch", "pyannote", "faster_whisper", "ctranslate2", "pydub",
+                 "assemblyai", "httpx", "timeout_decorator", "transformers")
+
+PROBE = """
+import json, runpy, sys
+sys.argv = [{script!r}, "--help"]
+try:
+    runpy.run_path({script!r}, run_name="__main__")
+except SystemExit:
+    pass
+heavy = sorted({{name.split(".")[0] for name in sys.modules}} & set({heavy!r}))
+print("\\n" + json.dumps(heavy))
+"""
+
+
+def measure(script, repeat=5):
+    """(median seconds, heavy modules imported) for `python script --help`"""
+    code = PROBE.format(script=script, heavy=HEAVY_MODULES)
+    times = []
+    heavy = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        times.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError(f"{script} --help failed:\n{result.stderr}")
+        heavy = json.loads(result.stdout.strip().splitlines()[-1])
+    return statistics.median(times), heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the startup time of the CLI scripts")
+    parser.add_argument("--scripts", nargs="+", default=list(SCRIPTS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=1.0,
+                        help="Maximum median seconds for `script --help` (default: 1.0)")
+    args = parser.parse_args()
+
+    failures = []
+    for script in args.scripts:
+        try:
+            seconds, heavy = measure(script, args.repeat)
+        except RuntimeError as e:
+            print(e)
+            failures.append(f"{script} --help failed")
+            continue
+        print(f"{script:<20} {seconds * 1000:7.0f} ms  heavy imports: {', '.join(heavy) or 'none'}")
+        if seconds > args.budget:
+            failures.append(f"{script} took {seconds:.2f}s (budget {args.budget:.2f}s)")
+        if heavy:
+            failures.append(f"{script} imported {', '.join(heavy)} at startup")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
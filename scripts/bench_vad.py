@@ -0,0 +1,79 @@
+"""Benchmark the vectorized silence segmenter against pydub's detect_nonsilent.
+
+Generates synthetic speech-like audio (noise bursts with pauses of random
+length), runs both implementations and checks that the boundaries match.
+
+    python bench_vad.py --durations 60 300 --min-silence-len 700
+"""
+import argparse
+import sys
+import time
+import numpy as np
+from audio_io import SAMPLE_RATE, to_int16
+from vad import detect_nonsilent_ranges
+
+
+def synthetic_speech(duration, seed=0, sampling_rate=SAMPLE_RATE):
+    """Bursts of modulated noise separated by pauses, float32 in [-1, 1]"""
+    rng = np.random.default_rng(seed)
+    audio = np.zeros(int(duration * sampling_rate), dtype=np.float32)
+    position = 0
+    while position < len(audio):
+        burst = int(rng.uniform(0.2, 4.0) * sampling_rate)
+        pause = int(rng.exponential(0.8) * sampling_rate)
+        end = min(position + burst, len(audio))
+        t = np.arange(end - position) / sampling_rate
+        envelope = 0.5 * (1 + np.sin(2 * np.pi * rng.uniform(2, 6) * t))
+        audio[position:end] = rng.normal(0, rng.uniform(0.02, 0.3), end - position) * envelope
+        # Ruído de fundo baixo durante as pausas
+        audio[end:end + pause] = rng.normal(0, 0.002, len(audio[end:end + pause]))
+        position = end + pause
+    return audio
+
+
+def run_pydub(samples, min_silence_len, silence_thresh):
+    from pydub import AudioSegment
+    from pydub.silence import detect_nonsilent
+    segment = AudioSegment(data=to_int16(samples).tobytes(), sample_width=2,
+                           frame_rate=SAMPLE_RATE, channels=1)
+    return detect_nonsilent(segment, min_silence_len=min_silence_len,
+                            silence_thresh=silence_thresh)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--durations", type=float, nargs="+", default=[30, 120, 600],
+                        help="Audio lengths to test, in seconds")
+    parser.add_argument("--min-silence-len", type=int, default=700)
+    parser.add_argument("--silence-thresh", type=float, default=-40)
+    parser.add_argument("--skip-pydub", action="store_true",
+                        help="Only time the vectorized implementation")
+    args = parser.parse_args()
+
+    mismatches = 0
+    for duration in args.durations:
+        samples = synthetic_speech(duration)
+        ranges, numpy_time = timed(detect_nonsilent_ranges, samples,
+                                   args.min_silence_len, args.silence_thresh)
+        line = f"{duration:7.0f}s audio: numpy {numpy_time:7.3f}s ({len(ranges)} ranges)"
+
+        if not args.skip_pydub:
+            reference, pydub_time = timed(run_pydub, samples,
+                                          args.min_silence_len, args.silence_thresh)
+            match = reference == ranges
+            mismatches += not match
+            line += (f", pydub {pydub_time:7.3f}s, speedup {pydub_time / numpy_time:6.1f}x, "
+                     f"boundaries {'match' if match else 'DIFFER'}")
+        print(line)
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
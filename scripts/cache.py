@@ -0,0 +1,154 @@
+"""Content-addressed transcription cache.
+
+Results are keyed on the SHA-256 of the audio bytes plus the options that
+affect the output (model, language, speaker_labels, ...), stored in a local
+SQLite index and evicted least-recently-used once the cache grows past its
+size limit. File hashes are memoised by (path, size, mtime) so unchanged
+files are not re-read on every run.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+import metrics
+
+DEFAULT_CACHE_PATH = os.path.join("transcriptions", "cache.sqlite3")
+DEFAULT_CACHE_SIZE_MB = 512
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    audio_hash TEXT NOT NULL,
+    options TEXT NOT NULL,
+    result TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    audio_hash TEXT NOT NULL
+);
+"""
+
+
+def hash_file(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class TranscriptionCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_CACHE_SIZE_MB * 1024 * 1024):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def audio_hash(self, audio_path):
+        """SHA-256 of the file content, reusing the stored hash if unchanged"""
+        stat = os.stat(audio_path)
+        path = os.path.abspath(audio_path)
+        row = self.db.execute(
+            "SELECT audio_hash FROM file_hashes WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (path, stat.st_size, stat.st_mtime_ns)).fetchone()
+        if row:
+            return row[0]
+        audio_hash = hash_file(audio_path)
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?)",
+                            (path, stat.st_size, stat.st_mtime_ns, audio_hash))
+        return audio_hash
+
+    def key(self, audio_path, **options):
+        """Cache key for a file and the options that shape its result"""
+        canonical = json.dumps(options, sort_keys=True)
+        digest = hashlib.sha256(f"{self.audio_hash(audio_path)}:{canonical}".encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        row = self.db.execute("SELECT result FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        with self.db:
+            self.db.execute("UPDATE entries SET last_access = ? WHERE key = ?",
+                            (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key, audio_path, options, result):
+        payload = json.dumps(result, ensure_ascii=False)
+        now = time.time()
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, self.audio_hash(audio_path), json.dumps(options, sort_keys=True),
+                 payload, len(payload.encode()), now, now))
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits max_bytes"""
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        removed = 0
+        with self.db:
+            for key, size in self.db.execute(
+                    "SELECT key, size FROM entries ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+                removed += 1
+        logging.info(f"Cache eviction removed {removed} entries")
+
+    def split(self, audio_paths, **options):
+        """Partition files into cache hits [(path, result)] and misses [(path, key)]"""
+        hits, misses = [], []
+        for audio_path in audio_paths:
+            key = self.key(audio_path, **options)
+            result = self.get(key)
+            if result is None:
+                misses.append((audio_path, key))
+            else:
+                hits.append((audio_path, result))
+        metrics.count("cache_hits", len(hits))
+        metrics.count("cache_misses", len(misses))
+        return hits, misses
+
+    def log_stats(self):
+        total = self.hits + self.misses
+        rate = 100 * self.hits / total if total else 0
+        logging.info(f"Cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate)")
+
+    def close(self):
+        self.db.close()
+
+
+def open_cache(args):
+    """Cache configured by add_cache_arguments, or None when disabled"""
+    if args.no_cache:
+        return None
+    return TranscriptionCache(args.cache, int(args.cache_size * 1024 * 1024))
+
+
+def add_cache_arguments(parser):
+    """Add the shared cache options to an argparse parser"""
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH,
+                        help=f"Transcription cache database (default: {DEFAULT_CACHE_PATH})")
+    parser.add_argument("--cache-size", type=float, default=DEFAULT_CACHE_SIZE_MB, metavar="MB",
+                        help=f"Evict least recently used results above this size (default: {DEFAULT_CACHE_SIZE_MB})")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always re-transcribe, ignoring and not updating the cache")
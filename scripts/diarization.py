@@ -0,0 +1,258 @@
+"""Chunked, parallel speaker diarization.
+
+Long recordings are split into overlapping chunks (views of the decoded
+buffer, no temp files) and each chunk is diarized by pyannote in a worker
+process. Every chunk labels its speakers independently, so the local labels
+are reconciled into recording-wide ones by comparing speaker embeddings
+with cosine similarity; overlaps are stitched by keeping, for each chunk,
+only the turns inside its core (the chunk minus half the overlap on each
+side).
+"""
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from audio_io import SAMPLE_RATE, diarization_input
+import metrics
+
+PIPELINE_NAME = "pyannote/speaker-diarization@2.1"
+EMBEDDING_MODEL_NAME = "pyannote/embedding"
+
+CHUNK_SECONDS = 120
+OVERLAP_SECONDS = 10
+SIMILARITY_THRESHOLD = 0.5
+
+# Áudio máximo usado para calcular o embedding de cada falante
+EMBEDDING_SECONDS = 30
+
+# Modelos residentes no processo (workers ou processo principal)
+PIPELINE = None
+EMBEDDING_INFERENCE = None
+
+
+def load_pipeline(hf_token=None):
+    global PIPELINE
+    if PIPELINE is None:
+        from pyannote.audio import Pipeline
+        start = time.perf_counter()
+        PIPELINE = Pipeline.from_pretrained(
+            PIPELINE_NAME, use_auth_token=hf_token or os.getenv("HF_TOKEN"))
+        logging.info(f"Loaded diarization pipeline in {time.perf_counter() - start:.2f}s")
+    return PIPELINE
+
+
+def load_embedding_inference(hf_token=None):
+    global EMBEDDING_INFERENCE
+    if EMBEDDING_INFERENCE is None:
+        from pyannote.audio import Inference, Model
+        model = Model.from_pretrained(
+            EMBEDDING_MODEL_NAME, use_auth_token=hf_token or os.getenv("HF_TOKEN"))
+        EMBEDDING_INFERENCE = Inference(model, window="whole")
+    return EMBEDDING_INFERENCE
+
+
+def _init_worker(hf_token):
+    load_pipeline(hf_token)
+    load_embedding_inference(hf_token)
+
+
+def split_audio(duration, segment_duration=CHUNK_SECONDS, overlap=OVERLAP_SECONDS):
+    """Plan overlapping chunks over a recording of the given duration.
+
+    Each chunk has its span ('start'/'end') and its core ('core_start' /
+    'core_end'): the part of the timeline it is responsible for after
+    stitching. Cores tile the recording without gaps or overlaps.
+    """
+    if not 0 <= overlap < segment_duration:
+        # Sem avanço entre os blocos o laço abaixo não terminaria
+        raise ValueError(f"overlap ({overlap:g}s) must be shorter than the chunk ({segment_duration:g}s)")
+    if duration <= segment_duration:
+        return [{'start': 0.0, 'end': duration, 'core_start': 0.0, 'core_end': duration}]
+
+    step = segment_duration - overlap
+    chunks = []
+    start = 0.0
+    while True:
+        end = min(start + segment_duration, duration)
+        chunks.append({'start': start, 'end': end,
+                       'core_start': start + overlap / 2 if chunks else 0.0,
+                       'core_end': end - overlap / 2})
+        if end >= duration:
+            break
+        start += step
+    chunks[-1]['core_end'] = duration
+    return chunks
+
+
+def speaker_embeddings(samples, turns, sampling_rate=SAMPLE_RATE):
+    """One embedding per local speaker, computed from its longest turns"""
+    inference = load_embedding_inference()
+    embeddings = {}
+    for speaker in sorted({turn['speaker'] for turn in turns}):
+        own = sorted((t for t in turns if t['speaker'] == speaker),
+                     key=lambda t: t['end'] - t['start'], reverse=True)
+        pieces, total = [], 0.0
+        for turn in own:
+            if total >= EMBEDDING_SECONDS:
+                break
+            pieces.append(samples[int(turn['start'] * sampling_rate):int(turn['end'] * sampling_rate)])
+            total += turn['end'] - turn['start']
+        audio = np.concatenate(pieces)
+        if len(audio) < sampling_rate // 2:
+            continue  # curto demais para um embedding confiável
+        embedding = np.asarray(inference(diarization_input(audio, sampling_rate))).reshape(-1)
+        embeddings[speaker] = (embedding, total)
+    return embeddings
+
+
+def process_segment(segment_info, samples, pipeline=None, sampling_rate=SAMPLE_RATE):
+    """Diarize a single chunk of the decoded buffer.
+
+    Returns the chunk's turns on the recording timeline, with chunk-local
+    speaker labels, and one embedding per local speaker.
+    """
+    pipeline = pipeline or load_pipeline()
+    diarization = pipeline(diarization_input(samples, sampling_rate))
+
+    turns = []
+    for turn, _, speaker in diarization.itertracks(yield_label=True):
+        turns.append({'speaker': speaker, 'start': turn.start, 'end': turn.end})
+
+    embeddings = speaker_embeddings(samples, turns, sampling_rate)
+    for turn in turns:
+        # Ajustar tempos para o áudio original
+        turn['start'] += segment_info['start']
+        turn['end'] += segment_info['start']
+    return turns, embeddings
+
+
+def cosine_similarity(a, b):
+    """Cosine similarity matrix between the rows of a and the rows of b"""
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return a @ b.T
+
+
+class SpeakerRegistry:
+    """Recording-wide speakers, represented by duration-weighted centroids"""
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self.labels = []
+        self.centroids = []
+        self.weights = []
+        self.next_index = 0
+
+    def new_label(self):
+        label = f"SPEAKER_{self.next_index:02d}"
+        self.next_index += 1
+        return label
+
+    def add(self, label, embedding, weight):
+        self.labels.append(label)
+        self.centroids.append(np.asarray(embedding, dtype=np.float64))
+        self.weights.append(weight)
+
+    def assign(self, embeddings):
+        """Map local speaker labels to global ones, one-to-one and greedily"""
+        local = list(embeddings)
+        mapping = {}
+        if local and self.centroids:
+            similarity = cosine_similarity(np.stack([embeddings[l][0] for l in local]),
+                                           np.stack(self.centroids))
+            # Pares mais parecidos primeiro, sem repetir falantes
+            for flat in np.argsort(similarity, axis=None)[::-1]:
+                i, j = np.unravel_index(flat, similarity.shape)
+                if similarity[i, j] < self.threshold:
+                    break
+                if local[i] in mapping or self.labels[j] in mapping.values():
+                    continue
+                mapping[local[i]] = self.labels[j]
+                embedding, weight = embeddings[local[i]]
+                total = self.weights[j] + weight
+                self.centroids[j] = (self.centroids[j] * self.weights[j] + embedding * weight) / total
+                self.weights[j] = total
+
+        for label in local:
+            if label not in mapping:
+                mapping[label] = self.new_label()
+                self.add(mapping[label], *embeddings[label])
+        return mapping
+
+
+def overlap_label(turns, previous_turns):
+    """Global label that overlaps the given local turns the most, if any"""
+    overlap = {}
+    for turn in turns:
+        for other in previous_turns:
+            shared = min(turn['end'], other['end']) - max(turn['start'], other['start'])
+            if shared > 0:
+                overlap[other['speaker']] = overlap.get(other['speaker'], 0.0) + shared
+    return max(overlap, key=overlap.get) if overlap else None
+
+
+def stitch(chunks, results, registry):
+    """Relabel every chunk's turns and keep only those inside its core"""
+    speaker_segments = []
+    previous_turns = []
+    for chunk, (turns, embeddings) in zip(chunks, results):
+        mapping = registry.assign(embeddings)
+
+        # Falantes sem embedding (fala curta demais): usa a sobreposição com o bloco anterior
+        for speaker in {turn['speaker'] for turn in turns} - set(mapping):
+            own = [turn for turn in turns if turn['speaker'] == speaker]
+            label = overlap_label(own, previous_turns)
+            mapping[speaker] = label or registry.new_label()
+
+        previous_turns = [{**turn, 'speaker': mapping[turn['speaker']]} for turn in turns]
+        for turn in previous_turns:
+            start = max(turn['start'], chunk['core_start'])
+            end = min(turn['end'], chunk['core_end'])
+            if end > start:
+                speaker_segments.append({'speaker': turn['speaker'], 'start': start, 'end': end})
+
+    speaker_segments.sort(key=lambda s: s['start'])
+    # Junta turnos do mesmo falante cortados na fronteira entre blocos
+    merged = []
+    for segment in speaker_segments:
+        if (merged and merged[-1]['speaker'] == segment['speaker']
+                and segment['start'] - merged[-1]['end'] < 0.01):
+            merged[-1]['end'] = max(merged[-1]['end'], segment['end'])
+        else:
+            merged.append(segment)
+    return merged
+
+
+def diarize(samples, workers=1, chunk_seconds=CHUNK_SECONDS, overlap=OVERLAP_SECONDS,
+            pipeline=None, registry=None, hf_token=None, sampling_rate=SAMPLE_RATE):
+    """Diarize a decoded buffer in overlapping chunks.
+
+    Returns speaker segments ({'speaker', 'start', 'end'}) with labels that
+    are consistent over the whole recording.
+    """
+    duration = len(samples) / sampling_rate
+    chunks = split_audio(duration, chunk_seconds, overlap)
+    logging.info(f"Diarizing {duration:.0f}s of audio in {len(chunks)} chunks "
+                 f"with {min(workers, len(chunks))} workers")
+
+    views = [samples[int(c['start'] * sampling_rate):int(c['end'] * sampling_rate)]
+             for c in chunks]
+    start = time.perf_counter()
+    with metrics.timer("diarize", audio_seconds=duration):
+        if workers <= 1 or len(chunks) == 1:
+            pipeline = pipeline or load_pipeline(hf_token)
+            results = [process_segment(chunk, view, pipeline, sampling_rate)
+                       for chunk, view in zip(chunks, views)]
+        else:
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=context,
+                                     initializer=_init_worker, initargs=(hf_token,)) as executor:
+                results = list(executor.map(process_segment, chunks, views,
+                                            [None] * len(chunks), [sampling_rate] * len(chunks)))
+
+        speaker_segments = stitch(chunks, results, registry or SpeakerRegistry())
+    logging.info(f"Diarization completed with {len(speaker_segments)} segments "
+                 f"in {time.perf_counter() - start:.2f}s")
+    return speaker_segments
@@ -0,0 +1,441 @@
+"""Route each file in audios/ to the local models or to AssemblyAI.
+
+main.py / main_di.py are free but bounded by this machine; main_as.py is
+paid but runs many files at once. The dispatcher estimates how long each
+file takes on each side and picks per file:
+
+- local: duration x the real-time factor measured on past runs (per mode,
+  model and compute type), behind the files already queued for the local
+  workers and the backlog of a running watch.py;
+- remote: a fixed overhead (upload, queue) plus duration x the measured
+  remote factor, at --price-per-hour.
+
+Files go local while they still finish before --deadline (minutes); the
+ones that would not are sent to the API while --budget (USD) lasts and the
+API is faster for them. Longest files are placed first, like batch.py.
+The measured factors are kept in transcriptions/dispatch_stats.json and
+refined after every run.
+
+Both sides end up in the same normalized schema before anything is written
+(outputs, transcript store): start/end in seconds, rounded to the
+millisecond, stripped text, and anonymous speaker labels (AssemblyAI's
+A/B, the silence mode's SPEAKER_1/2) renumbered SPEAKER_00, SPEAKER_01...
+in order of appearance; names from the known-speaker store are kept. The
+cache keeps each backend's own result, shared with the other CLIs.
+
+    python dispatch.py --dry-run --deadline 30 --budget 2
+    python dispatch.py --mode speakers --workers 2 --deadline 60 --budget 5
+    python worker_service.py --port 8765 &
+    python dispatch.py --route remote --api-base-url http://127.0.0.1:8765
+"""
+import argparse
+import functools
+import heapq
+import json
+import logging
+import os
+import re
+import threading
+import time
+from audio_io import probe_duration
+from assemblyai_client import DEFAULT_BASE_URL, entry_from_json, segments_from_json, transcribe_many
+from batch import AUDIO_EXTENSIONS, add_batch_arguments, list_audio_files, log_stats, run_batch, threads_per_worker
+from cache import add_cache_arguments, open_cache
+from local_pipeline import add_mode_argument, cache_options, engine_name, transcribe_local, warm_up
+from long_audio import add_long_audio_arguments
+from metrics import add_metrics_arguments
+from sinks import TRANSCRIPTIONS_FILE, add_output_arguments, create_sinks, write_segments
+from speaker_store import add_speaker_arguments, open_speaker_store
+from speech_map import add_speech_map_arguments
+from transcript_store import TranscriptStore, add_store_arguments
+from watch import DEFAULT_STATUS_PATH, STATUS_INTERVAL, is_running
+from whisper_models import add_model_arguments
+import metrics
+
+DEFAULT_STATS_PATH = os.path.join("transcriptions", "dispatch_stats.json")
+ROUTES = ("auto", "local", "remote")
+# Preço da AssemblyAI por hora de áudio, em USD
+DEFAULT_PRICE_PER_HOUR = 0.37
+# Mesmas opções de main_as.py, para compartilhar o cache
+REMOTE_OPTIONS = {"speaker_labels": True, "content_safety": True, "iab_categories": False}
+REMOTE_ENGINE = "assemblyai"
+
+# Estimativas até haver medidas: segundos de processamento por segundo de áudio
+DEFAULT_LOCAL_RTF = 0.5
+DEFAULT_REMOTE_RTF = 0.15
+# Upload e fila da API, por arquivo
+REMOTE_OVERHEAD_SECONDS = 30.0
+# Peso de cada nova medida na média móvel
+EMA_WEIGHT = 0.3
+# Duração de arquivos sem cabeçalho legível, pelo tamanho (~128 kbps)
+BYTES_PER_SECOND = 16000
+
+# Rótulos sem identidade: letras da AssemblyAI e SPEAKER_1/2 do modo por pausas
+ANONYMOUS_SPEAKER = re.compile(r"[A-Z]|SPEAKER_\d")
+
+
+def normalize_segments(segments, duration=None):
+    """Segments of either backend in the shared schema.
+
+    start/end are seconds rounded to the millisecond (a segment without
+    times, like AssemblyAI's text-only answer, spans the whole recording),
+    text is stripped and empty segments are dropped, and anonymous speaker
+    labels become SPEAKER_00, SPEAKER_01... in order of appearance.
+    """
+    labels = {}
+    normalized = []
+    for segment in segments:
+        text = (segment.get('text') or "").strip()
+        if not text:
+            continue
+        speaker = segment.get('speaker')
+        if speaker is not None:
+            speaker = str(speaker)
+            if ANONYMOUS_SPEAKER.fullmatch(speaker):
+                speaker = labels.setdefault(speaker, f"SPEAKER_{len(labels):02d}")
+        start = segment.get('start')
+        end = segment.get('end')
+        normalized.append({
+            'start': round(start if start is not None else 0.0, 3),
+            'end': round(end if end is not None else (duration or start or 0.0), 3),
+            'speaker': speaker, 'text': text})
+    return normalized
+
+
+class DispatchStats:
+    """Measured real-time factors, kept between runs"""
+
+    def __init__(self, path=DEFAULT_STATS_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = {}
+        self.data.setdefault("local", {})
+        self.data.setdefault("remote", {"rtf": DEFAULT_REMOTE_RTF, "samples": 0})
+
+    def local_rtf(self, key):
+        return self.data["local"].get(key, {}).get("rtf", DEFAULT_LOCAL_RTF)
+
+    def remote_rtf(self):
+        return self.data["remote"]["rtf"]
+
+    def _update(self, entry, sample):
+        # A primeira medida substitui o palpite inicial
+        entry["rtf"] = sample if not entry.get("samples") else \
+            (1 - EMA_WEIGHT) * entry["rtf"] + EMA_WEIGHT * sample
+        entry["samples"] = entry.get("samples", 0) + 1
+
+    def record_local(self, key, audio_seconds, seconds):
+        if audio_seconds:
+            with self.lock:
+                self._update(self.data["local"].setdefault(key, {}), seconds / audio_seconds)
+
+    def record_remote(self, audio_seconds, seconds):
+        if audio_seconds:
+            with self.lock:
+                self._update(self.data["remote"],
+                             max(seconds - REMOTE_OVERHEAD_SECONDS, 0.0) / audio_seconds)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with self.lock, open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=1)
+        os.replace(temp_path, self.path)
+
+
+def stats_key(args):
+    return f"{args.mode}/{args.model_size}/{args.compute_type or 'auto'}"
+
+
+def watch_backlog(status_path, local_rtf):
+    """Seconds of local work still queued in a running watch.py (0 when none)"""
+    try:
+        with open(status_path, encoding="utf-8") as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        return 0.0
+    if not is_running(status["pid"]) or time.time() - status["updated"] > 10 * STATUS_INTERVAL + 5:
+        return 0.0
+    backlog = status["queued_audio_seconds"] * local_rtf
+    processing = status["processing"]
+    if processing and processing["audio_seconds"]:
+        backlog += max(processing["audio_seconds"] * local_rtf - processing["seconds"], 0.0)
+    return backlog
+
+
+def file_duration(audio_path):
+    duration = probe_duration(audio_path)
+    return duration if duration is not None else os.path.getsize(audio_path) / BYTES_PER_SECOND
+
+
+def plan_routes(jobs, local_rtf, remote_rtf, workers=1, remote_slots=0, deadline=None,
+                budget=0.0, price_per_hour=DEFAULT_PRICE_PER_HOUR, route="auto", backlog=0.0):
+    """Pick local or remote for each job ({"path", "duration"}), longest first.
+
+    Sets route, eta (seconds from now), cost (USD) and reason on each job
+    and returns them in the planned order. remote_slots=0 means no API.
+    """
+    # Fim previsto de cada worker local e de cada envio simultâneo à API
+    local_lanes = [backlog / workers] * workers
+    remote_lanes = [0.0] * remote_slots
+    spent = 0.0
+    planned = sorted(jobs, key=lambda job: job["duration"], reverse=True)
+    for job in planned:
+        local_eta = local_lanes[0] + job["duration"] * local_rtf
+        remote_eta = (remote_lanes[0] + REMOTE_OVERHEAD_SECONDS + job["duration"] * remote_rtf
+                      if remote_lanes else None)
+        cost = job["duration"] / 3600 * price_per_hour
+        if remote_eta is None or route == "local":
+            choice, reason = "local", "forced" if route == "local" else "no API key"
+        elif route == "remote":
+            choice, reason = "remote", "forced"
+        elif deadline is not None and local_eta <= deadline:
+            choice, reason = "local", "meets the deadline"
+        elif remote_eta >= local_eta:
+            choice, reason = "local", "faster than the API"
+        elif spent + cost > budget:
+            choice, reason = "local", "over budget"
+        else:
+            choice, reason = "remote", "misses the deadline locally" if deadline is not None else "faster"
+        if choice == "local":
+            job.update(route="local", eta=local_eta, cost=0.0, reason=reason)
+            heapq.heapreplace(local_lanes, local_eta)
+        else:
+            spent += cost
+            job.update(route="remote", eta=remote_eta, cost=cost, reason=reason)
+            heapq.heapreplace(remote_lanes, remote_eta)
+    return planned
+
+
+def print_plan(planned, deadline=None):
+    for job in planned:
+        late = " (late)" if deadline is not None and job["eta"] > deadline else ""
+        print(f"{job['route']:<7} {os.path.basename(job['path']):<40} {job['duration'] / 60:7.1f} min  "
+              f"ETA {job['eta'] / 60:6.1f} min{late}  ${job['cost']:.2f}  {job['reason']}")
+    remote = [job for job in planned if job["route"] == "remote"]
+    finish = max((job["eta"] for job in planned), default=0.0)
+    print(f"{len(planned) - len(remote)} local, {len(remote)} remote; "
+          f"all done in ~{finish / 60:.1f} min for ${sum(job['cost'] for job in remote):.2f}")
+
+
+def transcribe_timed(audio_path, args, cpu_threads=0):
+    """Local segments plus the processing time (runs in the batch workers)"""
+    start = time.perf_counter()
+    speaker_store = open_speaker_store(args) if args.mode == "diarize" else None
+    segments = transcribe_local(audio_path, args, cpu_threads, speaker_store)
+    return {"segments": segments, "seconds": time.perf_counter() - start}
+
+
+class ResultWriter:
+    """Writes normalized segments to the outputs and the store, from any thread"""
+
+    def __init__(self, args):
+        self.formats = args.formats
+        self.store_path = args.store
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def store(self):
+        # Conexões SQLite pertencem à thread que as abriu
+        if not hasattr(self.local, "store"):
+            self.local.store = TranscriptStore(self.store_path)
+        return self.local.store
+
+    def write(self, audio_path, segments, engine, model, options, audio_hash, duration):
+        segments = normalize_segments(segments, duration)
+        store = self.store()
+        if audio_hash is None or not store.has(audio_hash, engine, model):
+            store.save(audio_path, segments, engine, model, options, audio_hash, duration=duration)
+        with self.lock:
+            sinks = create_sinks(self.formats, "transcriptions", audio_path, TRANSCRIPTIONS_FILE)
+            for _ in write_segments(iter(segments), sinks, audio_path):
+                pass
+        logging.info(f"Transcription saved for {os.path.basename(audio_path)} ({engine})")
+
+    def close(self):
+        if hasattr(self.local, "store"):
+            self.local.store.close()
+
+
+def run_remote(jobs, args, api_key, writer, stats):
+    """Send jobs to the API; runs in its own thread next to the local batch"""
+    cache = open_cache(args)
+    options = {"service": REMOTE_ENGINE, "language": "pt", "format": "entry+segments", **REMOTE_OPTIONS}
+    start = time.perf_counter()
+    durations = {job["path"]: job["duration"] for job in jobs}
+    # Só os primeiros envios saem juntos no início; os outros esperam vaga
+    measured = {job["path"] for job in jobs[:args.remote_concurrency]}
+
+    def on_transcript(audio_path, transcript, error):
+        if error is not None:
+            return
+        if audio_path in measured:
+            stats.record_remote(durations[audio_path], time.perf_counter() - start)
+        result = {"entry": entry_from_json(audio_path, transcript, **REMOTE_OPTIONS),
+                  "segments": segments_from_json(transcript)}
+        audio_hash = cache.audio_hash(audio_path) if cache is not None else None
+        if cache is not None:
+            cache.put(cache.key(audio_path, **options), audio_path, options, result)
+        writer.write(audio_path, result["segments"], REMOTE_ENGINE, None, options, audio_hash,
+                     durations[audio_path])
+
+    try:
+        results = transcribe_many(api_key, [job["path"] for job in jobs], {"language_code": "pt", **REMOTE_OPTIONS},
+                                  max_in_flight=args.remote_concurrency, base_url=args.api_base_url,
+                                  on_result=on_transcript)
+        failed = sum(1 for _, _, error in results if error is not None)
+        logging.info(f"API: {len(results) - failed} files transcribed, {failed} failed")
+    finally:
+        if cache is not None:
+            cache.close()
+        writer.close()
+
+
+def dispatch(args):
+    os.makedirs("audios", exist_ok=True)
+    os.makedirs("transcriptions", exist_ok=True)
+    stage_metrics = metrics.configure(args)
+    audio_paths = [os.path.join("audios", file) for file in list_audio_files("audios", AUDIO_EXTENSIONS)]
+    api_key = os.environ.get("ASSEMBLYAI_API_KEY")
+    if not api_key and args.route == "remote":
+        raise SystemExit("ASSEMBLYAI_API_KEY is not set; cannot use --route remote")
+
+    cache = open_cache(args)
+    writer = ResultWriter(args)
+    local_options = cache_options(args)
+    remote_options = {"service": REMOTE_ENGINE, "language": "pt", "format": "entry+segments", **REMOTE_OPTIONS}
+    jobs = []
+    for audio_path in audio_paths:
+        duration = file_duration(audio_path)
+        # Já transcrito por qualquer um dos lados: nada a rotear
+        if cache is not None:
+            audio_hash = cache.audio_hash(audio_path)
+            segments = cache.get(cache.key(audio_path, **local_options))
+            if segments is not None:
+                if not args.dry_run:
+                    writer.write(audio_path, segments, engine_name(args.mode), args.model_size,
+                                 local_options, audio_hash, duration)
+                continue
+            result = cache.get(cache.key(audio_path, **remote_options))
+            if result is not None:
+                if not args.dry_run:
+                    writer.write(audio_path, result["segments"], REMOTE_ENGINE, None,
+                                 remote_options, audio_hash, duration)
+                continue
+        jobs.append({"path": audio_path, "duration": duration})
+    logging.info(f"{len(audio_paths) - len(jobs)} of {len(audio_paths)} files served from cache")
+
+    stats = DispatchStats(args.stats)
+    key = stats_key(args)
+    backlog = watch_backlog(args.watch_status, stats.local_rtf(key))
+    if backlog:
+        logging.info(f"watch.py is busy for ~{backlog / 60:.1f} more minutes")
+    planned = plan_routes(jobs, stats.local_rtf(key), stats.remote_rtf(), workers=max(1, args.workers),
+                          remote_slots=args.remote_concurrency if api_key else 0,
+                          deadline=args.deadline * 60 if args.deadline is not None else None,
+                          budget=args.budget, price_per_hour=args.price_per_hour,
+                          route=args.route, backlog=backlog)
+    if args.dry_run:
+        print_plan(planned, args.deadline * 60 if args.deadline is not None else None)
+        return
+
+    local_jobs = [job for job in planned if job["route"] == "local"]
+    remote_jobs = [job for job in planned if job["route"] == "remote"]
+    logging.info(f"Routing {len(local_jobs)} files to the local models and {len(remote_jobs)} to the API "
+                 f"(~${sum(job['cost'] for job in remote_jobs):.2f})")
+    remote = None
+    if remote_jobs:
+        remote = threading.Thread(target=run_remote, args=(remote_jobs, args, api_key, writer, stats),
+                                  name="remote", daemon=True)
+        remote.start()
+
+    durations = {job["path"]: job["duration"] for job in local_jobs}
+
+    def on_result(audio_path, result, error):
+        if error is not None:
+            return
+        stats.record_local(key, durations[audio_path], result["seconds"])
+        audio_hash = cache.audio_hash(audio_path) if cache is not None else None
+        if cache is not None:
+            cache.put(cache.key(audio_path, **local_options), audio_path, local_options, result["segments"])
+        writer.write(audio_path, result["segments"], engine_name(args.mode), args.model_size,
+                     local_options, audio_hash, durations[audio_path])
+
+    # Cada worker carrega os modelos uma vez e os mantém residentes
+    cpu_threads = threads_per_worker(args.workers) if args.workers > 1 else 0
+    try:
+        batch_stats = run_batch(
+            [job["path"] for job in local_jobs],
+            functools.partial(transcribe_timed, args=args, cpu_threads=cpu_threads),
+            workers=args.workers,
+            initializer=warm_up,
+            initargs=(args.model_size, args.compute_type, cpu_threads, args.mode),
+            memory_limit_mb=args.max_worker_memory,
+            on_result=on_result)
+        log_stats(batch_stats)
+        if remote is not None:
+            remote.join()
+    finally:
+        stats.save()
+        writer.close()
+        if cache is not None:
+            cache.close()
+    if cache is not None:
+        cache.log_stats()
+    if stage_metrics is not None:
+        stage_metrics.log_summary()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Transcribe audios/ with the local models or AssemblyAI, per file, "
+                    "within a deadline and a budget")
+    add_model_arguments(parser)
+    add_output_arguments(parser)
+    add_batch_arguments(parser)
+    add_cache_arguments(parser)
+    add_metrics_arguments(parser)
+    add_store_arguments(parser)
+    add_long_audio_arguments(parser)
+    add_speaker_arguments(parser)
+    add_speech_map_arguments(parser)
+    add_mode_argument(parser)
+    parser.add_argument("--route", choices=ROUTES, default="auto",
+                        help="auto picks per file; local or remote send everything there (default: auto)")
+    parser.add_argument("--deadline", type=float, default=None, metavar="MINUTES",
+                        help="Files that would finish locally after this are sent to the API")
+    parser.add_argument("--budget", type=float, default=0.0, metavar="USD",
+                        help="Most to spend on the API in this run (default: 0, local only)")
+    parser.add_argument("--price-per-hour", type=float, default=DEFAULT_PRICE_PER_HOUR, metavar="USD",
+                        help=f"API price per hour of audio (default: {DEFAULT_PRICE_PER_HOUR})")
+    parser.add_argument("--remote-concurrency", type=int, default=8,
+                        help="Files in flight at the API at once (default: 8)")
+    parser.add_argument("--api-base-url", default=DEFAULT_BASE_URL,
+                        help="AssemblyAI base URL (worker_service.py is a local stand-in)")
+    parser.add_argument("--stats", default=DEFAULT_STATS_PATH,
+                        help=f"Measured real-time factors (default: {DEFAULT_STATS_PATH})")
+    parser.add_argument("--watch-status", default=DEFAULT_STATUS_PATH,
+                        help="Status file of a running watch.py, whose queue delays local work")
+    parser.add_argument("--dry-run", action="store_true", help="Print the routing plan and stop")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('transcription.log'),
+            logging.StreamHandler()
+        ]
+    )
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    dispatch(parse_args())
@@ -0,0 +1,434 @@
+"""Audio fingerprints to find recordings that were already transcribed.
+
+The same meeting is often uploaded more than once: re-exported, in another
+container (.opus vs .m4a) or trimmed. The content hash used by the cache
+only catches byte-identical copies, so every recording also gets a
+fingerprint: the local maxima of its log spectrogram (at 8 kHz) are paired
+with the next few peaks, and each pair (frequency, frequency, time delta)
+becomes a 24-bit hash anchored at the frame of the first peak. Peaks and
+hashes are computed with vectorized NumPy over blocks of frames, so the
+memory stays bounded for long recordings.
+
+Hashes go to an inverted index in SQLite (hash -> recording, frame).
+Looking a new recording up is one indexed join over its hashes. Matching
+hashes that agree on the same time offset mean shared audio, whatever was
+trimmed from either end. The matched frames give the parts of the new
+recording that the indexed one covers. With --dedup, main.py and main_di.py
+reuse the stored transcript of the best match (same engine and model) for
+those parts and transcribe only the rest. A full copy is not transcribed
+at all.
+
+    python fingerprint.py index audios/reuniao.mp3
+    python fingerprint.py match audios/reuniao_cortada.m4a
+    python fingerprint.py list
+"""
+import argparse
+import heapq
+import logging
+import os
+import sqlite3
+import time
+import numpy as np
+from audio_io import SAMPLE_RATE, duration_seconds
+from cache import hash_file
+from transcript_store import TranscriptStore
+import metrics
+
+DEFAULT_INDEX_PATH = os.path.join("transcriptions", "fingerprints.sqlite3")
+
+FINGERPRINT_RATE = 8000
+FFT_SIZE = 1024
+HOP = 256
+FRAME_SECONDS = HOP / FINGERPRINT_RATE
+# Vizinhança (bins, quadros) em que um pico precisa ser o máximo
+PEAK_BINS = 15
+PEAK_FRAMES = 15
+# Picos mais fortes mantidos por segundo de áudio
+PEAKS_PER_SECOND = 30
+# Piso absoluto (~ -60 dBFS): silêncio não gera picos
+PEAK_FLOOR = np.log(1e-3 * FFT_SIZE / 4)
+# ...e ~20 dB acima da mediana do bloco: o ruído de fundo também não
+PEAK_ABOVE_MEDIAN = np.log(10)
+# Cada pico vira hash com os próximos FAN_OUT picos até MAX_DT quadros depois
+FAN_OUT = 6
+MAX_DT = 63
+# Maior bin de frequência representável nos 9 bits de cada pico do hash
+HASH_BIN_MAX = (1 << 9) - 1
+# Só 1 em cada HASH_SAMPLING pares de frequências entra no índice e nas
+# consultas: a mesma escolha dos dois lados, 8x menos linhas para juntar
+HASH_SAMPLING = 8
+# Quadros por bloco do espectrograma (~65 s)
+BLOCK_FRAMES = 2048
+
+# Hashes no mesmo deslocamento necessários para um trecho em comum
+MIN_MATCHES = 10
+# Trechos sem nenhum hash coincidente por mais que isso separam as coberturas...
+MAX_GAP_SECONDS = 3.0
+# ...se tiverem pelo menos tantos hashes próprios (senão é silêncio)
+GAP_HASHES = 10
+# Margem em volta de cada trecho coberto
+COVER_PAD = 0.5
+# Trechos não cobertos mais curtos que isso não valem uma chamada ao modelo
+MIN_REGION_SECONDS = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    id INTEGER PRIMARY KEY,
+    file TEXT NOT NULL,
+    path TEXT NOT NULL,
+    audio_hash TEXT NOT NULL UNIQUE,
+    duration REAL NOT NULL,
+    hashes INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hashes (
+    hash INTEGER NOT NULL,
+    recording_id INTEGER NOT NULL,
+    frame INTEGER NOT NULL,
+    PRIMARY KEY (hash, recording_id, frame)
+) WITHOUT ROWID;
+"""
+
+
+def _log_spectrogram(audio, first, last, window):
+    """Log magnitude of frames [first, last) of an 8 kHz buffer"""
+    frames = np.lib.stride_tricks.sliding_window_view(
+        audio[first * HOP:(last - 1) * HOP + FFT_SIZE], FFT_SIZE)[::HOP]
+    return np.log(np.abs(np.fft.rfft(frames * window, axis=1)) + 1e-9).astype(np.float32)
+
+
+def _max_filter(spectrogram):
+    """Maximum over a PEAK_FRAMES x PEAK_BINS neighbourhood, one axis at a time"""
+    result = spectrogram
+    for axis, size in ((1, PEAK_BINS), (0, PEAK_FRAMES)):
+        pad = [(0, 0), (0, 0)]
+        pad[axis] = (size // 2, size // 2)
+        padded = np.pad(result, pad, constant_values=-np.inf)
+        result = np.lib.stride_tricks.sliding_window_view(padded, size, axis=axis).max(axis=-1)
+    return result
+
+
+def spectrogram_peaks(samples, sampling_rate=SAMPLE_RATE):
+    """(frames, bins) of the spectral peaks of a buffer, sorted by frame"""
+    step = max(1, sampling_rate // FINGERPRINT_RATE)
+    # Média de amostras vizinhas: filtro passa-baixa grosseiro antes de decimar
+    audio = samples[:len(samples) - len(samples) % step].reshape(-1, step).mean(axis=1)
+    total = 1 + (len(audio) - FFT_SIZE) // HOP if len(audio) >= FFT_SIZE else 0
+    window = np.hanning(FFT_SIZE).astype(np.float32)
+    margin = PEAK_FRAMES // 2
+    frames, bins = [], []
+    for start in range(0, total, BLOCK_FRAMES):
+        end = min(start + BLOCK_FRAMES, total)
+        # Quadros extras dos dois lados: o máximo local não depende do corte do bloco
+        first, last = max(0, start - margin), min(total, end + margin)
+        spectrogram = _log_spectrogram(audio, first, last, window)
+        spectrogram[:, :4] = -np.inf  # DC e graves abaixo de ~30 Hz
+        floor = max(PEAK_FLOOR, np.median(spectrogram[:, 4:]) + PEAK_ABOVE_MEDIAN)
+        peaks = (spectrogram == _max_filter(spectrogram)) & (spectrogram > floor)
+        peaks[:start - first] = False
+        peaks[end - first:] = False
+        frame, bin_ = np.nonzero(peaks)
+        keep = int(PEAKS_PER_SECOND * (end - start) * FRAME_SECONDS) + 1
+        if len(frame) > keep:
+            strongest = np.argpartition(spectrogram[frame, bin_], -keep)[-keep:]
+            strongest.sort()
+            frame, bin_ = frame[strongest], bin_[strongest]
+        frames.append(frame + first)
+        bins.append(bin_)
+    if not frames:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(frames).astype(np.int64), np.concatenate(bins).astype(np.int64)
+
+
+def peak_hashes(frames, bins):
+    """(hashes, anchor frames): each peak paired with the next FAN_OUT later peaks"""
+    # 9 bits por frequência: o bin de Nyquist (512) junta-se ao 511 em vez de
+    # invadir o bit da âncora
+    bins = np.minimum(bins, HASH_BIN_MAX)
+    # Picos do mesmo quadro (harmônicos) não formam par: começa no quadro seguinte
+    first = np.searchsorted(frames, frames, side="right")
+    hashes, anchors = [], []
+    for k in range(FAN_OUT):
+        target = first + k
+        pair = target < len(frames)
+        anchor, target = np.nonzero(pair)[0], target[pair]
+        dt = frames[target] - frames[anchor]
+        pair = dt <= MAX_DT
+        anchor, target, dt = anchor[pair], target[pair], dt[pair]
+        hashes.append((bins[anchor] << 15) | (bins[target] << 6) | dt)
+        anchors.append(frames[anchor])
+    return np.concatenate(hashes), np.concatenate(anchors)
+
+
+def query_variants(hashes, anchors):
+    """Hashes with the time delta also one frame shorter and longer.
+
+    A copy cut at a fraction of a frame rounds some peaks to the next
+    frame, which changes the delta of their pairs by one.
+    """
+    dt = hashes & 63
+    variants, frames = [hashes], [anchors]
+    for shift in (-1, 1):
+        valid = (dt + shift > 0) & (dt + shift <= MAX_DT)
+        variants.append((hashes[valid] & ~63) | (dt[valid] + shift))
+        frames.append(anchors[valid])
+    return np.concatenate(variants), np.concatenate(frames)
+
+
+def fingerprint(samples, sampling_rate=SAMPLE_RATE):
+    """(hashes, anchor frames) of a decoded buffer"""
+    with metrics.timer("fingerprint", audio_seconds=duration_seconds(samples, sampling_rate)):
+        hashes, anchors = peak_hashes(*spectrogram_peaks(samples, sampling_rate))
+        keep = sampled(hashes)
+        return hashes[keep], anchors[keep]
+
+
+def sampled(hashes):
+    """Hashes kept by HASH_SAMPLING; depends only on the two frequencies"""
+    # Hash multiplicativo do par (bins acima dos 6 bits do delta de tempo)
+    return ((hashes >> 6) * 2654435761) % (1 << 32) < (1 << 32) // HASH_SAMPLING
+
+
+def covered_intervals(query_frames, matched, duration):
+    """Seconds of the query covered by the anchor frames of the matched hashes.
+
+    A run of frames without matches only splits the coverage when it holds
+    query hashes of its own (different content), not when it is silence.
+    Stretches with fewer than MIN_MATCHES hashes are chance agreements.
+    """
+    frames, counts = np.unique(matched, return_counts=True)
+    anchors = np.sort(query_frames)
+    max_gap = int(MAX_GAP_SECONDS / FRAME_SECONDS)
+    runs = []
+    start = 0
+    for i in range(1, len(frames) + 1):
+        if i < len(frames) and frames[i] - frames[i - 1] <= max_gap:
+            continue
+        if i < len(frames):
+            own = np.searchsorted(anchors, frames[i]) - np.searchsorted(anchors, frames[i - 1], side="right")
+            if own < GAP_HASHES:
+                continue
+        runs.append((frames[start], frames[i - 1], counts[start:i].sum()))
+        start = i
+    return [(max(0.0, round(first * FRAME_SECONDS - COVER_PAD, 3)),
+             min(duration, round((last + MAX_DT) * FRAME_SECONDS + COVER_PAD, 3)))
+            for first, last, count in runs if count >= MIN_MATCHES]
+
+
+class FingerprintIndex:
+    """Inverted index of spectrogram peak hashes on disk"""
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def add(self, audio_path, audio_hash, duration, hashes, anchors):
+        """Index a recording once; returns its id"""
+        row = self.db.execute("SELECT id FROM recordings WHERE audio_hash = ?", (audio_hash,)).fetchone()
+        if row is not None:
+            return row["id"]
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT OR IGNORE INTO recordings (file, path, audio_hash, duration, hashes, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (os.path.basename(audio_path), os.path.abspath(audio_path), audio_hash,
+                 duration, len(hashes), time.time()))
+            if not cursor.rowcount:
+                # Outro processo indexou o mesmo conteúdo depois do SELECT acima
+                return self.db.execute("SELECT id FROM recordings WHERE audio_hash = ?",
+                                       (audio_hash,)).fetchone()["id"]
+            recording_id = cursor.lastrowid
+            self.db.executemany(
+                "INSERT OR IGNORE INTO hashes VALUES (?, ?, ?)",
+                zip(hashes.tolist(), [recording_id] * len(hashes), anchors.tolist()))
+        return recording_id
+
+    def recordings(self):
+        return [dict(row) for row in self.db.execute("SELECT * FROM recordings ORDER BY created")]
+
+    def match(self, hashes, anchors, duration, limit=5):
+        """Indexed recordings sharing audio with these hashes, best first.
+
+        Each match is a dict with the recording row, the offset (seconds to
+        add to a time of the query to get the same moment in the
+        recording), the number of agreeing hashes and the covered intervals
+        of the query.
+        """
+        if not len(hashes):
+            return []
+        variants, frames = query_variants(hashes, anchors)
+        with self.db:
+            self.db.execute("CREATE TEMP TABLE IF NOT EXISTS query (hash INTEGER, frame INTEGER)")
+            self.db.execute("DELETE FROM query")
+            self.db.executemany("INSERT INTO query VALUES (?, ?)", zip(variants.tolist(), frames.tolist()))
+        rows = self.db.execute(
+            "SELECT h.recording_id, h.frame, q.frame FROM query q JOIN hashes h ON h.hash = q.hash").fetchall()
+        if not rows:
+            return []
+        found = np.array(rows, dtype=np.int64)
+        matches = []
+        for recording_id in np.unique(found[:, 0]):
+            mine = found[:, 0] == recording_id
+            offsets = found[mine, 1] - found[mine, 2]
+            # Vizinhos de um quadro também contam: o corte raramente cai num múltiplo do salto
+            values, counts = np.unique(offsets, return_counts=True)
+            votes = counts.copy()
+            votes[1:] += counts[:-1] * (values[1:] - values[:-1] == 1)
+            votes[:-1] += counts[1:] * (values[1:] - values[:-1] == 1)
+            best = values[np.argmax(votes)]
+            aligned = np.abs(offsets - best) <= 1
+            covered = covered_intervals(anchors, found[mine, 2][aligned], duration)
+            if not covered:
+                continue
+            recording = dict(self.db.execute("SELECT * FROM recordings WHERE id = ?",
+                                             (int(recording_id),)).fetchone())
+            matches.append({"recording": recording, "offset": round(best * FRAME_SECONDS, 3),
+                            "matches": int(aligned.sum()), "covered": covered})
+        return heapq.nlargest(limit, matches, key=lambda match: match["matches"])
+
+    def close(self):
+        self.db.close()
+
+
+def uncovered(covered, duration):
+    """Complement of sorted intervals within [0, duration]"""
+    regions, position = [], 0.0
+    for start, end in sorted(covered):
+        if start > position:
+            regions.append((position, start))
+        position = max(position, end)
+    if position < duration:
+        regions.append((position, duration))
+    return regions
+
+
+def stored_transcript(store, audio_hash, engine, model):
+    """Segments of the newest transcript of this content by this engine and model"""
+    for record in store.find(audio_hash=audio_hash):
+        if record["engine"] == engine and record["model"] == model:
+            return store.get(record["id"])["segments"]
+    return None
+
+
+def reuse_transcript(audio_path, samples, dedup, sampling_rate=SAMPLE_RATE):
+    """(reused segments, regions still to transcribe) for a decoded file.
+
+    dedup holds the index and store paths and the engine and model whose
+    transcripts may be reused. The file is indexed on the way. Returns
+    (None, None) when no transcribed recording shares its audio.
+    """
+    started = time.perf_counter()
+    name = os.path.basename(audio_path)
+    duration = duration_seconds(samples, sampling_rate)
+    audio_hash = hash_file(audio_path)
+    store = TranscriptStore(dedup["store"])
+    index = FingerprintIndex(dedup["index"])
+    try:
+        segments = stored_transcript(store, audio_hash, dedup["engine"], dedup["model"])
+        if segments is not None:
+            logging.info(f"{name} was already transcribed, reusing it")
+            return segments, []
+
+        hashes, anchors = fingerprint(samples, sampling_rate)
+        matches = index.match(hashes, anchors, duration)
+        index.add(audio_path, audio_hash, duration, hashes, anchors)
+        for match in matches:
+            segments = stored_transcript(store, match["recording"]["audio_hash"],
+                                         dedup["engine"], dedup["model"])
+            if segments is None:
+                continue
+            regions = [(start, end) for start, end in uncovered(match["covered"], duration)
+                       if end - start >= MIN_REGION_SECONDS]
+            if any(s.get('start') is None for s in segments):
+                # Transcrição sem tempos: só serve inteira
+                if regions:
+                    continue
+                reused = segments
+            else:
+                reused = []
+                for segment in segments:
+                    moved = {**segment, 'start': round(segment['start'] - match["offset"], 3),
+                             'end': round(segment['end'] - match["offset"], 3)}
+                    middle = (moved['start'] + moved['end']) / 2
+                    if any(first <= middle <= last for first, last in match["covered"]):
+                        reused.append(moved)
+                # O que os segmentos reaproveitados já cobrem não é transcrito de novo
+                regions = [(start, end) for start, end in uncovered(
+                    match["covered"] + [(s['start'], s['end']) for s in reused], duration)
+                    if end - start >= MIN_REGION_SECONDS]
+            metrics.count("dedup_reused_seconds", round(duration - sum(e - s for s, e in regions), 3))
+            logging.info(
+                f"{name} shares audio with {match['recording']['file']} (offset {match['offset']:+.1f}s, "
+                f"{match['matches']} matching hashes): reusing {len(reused)} segments, "
+                f"{sum(e - s for s, e in regions):.1f}s left to transcribe "
+                f"({time.perf_counter() - started:.2f}s)")
+            return reused, regions
+        return None, None
+    finally:
+        index.close()
+        store.close()
+
+
+def add_fingerprint_arguments(parser):
+    """Add the duplicate detection options to an argparse parser"""
+    parser.add_argument("--dedup", action="store_true",
+                        help="Reuse the transcript of recordings that share audio with a file "
+                             "(copies, re-exports, trimmed versions) and transcribe only the rest")
+    parser.add_argument("--fingerprints", default=DEFAULT_INDEX_PATH,
+                        help=f"Audio fingerprint index used by --dedup (default: {DEFAULT_INDEX_PATH})")
+
+
+def dedup_options(args, engine, model):
+    """Options passed to reuse_transcript, or None when --dedup is off"""
+    if not args.dedup:
+        return None
+    return {"index": args.fingerprints, "store": args.store, "engine": engine, "model": model}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the audio fingerprint index")
+    parser.add_argument("--fingerprints", default=DEFAULT_INDEX_PATH,
+                        help=f"Fingerprint index (default: {DEFAULT_INDEX_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    index_parser = commands.add_parser("index", help="Fingerprint files into the index")
+    index_parser.add_argument("files", nargs="+")
+    match_parser = commands.add_parser("match", help="List the indexed recordings that share audio with a file")
+    match_parser.add_argument("file")
+    commands.add_parser("list", help="List the indexed recordings")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    from audio_io import load_audio
+    index = FingerprintIndex(args.fingerprints)
+    try:
+        if args.command == "index":
+            for path in args.files:
+                samples = load_audio(path)
+                hashes, anchors = fingerprint(samples)
+                index.add(path, hash_file(path), duration_seconds(samples), hashes, anchors)
+                print(f"{os.path.basename(path)}: {len(hashes)} hashes")
+        elif args.command == "match":
+            samples = load_audio(args.file)
+            hashes, anchors = fingerprint(samples)
+            start = time.perf_counter()
+            matches = index.match(hashes, anchors, duration_seconds(samples))
+            elapsed = time.perf_counter() - start
+            for match in matches:
+                covered = ", ".join(f"{s:.1f}-{e:.1f}s" for s, e in match["covered"])
+                print(f"{match['recording']['file']:<40} offset {match['offset']:+9.2f}s  "
+                      f"{match['matches']:6d} hashes  covers {covered}")
+            print(f"{len(matches)} matches for {len(hashes)} hashes in {elapsed * 1000:.0f} ms")
+        elif args.command == "list":
+            for recording in index.recordings():
+                print(f"{recording['id']:5d} {recording['file']:<40} {recording['duration']:8.1f}s "
+                      f"{recording['hashes']:8d} hashes")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Checkpoint journal for resumable batch runs.
+
+Every completed segment is appended (and fsynced) to a per-file partial
+output and then recorded in an append-only JSONL journal together with the
+audio offset it reached. A restarted run skips the files the journal marks
+as done and continues partially transcribed files from their last
+completed segment instead of starting them over.
+
+Files are identified by path, size and mtime, so a file that is replaced by
+a new recording under the same name is processed again, and by a
+fingerprint of the options that shape the transcript (model, diarization,
+...), so a run with other options neither skips files done with the old
+ones nor splices its segments onto theirs.
+"""
+import hashlib
+import json
+import logging
+import os
+
+DEFAULT_JOURNAL_PATH = os.path.join("transcriptions", "journal.jsonl")
+
+
+def options_key(options):
+    """Short fingerprint of the options that shape a transcript"""
+    return hashlib.sha256(json.dumps(options, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def file_identity(audio_path, key=""):
+    stat = os.stat(audio_path)
+    identity = f"{os.path.abspath(audio_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return f"{identity}:{key}" if key else identity
+
+
+def _append_synced(path, text):
+    """Append text with a single write and fsync it before returning"""
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, text.encode("utf-8"))
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Journal:
+    def __init__(self, path=DEFAULT_JOURNAL_PATH, options=None):
+        self.path = path
+        # Registros de outras opções continuam no journal, mas não valem para esta execução
+        self.key = options_key(options) if options is not None else ""
+        self.partial_dir = os.path.join(os.path.dirname(path) or ".", "partial")
+        os.makedirs(self.partial_dir, exist_ok=True)
+        self.done = set()
+        self.progress = {}  # identidade -> último registro de segmento
+        self.load()
+
+    def load(self):
+        self.done.clear()
+        self.progress.clear()
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # última linha cortada por uma queda
+                identity = record["id"]
+                if record["event"] == "done":
+                    self.done.add(identity)
+                    self.progress.pop(identity, None)
+                elif record["event"] == "segment":
+                    self.progress[identity] = record
+
+    def compact(self):
+        """Rewrite the journal with only the records still needed"""
+        lines = [json.dumps({"event": "done", "id": identity}) for identity in sorted(self.done)]
+        lines += [json.dumps(record, ensure_ascii=False) for record in self.progress.values()]
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def partial_path(self, audio_path):
+        return os.path.join(self.partial_dir, os.path.basename(audio_path) + ".partial.txt")
+
+    def is_done(self, audio_path):
+        return file_identity(audio_path, self.key) in self.done
+
+    def resume_point(self, audio_path):
+        """(offset in seconds, completed output lines) to continue a file from"""
+        record = self.progress.get(file_identity(audio_path, self.key))
+        if record is None or not os.path.exists(self.partial_path(audio_path)):
+            return 0.0, []
+        with open(self.partial_path(audio_path), encoding="utf-8") as f:
+            lines = f.read().splitlines()[:record["lines"]]
+        logging.info(f"Resuming {os.path.basename(audio_path)} at {record['offset']:.1f}s "
+                     f"({len(lines)} segments already transcribed)")
+        return record["offset"], lines
+
+    def start_file(self, audio_path, lines):
+        """Reset the partial output to the lines that are known to be complete"""
+        with open(self.partial_path(audio_path), "w", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def record_segment(self, audio_path, offset, lines, line=None):
+        """Persist one completed segment; lines counts the output lines so far"""
+        if line is not None:
+            _append_synced(self.partial_path(audio_path), line + "\n")
+        record = {"event": "segment", "id": file_identity(audio_path, self.key),
+                  "file": os.path.basename(audio_path), "offset": offset, "lines": lines}
+        _append_synced(self.path, json.dumps(record, ensure_ascii=False) + "\n")
+
+    def record_done(self, audio_path):
+        identity = file_identity(audio_path, self.key)
+        _append_synced(self.path, json.dumps({"event": "done", "id": identity}) + "\n")
+        self.done.add(identity)
+        self.progress.pop(identity, None)
+        partial = self.partial_path(audio_path)
+        if os.path.exists(partial):
+            os.remove(partial)
@@ -0,0 +1,64 @@
+"""The local faster-whisper pipelines behind one call.
+
+main.py (Whisper only) and main_di.py (speaker turns at long pauses, or
+pyannote with --diarize) are the two local CLIs. Tools that pick the
+pipeline with a --mode option (watch.py, dispatch.py) go through these
+helpers, which use the same engine names and cache options as the CLIs,
+so a file transcribed by any of them is a cache hit for the others.
+"""
+from whisper_models import get_whisper_model
+
+MODES = ("plain", "speakers", "diarize")
+
+
+def add_mode_argument(parser):
+    parser.add_argument("--mode", choices=MODES, default="plain",
+                        help="plain Whisper like main.py, or speaker turns like main_di.py "
+                             "(speakers: at long pauses, diarize: with pyannote) (default: plain)")
+
+
+def engine_name(mode):
+    return {"plain": "faster-whisper", "speakers": "faster-whisper+silence",
+            "diarize": "faster-whisper+pyannote"}[mode]
+
+
+def cache_options(args):
+    """Same options as main.py / main_di.py, so they share cache entries"""
+    options = {"model": args.model_size, "compute_type": args.compute_type, "language": "pt"}
+    if args.mode != "plain":
+        options.update(segmentation="silence", format="segments", decoding="windows")
+    if args.mode == "diarize":
+        options["segmentation"] = "pyannote"
+        if not args.no_known_speakers:
+            options["speakers"] = "known"
+    if args.block_seconds > 0:
+        options["block_seconds"] = args.block_seconds
+    elif args.speech_map != "off":
+        options["speech_map"] = args.speech_map
+    return options
+
+
+def warm_up(model_size, compute_type=None, cpu_threads=0, mode="plain"):
+    """Load the models of a mode once, so they stay resident"""
+    get_whisper_model(model_size, compute_type, cpu_threads)
+    if mode == "diarize":
+        from main_di import get_diarization_pipeline
+        get_diarization_pipeline()
+
+
+def transcribe_local(audio_path, args, cpu_threads=0, speaker_store=None, formats=(), stream_text=False):
+    """Segments of a file transcribed by the pipeline of args.mode.
+
+    formats and stream_text only apply to the plain mode, which writes its
+    outputs as segments arrive (like main.py).
+    """
+    if args.mode == "plain":
+        from main import process_file
+        return process_file(audio_path, args.model_size, args.compute_type, cpu_threads,
+                            formats=formats, stream_text=stream_text,
+                            block_seconds=args.block_seconds, speech_map_method=args.speech_map)
+    from main_di import process_audio_segments
+    return process_audio_segments(audio_path, args.model_size, args.compute_type, cpu_threads,
+                                  block_seconds=args.block_seconds,
+                                  diarization={"workers": 1} if args.mode == "diarize" else None,
+                                  speaker_store=speaker_store, speech_map_method=args.speech_map)
@@ -0,0 +1,160 @@
+"""Memory-bounded processing of multi-hour recordings.
+
+load_audio() holds the whole decoded recording (plus the log-mel of all of
+it once Whisper runs), so memory grows with the length of the file. Here the
+audio is decoded in fixed-size chunks (audio_io.stream_audio) and fed to the
+streaming silence segmenter; as soon as about block_seconds of audio are
+buffered, the buffer is cut at the end of the last closed speech range and
+handed out as a block, then dropped. Transcription runs block by block, so
+peak memory depends on block_seconds, not on the length of the recording.
+
+Each block carries its own samples and the speaker segments inside it, both
+relative to the block, plus the block offset in the recording.
+"""
+import logging
+import numpy as np
+from audio_io import SAMPLE_RATE, STREAM_CHUNK_SECONDS, stream_audio
+from vad import MAX_AMPLITUDE, SilenceSegmenter
+import metrics
+
+BLOCK_SECONDS = 120
+
+
+class SpeakerTurns:
+    """Alternate between two speakers whenever a pause is long enough.
+
+    The same heuristic main_di.detect_speaker_changes applies to a whole
+    recording, kept as state so ranges can arrive one at a time.
+    """
+
+    def __init__(self, min_silence_len=700):
+        self.min_silence_len = min_silence_len
+        self.current_speaker = 1
+        self.last_end = 0
+
+    def segment(self, start_ms, end_ms):
+        # Se houver um gap significativo, considera mudança de falante
+        if start_ms - self.last_end > self.min_silence_len * 2:
+            self.current_speaker = (self.current_speaker % 2) + 1
+        self.last_end = end_ms
+        return {'start': start_ms / 1000.0, 'end': end_ms / 1000.0,
+                'speaker': f"SPEAKER_{self.current_speaker}"}
+
+
+class SpeechBlocks:
+    """Cut a stream of sample chunks into blocks that end after a speech range.
+
+    feed() returns the blocks completed by a chunk and finish() the rest, as
+    (offset seconds, samples, segments) tuples.
+    """
+
+    def __init__(self, min_silence_len=700, silence_thresh=-40, block_seconds=BLOCK_SECONDS,
+                 sampling_rate=SAMPLE_RATE):
+        self.sampling_rate = sampling_rate
+        self.block_samples = int(block_seconds * sampling_rate)
+        self.segmenter = SilenceSegmenter(min_silence_len, silence_thresh, sampling_rate)
+        self.turns = SpeakerTurns(min_silence_len)
+
+        self.chunks = []      # amostras ainda não entregues
+        self.buffered = 0
+        self.origin = 0       # índice absoluto (amostras) do início do buffer
+        self.closed = []      # segmentos fechados ainda não entregues
+
+    def _ms_to_samples(self, ms):
+        return ms * self.sampling_rate // 1000
+
+    def _buffer(self):
+        if len(self.chunks) > 1:
+            self.chunks = [np.concatenate(self.chunks)]
+        return self.chunks[0]
+
+    def _first_loud(self, start, end):
+        """First 100 ms frame of buffer[start:end] (absolute) above the threshold, or None"""
+        view = self._buffer()[start - self.origin:end - self.origin]
+        frame = self.sampling_rate // 10
+        frames = len(view) // frame
+        energy = (view[:frames * frame].astype(np.float64) ** 2).reshape(frames, frame).mean(axis=1)
+        loud = np.flatnonzero(np.sqrt(energy) * MAX_AMPLITUDE > self.segmenter.threshold)
+        return start + int(loud[0]) * frame if len(loud) else None
+
+    def _close(self, ranges):
+        origin = self.origin / self.sampling_rate
+        for start, end in ranges:
+            segment = self.turns.segment(start, end)
+            # Trechos que terminam antes do buffer já foram entregues num corte forçado
+            if segment['end'] > origin:
+                self.closed.append(segment)
+
+    def _cut(self, end):
+        """Hand out buffer[origin:end] with the segments closed so far"""
+        data = self._buffer()
+        size = end - self.origin
+        offset = self.origin / self.sampling_rate
+        # Fala iniciada num bloco anterior começa no início deste
+        segments = [{**segment, 'start': max(segment['start'], offset) - offset,
+                     'end': segment['end'] - offset} for segment in self.closed]
+        self.closed = []
+        # Cópia: o bloco não deve manter vivo o buffer inteiro
+        self.chunks = [data[size:].copy()] if size < len(data) else []
+        self.buffered = len(data) - size
+        self.origin = end
+        return offset, data[:size], segments
+
+    def feed(self, samples):
+        """Consume a chunk; returns the blocks it completed"""
+        self.chunks.append(samples)
+        self.buffered += len(samples)
+        self._close(self.segmenter.feed(samples))
+
+        blocks = []
+        while self.buffered >= self.block_samples:
+            if self.closed:
+                # Corta no meio da pausa que fechou o último trecho de fala
+                end_ms = int(round(self.closed[-1]['end'] * 1000)) + self.segmenter.min_silence_len // 2
+                end = min(self._ms_to_samples(end_ms), self.origin + self.buffered)
+            else:
+                # Nenhuma pausa no bloco: corta onde ele termina e, se houver
+                # fala, transcreve desde o primeiro quadro com som
+                end = self.origin + self.block_samples
+                start = self._first_loud(self.origin, end)
+                if start is not None:
+                    self.closed.append(self.turns.segment(start * 1000 // self.sampling_rate,
+                                                          end * 1000 // self.sampling_rate))
+            blocks.append(self._cut(end))
+        return blocks
+
+    def finish(self):
+        """Blocks left at the end of the stream"""
+        self._close(self.segmenter.finish())
+        if not self.buffered:
+            return []
+        return [self._cut(self.origin + self.buffered)]
+
+
+def speech_blocks(path, min_silence_len=700, silence_thresh=-40, block_seconds=BLOCK_SECONDS,
+                  chunk_seconds=STREAM_CHUNK_SECONDS, sampling_rate=SAMPLE_RATE):
+    """Decode, segment and yield the blocks of a file without loading it whole"""
+    blocks = SpeechBlocks(min_silence_len, silence_thresh, block_seconds, sampling_rate)
+    decoded = 0
+    for chunk in stream_audio(path, chunk_seconds, sampling_rate):
+        decoded += len(chunk)
+        yield from blocks.feed(chunk)
+    yield from blocks.finish()
+    metrics.gauge("decoded_seconds", decoded / sampling_rate)
+    logging.info(f"Streamed {path}: {decoded / sampling_rate:.1f}s of audio")
+
+
+def shift(segment, offset):
+    """Segment moved from block time to recording time"""
+    shifted = {**segment, 'start': segment['start'] + offset, 'end': segment['end'] + offset}
+    if 'words' in segment:
+        shifted['words'] = [{**word, 'start': word['start'] + offset, 'end': word['end'] + offset}
+                            for word in segment['words']]
+    return shifted
+
+
+def add_long_audio_arguments(parser):
+    parser.add_argument("--block-seconds", type=float, default=0,
+                        help="Decode and transcribe in blocks of about this many seconds instead of "
+                             "whole files, so memory stays flat on multi-hour recordings "
+                             f"(e.g. {BLOCK_SECONDS}; default: 0, whole files)")
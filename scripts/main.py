@@ -1,118 +1,250 @@
 import os
-import urllib.request
-from pathlib import Path
-from faster_whisper import WhisperModel
+import argparse
+import functools
+import heapq
+import time
 import base64
-from pydub import AudioSegment
 import logging
+from whisper_models import DEFAULT_MODEL_SIZE, add_model_arguments, get_whisper_model, transcribe_segments
+from cache import add_cache_arguments, open_cache
+from sinks import TRANSCRIPTIONS_FILE, add_output_arguments, create_sinks, write_segments
+from audio_io import duration_seconds, load_audio
+from long_audio import add_long_audio_arguments, shift, speech_blocks
+from speech_map import SpeechMap, add_speech_map_arguments, skipped_report, speech_map
+from fingerprint import add_fingerprint_arguments, dedup_options, reuse_transcript
+from metrics import add_metrics_arguments
+import metrics
+from transcript_store import TranscriptStore, add_store_arguments
+from word_index import save_word_index
+from batch import add_batch_arguments, list_audio_files, log_stats, run_batch, threads_per_worker
 
-# Set up logging configuration
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('transcription.log'),
-        logging.StreamHandler()
-    ]
-)
-
-def setup_tesseract_local():
-    """Configure Tesseract to use local language files in the venv"""
-    logging.info("Starting Tesseract setup...")
-    # Define paths
-    venv_path = Path(os.environ.get('VIRTUAL_ENV', '.venv'))
-    tessdata_path = venv_path / 'tessdata'
-
-    # Create tessdata directory if it doesn't exist
-    tessdata_path.mkdir(exist_ok=True)
-    logging.info(f"Using tessdata path: {tessdata_path}")
-
-    # Download Portuguese language data if needed
-    por_traineddata = tessdata_path / 'por.traineddata'
-    if not por_traineddata.exists():
-        logging.info("Portuguese language data not found. Downloading...")
-        url = "https://github.com/tesseract-ocr/tessdata/raw/main/por.traineddata"
-        try:
-            urllib.request.urlretrieve(url, por_traineddata)
-            logging.info("Successfully downloaded Portuguese language data")
-        except Exception as e:
-            logging.error(f"Failed to download language data: {e}")
-            raise
-
-    # Set environment variable to use local tessdata
-    os.environ['TESSDATA_PREFIX'] = str(tessdata_path)
-    logging.info(f"Tesseract data directory set to: {tessdata_path}")
-    return tessdata_path
-
-
-def transcribe_audio(audio_path):
-    logging.info(f"Starting transcription of: {audio_path}")
-    try:
-        # Para Mac com Apple Silicon (M1/M2/M3)
-        logging.info("Attempting to use MPS (Apple Silicon)...")
-        model = WhisperModel("base", device="mps", compute_type="float16")
-        logging.info("Successfully initialized model with MPS")
-    except Exception as e:
-        logging.warning(f"Failed to use MPS: {e}")
-        logging.info("Switching to CPU...")
-        # Fallback para CPU
-        model = WhisperModel("base", device="cpu", compute_type="float32")
-        logging.info("Successfully initialized model with CPU")
+def transcribe_audio(audio, model_size=DEFAULT_MODEL_SIZE, compute_type=None, cpu_threads=0, words=False):
+    """Stream the timestamped segments of a decoded 16 kHz mono buffer (with their words if asked)"""
+    model = get_whisper_model(model_size, compute_type, cpu_threads)
 
     try:
-        segments, info = model.transcribe(audio_path, language="pt")
-        transcription = " ".join([segment.text for segment in segments])
-        logging.info(f"Transcription completed. Length: {len(transcription)} characters")
-        return transcription
+        start = time.perf_counter()
+        count = 0
+        with metrics.timer("transcribe", audio_seconds=duration_seconds(audio)):
+            for segment in transcribe_segments(model, audio, language="pt", word_timestamps=words):
+                count += 1
+                yield segment
+        metrics.count("segments", count)
+        elapsed = time.perf_counter() - start
+        logging.info(f"Transcription completed in {elapsed:.2f}s. Segments: {count}")
     except Exception as e:
         logging.error(f"Transcription failed: {e}")
         raise
 
 
-def convert_audio_to_mp3(raw_path):
-    logging.info(f"Converting audio file: {raw_path}")
-    try:
-        audio = AudioSegment.from_file(raw_path)
-        mp3_path = raw_path.replace('.opus', '.mp3')
-        audio.export(mp3_path, format="mp3")
-        logging.info(f"Successfully converted to MP3: {mp3_path}")
-        return mp3_path
-    except Exception as e:
-        logging.error(f"Audio conversion failed: {e}")
-        raise
+def transcribe_long_audio(audio_path, block_seconds, model_size=DEFAULT_MODEL_SIZE, compute_type=None,
+                          cpu_threads=0, words=False):
+    """Stream the segments of a file decoded and transcribed block by block.
+
+    Only one block of samples is alive at a time; blocks without speech are
+    not sent to Whisper.
+    """
+    for offset, samples, speech in speech_blocks(audio_path, block_seconds=block_seconds):
+        if not speech:
+            continue
+        for segment in transcribe_audio(samples, model_size, compute_type, cpu_threads, words):
+            yield shift(segment, offset)
+
+
+def transcribe_speech_only(audio_path, audio, method="auto", model_size=DEFAULT_MODEL_SIZE,
+                           compute_type=None, cpu_threads=0, words=False):
+    """Transcribe only the speech regions of a buffer, on the original timeline"""
+    speech = speech_map(audio_path, audio, method)
+    if not speech.regions:
+        return
+    for segment in transcribe_audio(speech.collect(audio), model_size, compute_type, cpu_threads, words):
+        yield speech.map_segment(segment)
+
+
+def transcribe_remainder(audio, reused, regions, model_size=DEFAULT_MODEL_SIZE, compute_type=None,
+                         cpu_threads=0, words=False, speech=None):
+    """Reused segments, merged in time order with the transcription of the regions they leave out
+    (only their speech when a speech map is given)"""
+    remainder = SpeechMap(regions, duration_seconds(audio), "dedup")
+    if speech is not None:
+        remainder = speech.intersect(remainder)
+    if not remainder.regions:
+        return iter(reused)
+    transcribed = (remainder.map_segment(segment) for segment in
+                   transcribe_audio(remainder.collect(audio), model_size, compute_type, cpu_threads, words))
+    return heapq.merge(reused, transcribed, key=lambda segment: segment['start'])
+
+
+def process_file(audio_path, model_size=DEFAULT_MODEL_SIZE, compute_type=None, cpu_threads=0,
+                 formats=("txt",), stream_text=True, block_seconds=0, speech_map_method="off",
+                 dedup=None, words=False):
+    """Decode and transcribe a single file (runs inside the batch workers).
+
+    Segments are written to the per-file outputs as they arrive, and to the
+    shared transcriptions.txt too when stream_text is set. The segments are
+    returned so the parent can cache them (and append the text in order when
+    it was not streamed). With dedup, the parts already transcribed in
+    another recording are taken from its transcript. With words, each
+    segment also carries its word timestamps.
+    """
+    logging.info(f"Processing file: {audio_path}")
+    if block_seconds > 0:
+        segments = transcribe_long_audio(audio_path, block_seconds, model_size, compute_type, cpu_threads,
+                                         words)
+    else:
+        audio = load_audio(audio_path)
+        reused, regions = None, None
+        if dedup is not None:
+            reused, regions = reuse_transcript(audio_path, audio, dedup)
+        if reused is not None:
+            # Do que a outra gravação não cobre, só a fala vai para o Whisper
+            speech = None
+            if regions and speech_map_method != "off":
+                speech = speech_map(audio_path, audio, speech_map_method)
+            segments = transcribe_remainder(audio, reused, regions, model_size, compute_type, cpu_threads,
+                                            words, speech)
+        elif speech_map_method != "off":
+            segments = transcribe_speech_only(audio_path, audio, speech_map_method,
+                                              model_size, compute_type, cpu_threads, words)
+        else:
+            segments = transcribe_audio(audio, model_size, compute_type, cpu_threads, words)
+    sinks = create_sinks(formats, "transcriptions", audio_path,
+                         TRANSCRIPTIONS_FILE if stream_text else None)
+    return list(write_segments(segments, sinks, audio_path))
+
+
+def replay_segments(audio_path, segments, formats):
+    """Write cached segments to the outputs without touching the model"""
+    sinks = create_sinks(formats, "transcriptions", audio_path, TRANSCRIPTIONS_FILE)
+    for _ in write_segments(iter(segments), sinks, audio_path):
+        pass
+    logging.info(f"Transcription for {os.path.basename(audio_path)} served from cache")
+
+
+def save_transcription(audio_path, segments, error, write_text=False):
+    if error is not None:
+        return
+    if write_text:
+        transcription = " ".join(segment['text'] for segment in segments)
+        # Save transcription to the transcription txt file
+        with open(TRANSCRIPTIONS_FILE, "a") as f:
+            # Add the file name to the transcription
+            f.write(f"# {os.path.basename(audio_path)}\n\n{transcription}\n\n")
+    logging.info(f"Transcription saved for {os.path.basename(audio_path)}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Transcribe every file in audios/ with faster-whisper")
+    add_model_arguments(parser)
+    add_batch_arguments(parser)
+    add_output_arguments(parser)
+    add_cache_arguments(parser)
+    add_metrics_arguments(parser)
+    add_store_arguments(parser)
+    add_long_audio_arguments(parser)
+    add_speech_map_arguments(parser)
+    add_fingerprint_arguments(parser)
+    parser.add_argument("--words", action="store_true",
+                        help="Keep word timestamps and save a searchable word index of each file "
+                             "(see word_index.py)")
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
+    # Set up logging configuration
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('transcription.log'),
+            logging.StreamHandler()
+        ]
+    )
+    args = parse_args()
     logging.info("Starting transcription process...")
     
     try:
-        setup_tesseract_local()
-        
         # Ensure directories exist
         os.makedirs("audios", exist_ok=True)
         os.makedirs("transcriptions", exist_ok=True)
+        stage_metrics = metrics.configure(args)
         
-        audio_files = os.listdir("audios")
+        audio_files = list_audio_files("audios")
         logging.info(f"Found {len(audio_files)} audio files to process")
-        
-        for file in audio_files:
-            logging.info(f"Processing file: {file}")
-            try:
-                audio_path = os.path.join("audios", file)
-                mp3_path = convert_audio_to_mp3(audio_path)
-                transcription = transcribe_audio(mp3_path)
-                
-                # Save transcription to the transcription txt file
-                output_path = os.path.join("transcriptions", f"transcriptions.txt")
-                with open(output_path, "a") as f:
-                    # Add the file name to the transcription
-                    f.write(f"# {file}\n\n{transcription}\n\n")
-                logging.info(f"Transcription saved to {output_path}")
-                
-            except Exception as e:
-                logging.error(f"Failed to process {file}: {e}")
-                continue
-                
+
+        audio_paths = [os.path.join("audios", file) for file in audio_files]
+
+        # Cached results are emitted without decoding or loading the model
+        cache = open_cache(args)
+        cache_options = {"model": args.model_size, "compute_type": args.compute_type,
+                         "language": "pt"}
+        if args.block_seconds > 0:
+            cache_options["block_seconds"] = args.block_seconds
+        elif args.speech_map != "off":
+            cache_options["speech_map"] = args.speech_map
+        # Copies and parts already transcribed in another recording are reused
+        dedup = dedup_options(args, "faster-whisper", args.model_size) if args.block_seconds <= 0 else None
+        if dedup is not None:
+            cache_options["dedup"] = True
+        if args.words:
+            cache_options["words"] = True
+        store = TranscriptStore(args.store)
+
+        def store_segments(audio_path, segments):
+            audio_hash = cache.audio_hash(audio_path) if cache is not None else None
+            if audio_hash is None or not store.has(audio_hash, "faster-whisper", args.model_size):
+                store.save(audio_path, segments, "faster-whisper", args.model_size,
+                           cache_options, audio_hash)
+
+        cache_keys = {}
+        if cache is not None:
+            hits, misses = cache.split(audio_paths, **cache_options)
+            for audio_path, segments in hits:
+                replay_segments(audio_path, segments, args.formats)
+                store_segments(audio_path, segments)
+                if args.words:
+                    save_word_index(audio_path, segments)
+            cache_keys = dict(misses)
+            audio_paths = [audio_path for audio_path, _ in misses]
+
+        # With several workers the parent appends the shared txt in order
+        stream_text = args.workers <= 1 and "txt" in args.formats
+        write_text = "txt" in args.formats and not stream_text
+
+        def on_result(audio_path, segments, error):
+            save_transcription(audio_path, segments, error, write_text)
+            if error is None:
+                store_segments(audio_path, segments)
+                if args.words:
+                    save_word_index(audio_path, segments)
+            if cache is not None and error is None:
+                cache.put(cache_keys[audio_path], audio_path, cache_options, segments)
+
+        # Each worker loads the model once and keeps it resident
+        cpu_threads = threads_per_worker(args.workers) if args.workers > 1 else 0
+        model_options = (args.model_size, args.compute_type, cpu_threads)
+        stats = run_batch(
+            audio_paths,
+            functools.partial(process_file, model_size=args.model_size,
+                              compute_type=args.compute_type, cpu_threads=cpu_threads,
+                              formats=args.formats, stream_text=stream_text,
+                              block_seconds=args.block_seconds, speech_map_method=args.speech_map,
+                              dedup=dedup, words=args.words),
+            workers=args.workers,
+            initializer=get_whisper_model,
+            initargs=model_options,
+            memory_limit_mb=args.max_worker_memory,
+            on_result=on_result)
+
+        log_stats(stats)
+        if args.speech_map != "off" and args.block_seconds <= 0:
+            skipped, total = skipped_report(audio_paths, args.speech_map)
+            logging.info(f"Skipped {skipped:.1f}s of non-speech audio out of {total:.1f}s")
+        if cache is not None:
+            cache.log_stats()
+        if stage_metrics is not None:
+            stage_metrics.log_summary()
         logging.info("Transcription process completed successfully")
         
     except Exception as e:
@@ -1,9 +1,15 @@
 import os
 import logging
 import sys
-import assemblyai as aai
 import argparse
+import functools
 from dotenv import load_dotenv
+from assemblyai_client import DEFAULT_BASE_URL, entry_from_json, format_entry, segments_from_json, transcribe_many
+from cache import add_cache_arguments, open_cache
+from transcript_store import TranscriptStore, add_store_arguments
+from fingerprint import add_fingerprint_arguments, dedup_options
+from batch import AUDIO_EXTENSIONS, add_batch_arguments, list_audio_files, log_stats, run_batch
+from sinks import add_output_arguments, create_sinks, save_segments
 
 load_dotenv()
 
@@ -22,19 +28,24 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def transcribe_audio(api_key, audio_path, output_path, speaker_labels=True, content_safety=False, iab_categories=False):
+def transcribe_file(audio_path, api_key, speaker_labels=True, content_safety=False, iab_categories=False):
     """
-    Transcreve um arquivo de áudio usando a API da AssemblyAI.
+    Transcreve um arquivo de áudio e devolve a entrada formatada para o
+    arquivo de transcrições e os segmentos para o banco de transcrições.
+    Levanta exceção em caso de erro.
 
     Args:
+        audio_path (str): Caminho ou URL do arquivo de áudio.
         api_key (str): Sua chave da API da AssemblyAI.
-        audio_path (str): Caminho para o arquivo de áudio.
-        output_path (str): Caminho para salvar a transcrição.
         speaker_labels (bool): Ativa/desativa a diarização (rótulos de falantes).
         content_safety (bool): Ativa/desativa a detecção de conteúdo sensível.
         iab_categories (bool): Ativa a categorização do conteúdo (IAB).
+
+    Returns:
+        dict: "entry" (texto pronto para transcriptions.txt) e "segments".
     """
 
+    import assemblyai as aai
     aai.settings.api_key = api_key
 
     config = aai.TranscriptionConfig(
@@ -44,75 +55,72 @@ def transcribe_audio(api_key, audio_path, output_path, speaker_labels=True, cont
         language_code="pt"  # Definindo português como idioma
     )
 
-    try:
-        # Verifica se é uma URL
-        if audio_path.startswith("http://") or audio_path.startswith("https://"):
-            transcriber = aai.Transcriber()
-            transcript = transcriber.transcribe(audio_path, config=config)
-        else:
-            # Se não for, assume que é um caminho local
-            if not os.path.exists(audio_path):
-                raise FileNotFoundError(
-                    f"Arquivo de áudio não encontrado: {audio_path}")
-
-            transcriber = aai.Transcriber()
-            transcript = transcriber.transcribe(audio_path, config=config)
-
-        if transcript.status == aai.TranscriptStatus.error:
-            logger.error(f"Erro na transcrição: {transcript.error}")
-            return
-
-        # Formata a saída com os rótulos dos falantes (diarização)
-        formatted_transcription = ""
-        if speaker_labels and hasattr(transcript, 'utterances') and transcript.utterances:
-            for utterance in transcript.utterances:
-                formatted_transcription += f"[Speaker {utterance.speaker}]: {utterance.text}\n"
-        else:
-            formatted_transcription = transcript.text
-
-        # Salva a transcrição no arquivo único
-        output_file = os.path.join(output_path, "transcriptions.txt")
-        with open(output_file, "a", encoding='utf-8') as f:
-            f.write(f"\n# {os.path.basename(audio_path)}\n\n")
-            f.write(formatted_transcription)
-            f.write("\n\n")
-
-            # Verifica se os atributos existem antes de tentar acessá-los
-            if content_safety and hasattr(transcript, 'content_safety'):
-                results = getattr(transcript.content_safety, 'results', [])
-                if results:
-                    f.write("\nConteúdo sensível detectado:\n")
-                    # for result in results:
-                    #     f.write(f"  - {result.text}: {result.severity}\n")
-
-            if iab_categories and hasattr(transcript, 'iab_categories'):
-                results = getattr(transcript.iab_categories, 'results', [])
-                if results:
-                    f.write("\nCategorias IAB detectadas:\n")
-                    for result in results:
-                        f.write(f"  - {result.text}\n")
-
-            f.write("\n" + "-"*50 + "\n")  # Separador entre transcrições
-
-        logger.info(f"Transcrição salva em: {output_file}")
-
-        # Imprime informações adicionais no log
-        if content_safety and hasattr(transcript, 'content_safety'):
-            results = getattr(transcript.content_safety, 'results', [])
-            if results:
-                logger.info("Conteúdo sensível detectado:")
-                # for result in results:
-                #     logger.info(f"  - {result.text}: {result.severity}")
-
-        if iab_categories and hasattr(transcript, 'iab_categories'):
-            results = getattr(transcript.iab_categories, 'results', [])
-            if results:
-                logger.info("Categorias IAB detectadas:")
-                for result in results:
-                    logger.info(f" - {result.text}")
+    # Se não for uma URL, assume que é um caminho local
+    if not (audio_path.startswith("http://") or audio_path.startswith("https://")):
+        if not os.path.exists(audio_path):
+            raise FileNotFoundError(
+                f"Arquivo de áudio não encontrado: {audio_path}")
+
+    transcriber = aai.Transcriber()
+    transcript = transcriber.transcribe(audio_path, config=config)
+
+    if transcript.status == aai.TranscriptStatus.error:
+        raise RuntimeError(f"Erro na transcrição: {transcript.error}")
+
+    utterances = None
+    segments = [{"start": None, "end": None, "speaker": None, "text": transcript.text}] if transcript.text else []
+    if speaker_labels and hasattr(transcript, 'utterances') and transcript.utterances:
+        utterances = [(u.speaker, u.text) for u in transcript.utterances]
+        segments = [{"start": u.start / 1000, "end": u.end / 1000, "speaker": u.speaker, "text": u.text}
+                    for u in transcript.utterances]
+
+    # Verifica se os atributos existem antes de tentar acessá-los
+    safety_results = None
+    if content_safety and hasattr(transcript, 'content_safety'):
+        safety_results = getattr(transcript.content_safety, 'results', [])
+
+    iab_results = None
+    if iab_categories and hasattr(transcript, 'iab_categories'):
+        iab_results = [result.text for result in getattr(transcript.iab_categories, 'results', [])]
+
+    entry = format_entry(os.path.basename(audio_path), transcript.text, utterances,
+                         safety_results, iab_results)
+    return {"entry": entry, "segments": segments}
+
+
+def transcribe_to_text(audio_path, api_key, speaker_labels=True, content_safety=False, iab_categories=False):
+    """Como transcribe_file, mas devolve só a entrada de transcriptions.txt."""
+    return transcribe_file(audio_path, api_key, speaker_labels, content_safety, iab_categories)["entry"]
+
+
+def save_transcription(output_path, entry):
+    """Anexa uma entrada ao arquivo único de transcrições."""
+    output_file = os.path.join(output_path, "transcriptions.txt")
+    with open(output_file, "a", encoding='utf-8') as f:
+        f.write(entry)
+    logger.info(f"Transcrição salva em: {output_file}")
+
 
+def transcribe_audio(api_key, audio_path, output_path, speaker_labels=True, content_safety=False, iab_categories=False):
+    """
+    Transcreve um arquivo de áudio usando a API da AssemblyAI.
+
+    Args:
+        api_key (str): Sua chave da API da AssemblyAI.
+        audio_path (str): Caminho para o arquivo de áudio.
+        output_path (str): Caminho para salvar a transcrição.
+        speaker_labels (bool): Ativa/desativa a diarização (rótulos de falantes).
+        content_safety (bool): Ativa/desativa a detecção de conteúdo sensível.
+        iab_categories (bool): Ativa a categorização do conteúdo (IAB).
+    """
+    try:
+        entry = transcribe_to_text(audio_path, api_key, speaker_labels=speaker_labels,
+                                   content_safety=content_safety, iab_categories=iab_categories)
+        save_transcription(output_path, entry)
     except FileNotFoundError as e:
         logger.error(e)
+    except RuntimeError as e:
+        logger.error(e)
     except Exception as e:
         logger.exception(f"Erro inesperado durante a transcrição: {e}")
 
@@ -122,6 +130,20 @@ def main():
     Função principal que processa os arquivos de áudio no diretório 'audios' 
     e salva as transcrições no diretório 'transcriptions'.
     """
+    parser = argparse.ArgumentParser(
+        description="Transcreve os arquivos de 'audios' com a AssemblyAI")
+    add_batch_arguments(parser)
+    add_output_arguments(parser)
+    add_cache_arguments(parser)
+    add_store_arguments(parser)
+    add_fingerprint_arguments(parser)
+    parser.add_argument("--concurrency", type=int, default=0,
+                        help="Envia até N arquivos em paralelo pela API REST assíncrona "
+                             "(0 = um por vez com o SDK)")
+    parser.add_argument("--api-base-url", default=DEFAULT_BASE_URL,
+                        help="URL base da API da AssemblyAI")
+    args = parser.parse_args()
+
     # Obtém a chave da API
     api_key = os.environ.get("ASSEMBLYAI_API_KEY")
     if not api_key:
@@ -135,8 +157,7 @@ def main():
     os.makedirs(transcriptions_dir, exist_ok=True)
 
     # Verifica se há arquivos de áudio para processar
-    audio_files = [f for f in os.listdir("audios") if f.lower().endswith(
-        ('.mp3', '.wav', '.ogg', '.opus', '.m4a'))]
+    audio_files = list_audio_files("audios", AUDIO_EXTENSIONS)
 
     if not audio_files:
         logger.error(
@@ -146,20 +167,92 @@ def main():
     logger.info(
         f"Encontrados {len(audio_files)} arquivos de áudio para processar")
 
-    # Processa cada arquivo de áudio
-    for idx, file in enumerate(audio_files, 1):
-        logger.info(f"Processando arquivo {idx}/{len(audio_files)}: {file}")
-        try:
-            audio_path = os.path.join("audios", file)
-
-            # Transcreve o áudio com configurações padrão
-            transcribe_audio(api_key, audio_path, transcriptions_dir,
-                             speaker_labels=True, content_safety=True, iab_categories=False)
-
-        except Exception as e:
-            logger.error(f"Falha ao processar {file}: {e}")
-            logger.debug("Detalhes do erro:", exc_info=True)
-            continue
+    audio_paths = [os.path.join("audios", file) for file in audio_files]
+    options = {"speaker_labels": True, "content_safety": True, "iab_categories": False}
+
+    # Resultados em cache não são enviados de novo (nem pagos de novo)
+    cache = open_cache(args)
+    cache_options = {"service": "assemblyai", "language": "pt", "format": "entry+segments", **options}
+    store = TranscriptStore(args.store)
+
+    def write_outputs(audio_path, result):
+        # txt recebe a entrada completa (com segurança de conteúdo e categorias), não só os segmentos
+        if "txt" in args.formats:
+            save_transcription(transcriptions_dir, result["entry"])
+        save_segments(result["segments"], create_sinks(args.formats, transcriptions_dir, audio_path),
+                      audio_path)
+
+    def store_result(audio_path, result):
+        audio_hash = cache.audio_hash(audio_path) if cache is not None else None
+        if audio_hash is None or not store.has(audio_hash, "assemblyai"):
+            store.save(audio_path, result["segments"], "assemblyai", None, cache_options, audio_hash)
+
+    cache_keys = {}
+    if cache is not None:
+        hits, misses = cache.split(audio_paths, **cache_options)
+        for audio_path, result in hits:
+            write_outputs(audio_path, result)
+            store_result(audio_path, result)
+        cache_keys = dict(misses)
+        audio_paths = [audio_path for audio_path, _ in misses]
+
+    def save_result(audio_path, result):
+        write_outputs(audio_path, result)
+        store_result(audio_path, result)
+        if cache is not None:
+            cache.put(cache_keys[audio_path], audio_path, cache_options, result)
+
+    # Cópias (outro formato, reexportação) de gravações já transcritas não são enviadas de novo
+    dedup = dedup_options(args, "assemblyai", None)
+    if dedup is not None:
+        from audio_io import load_audio
+        from fingerprint import reuse_transcript
+        remaining = []
+        for audio_path in audio_paths:
+            reused, regions = reuse_transcript(audio_path, load_audio(audio_path), dedup)
+            if reused is not None and not regions:
+                utterances = [(s["speaker"], s["text"]) for s in reused if s["speaker"]] or None
+                entry = format_entry(os.path.basename(audio_path), " ".join(s["text"] for s in reused),
+                                     utterances)
+                save_result(audio_path, {"entry": entry, "segments": reused})
+                continue
+            if reused is not None:
+                # A API não transcreve trechos: o arquivo vai inteiro
+                logger.info(f"{os.path.basename(audio_path)} é só em parte uma cópia; enviando o arquivo inteiro")
+            remaining.append(audio_path)
+        audio_paths = remaining
+
+    if args.concurrency > 0:
+        # Envio concorrente com um único laço de polling para todos os arquivos
+        def on_transcript(audio_path, transcript, error):
+            if error is None:
+                save_result(audio_path, {"entry": entry_from_json(audio_path, transcript, **options),
+                                         "segments": segments_from_json(transcript)})
+
+        config = {"language_code": "pt", **options}
+        results = transcribe_many(api_key, audio_paths, config, max_in_flight=args.concurrency,
+                                  base_url=args.api_base_url, on_result=on_transcript)
+        failed = sum(1 for _, _, error in results if error is not None)
+        logger.info(f"{len(results) - failed} arquivos transcritos, {failed} falhas")
+        if cache is not None:
+            cache.log_stats()
+        logger.info("Processo de transcrição concluído com sucesso")
+        return
+
+    # Processa os arquivos; a API é remota, então os workers só esperam rede
+    def on_result(audio_path, result, error):
+        if error is None:
+            save_result(audio_path, result)
+
+    stats = run_batch(
+        audio_paths,
+        functools.partial(transcribe_file, api_key=api_key, **options),
+        workers=args.workers,
+        memory_limit_mb=args.max_worker_memory,
+        on_result=on_result)
+    log_stats(stats)
+    if cache is not None:
+        cache.log_stats()
 
     logger.info("Processo de transcrição concluído com sucesso")
 
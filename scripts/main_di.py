@@ -1,47 +1,57 @@
 import os
-import urllib.request
-from pathlib import Path
-from faster_whisper import WhisperModel
+import argparse
+import functools
+import time
 import base64
-from pydub import AudioSegment
+import json
 import logging
-from pyannote.audio import Pipeline
-import torch
 import sys
-import timeout_decorator
-from pydub.silence import detect_nonsilent
+import threading
+from audio_io import duration_seconds, load_audio
+from diarization import CHUNK_SECONDS, OVERLAP_SECONDS, SpeakerRegistry, diarize, load_pipeline
+from alignment import align
+from speaker_store import add_speaker_arguments, open_speaker_store
+from speech_map import SpeechMap, add_speech_map_arguments, skipped_report, speech_map
+from fingerprint import add_fingerprint_arguments, dedup_options, reuse_transcript
+from vad import detect_nonsilent_ranges
+from segment_windows import transcribe_windows, transcribe_words
+from batched_inference import transcribe_turns
+from long_audio import SpeakerTurns, add_long_audio_arguments, shift, speech_blocks
+from whisper_models import DEFAULT_MODEL_SIZE, add_model_arguments, get_whisper_model
+from journal import DEFAULT_JOURNAL_PATH, Journal
+from transcript_store import TranscriptStore, add_store_arguments
+from cache import add_cache_arguments, open_cache
+from batch import add_batch_arguments, list_audio_files, log_stats, run_batch, threads_per_worker
+from metrics import SampledLog, add_metrics_arguments
+from sinks import TRANSCRIPTIONS_FILE, add_output_arguments, create_sinks, save_segments
+import metrics
 
 # Set up logging configuration
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.StreamHandler(sys.stdout)
+        logging.StreamHandler(sys.stdout),
+        logging.FileHandler('transcription.log')
     ]
 )
 
-# Configurar handlers de arquivo separadamente
-debug_handler = logging.FileHandler('transcription_debug.log')
-debug_handler.setLevel(logging.DEBUG)
 
-info_handler = logging.FileHandler('transcription.log')
-info_handler.setLevel(logging.INFO)
-
-# Adicionar formatador aos handlers
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-debug_handler.setFormatter(formatter)
-info_handler.setFormatter(formatter)
-
-# Adicionar handlers ao logger root
-logging.getLogger().addHandler(debug_handler)
-logging.getLogger().addHandler(info_handler)
+def enable_debug_log(path='transcription_debug.log'):
+    """Log DEBUG para um arquivo separado, só quando pedido (--debug)"""
+    handler = logging.FileHandler(path)
+    handler.setLevel(logging.DEBUG)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    root = logging.getLogger()
+    # Os handlers existentes continuam em INFO
+    for existing in root.handlers:
+        existing.setLevel(logging.INFO)
+    root.addHandler(handler)
+    root.setLevel(logging.DEBUG)
 
 # Variável global para o pipeline
 DIARIZATION_PIPELINE = None
 
-# Definir timeout de 5 minutos (300 segundos)
-DIARIZATION_TIMEOUT = 300
-
 
 def setup_pyannote_local():
     """Configure Pyannote to use local model files in a shared location"""
@@ -53,10 +63,7 @@ def setup_pyannote_local():
         HF_TOKEN = os.getenv("HF_TOKEN")
 
         logging.info("Loading Pyannote pipeline...")
-        DIARIZATION_PIPELINE = Pipeline.from_pretrained(
-            "pyannote/speaker-diarization@2.1",
-            use_auth_token=HF_TOKEN
-        )
+        DIARIZATION_PIPELINE = load_pipeline(HF_TOKEN)
 
         logging.info("Successfully initialized Pyannote pipeline")
         return DIARIZATION_PIPELINE
@@ -67,272 +74,384 @@ def setup_pyannote_local():
 
 
 def get_diarization_pipeline():
-    """Get the global diarization pipeline"""
+    """Get the global diarization pipeline, loading it on first use"""
     global DIARIZATION_PIPELINE
     if DIARIZATION_PIPELINE is None:
-        raise RuntimeError(
-            "Pyannote pipeline not initialized. Please run setup_pyannote_local() first")
+        setup_pyannote_local()
     return DIARIZATION_PIPELINE
 
 
-@timeout_decorator.timeout(DIARIZATION_TIMEOUT)
-def perform_diarization(audio_path):
-    logging.info(f"Starting diarization for: {audio_path}")
-    try:
-        pipeline = get_diarization_pipeline()
-        logging.info("Running diarization pipeline...")
-        diarization = pipeline(audio_path)
-
-        speaker_segments = []
-        for turn, _, speaker in diarization.itertracks(yield_label=True):
-            speaker_segments.append({
-                'speaker': speaker,
-                'start': turn.start,
-                'end': turn.end
-            })
+def perform_diarization(audio, workers=1, chunk_seconds=CHUNK_SECONDS, overlap=OVERLAP_SECONDS,
+                        registry=None, speech=None):
+    """Roda o pyannote em blocos sobrepostos do buffer já decodificado.
 
-        logging.info(
-            f"Diarization completed with {len(speaker_segments)} segments")
-        return speaker_segments
-    except timeout_decorator.TimeoutError:
-        logging.error(
-            f"Diarization timed out after {DIARIZATION_TIMEOUT} seconds")
-        raise
+    Com um SpeechMap (speech), só os trechos de fala passam pelo pyannote e
+    os turnos voltam para a linha do tempo original.
+    """
+    logging.info("Starting diarization")
+    try:
+        if isinstance(audio, str):
+            audio = load_audio(audio)
+        # Com vários workers cada um carrega o próprio pipeline
+        pipeline = get_diarization_pipeline() if workers <= 1 else None
+        if speech is not None:
+            audio = speech.collect(audio)
+        # Sem timeout global: cada bloco é curto e gravações longas não falham mais
+        turns = diarize(audio, workers=workers, chunk_seconds=chunk_seconds, overlap=overlap,
+                        pipeline=pipeline, registry=registry)
+        return speech.remap(turns) if speech is not None else turns
     except Exception as e:
         logging.error(f"Diarization failed: {e}")
         raise
 
 
-@timeout_decorator.timeout(60)  # timeout de 1 minuto para conversão
-def convert_audio_to_wav(raw_path):
-    """Converte áudio para WAV para melhor compatibilidade"""
-    logging.info(f"Converting audio file to WAV: {raw_path}")
+def decode_audio_file(raw_path):
+    """Decodifica o áudio uma única vez para PCM 16 kHz mono em memória"""
+    import timeout_decorator
+    logging.info(f"Decoding audio file: {raw_path}")
     try:
-        logging.debug("Loading audio file using pydub")
-        audio = AudioSegment.from_file(raw_path)
-
-        # Converter para WAV com configurações específicas
-        audio = audio.set_channels(1)  # mono
-        audio = audio.set_frame_rate(16000)  # 16kHz
-
-        wav_path = raw_path.replace('.opus', '.wav').replace(
-            '.ogg', '.wav').replace('.mp3', '.wav')
-        logging.debug(f"Exporting to WAV format at: {wav_path}")
-        audio.export(wav_path, format="wav")
-        logging.info(f"Successfully converted to WAV: {wav_path}")
-        return wav_path
+        # O timeout usa SIGALRM, que só existe na thread principal (watch.py
+        # transcreve numa thread própria); fora dela decodifica sem limite
+        if threading.current_thread() is not threading.main_thread():
+            return load_audio(raw_path)
+        # timeout de 1 minuto para decodificação
+        return timeout_decorator.timeout(60)(load_audio)(raw_path)
     except timeout_decorator.TimeoutError:
-        logging.error("Audio conversion timed out after 60 seconds")
+        logging.error("Audio decoding timed out after 60 seconds")
         raise
     except Exception as e:
-        logging.error(f"Audio conversion failed: {e}")
+        logging.error(f"Audio decoding failed: {e}")
         raise
 
 
-def split_audio(audio_path, segment_duration=30):
-    """Divide o áudio em segmentos menores"""
-    logging.info(f"Splitting audio into {segment_duration}s segments")
-    try:
-        audio = AudioSegment.from_file(audio_path)
-        total_duration = len(audio)
-        segments = []
-
-        for start in range(0, total_duration, segment_duration * 1000):
-            end = min(start + segment_duration * 1000, total_duration)
-            segment = audio[start:end]
-
-            # Salvar segmento temporário
-            temp_path = f"temp_segment_{len(segments)}.wav"
-            segment = segment.set_channels(1).set_frame_rate(16000)
-            segment.export(temp_path, format="wav")
-            segments.append({
-                'path': temp_path,
-                'start': start / 1000,  # converter para segundos
-                'end': end / 1000
-            })
-
-        logging.info(f"Split audio into {len(segments)} segments")
-        return segments
-    except Exception as e:
-        logging.error(f"Failed to split audio: {e}")
-        raise
-
-
-@timeout_decorator.timeout(60)  # timeout de 1 minuto por segmento
-def process_segment(segment_info, pipeline):
-    """Processa um único segmento de áudio"""
-    try:
-        diarization = pipeline(segment_info['path'])
-        speaker_segments = []
-
-        for turn, _, speaker in diarization.itertracks(yield_label=True):
-            # Ajustar tempos para o áudio original
-            speaker_segments.append({
-                'speaker': speaker,
-                'start': segment_info['start'] + turn.start,
-                'end': segment_info['start'] + turn.end
-            })
+def detect_speaker_changes(samples, min_silence_len=700, silence_thresh=-40):
+    """Detecta mudanças de falante baseado em silêncios"""
+    # Detectar períodos não silenciosos (versão vetorizada do detect_nonsilent)
+    with metrics.timer("vad", audio_seconds=duration_seconds(samples)):
+        nonsilent_ranges = detect_nonsilent_ranges(
+            samples,
+            min_silence_len=min_silence_len,  # 700ms de silêncio
+            silence_thresh=silence_thresh      # -40 dB
+        )
 
-        return speaker_segments
-    finally:
-        # Limpar arquivo temporário
-        if os.path.exists(segment_info['path']):
-            os.remove(segment_info['path'])
+    # Converter para o formato de segmentos; um gap maior que 1.4s alterna o falante
+    turns = SpeakerTurns(min_silence_len)
+    return [turns.segment(start, end) for start, end in nonsilent_ranges]
 
 
-def detect_speaker_changes(audio_segment, min_silence_len=700, silence_thresh=-40):
-    """Detecta mudanças de falante baseado em silêncios"""
-    # Detectar períodos não silenciosos
-    nonsilent_ranges = detect_nonsilent(
-        audio_segment,
-        min_silence_len=min_silence_len,  # 700ms de silêncio
-        silence_thresh=silence_thresh      # -40 dB
-    )
-
-    # Converter para o formato de segmentos
-    segments = []
-    current_speaker = 1
-    last_end = 0
-
-    for start, end in nonsilent_ranges:
-        # Se houver um gap significativo, considera mudança de falante
-        if start - last_end > min_silence_len * 2:  # Gap maior que 1.4s
-            current_speaker = (current_speaker % 2) + 1  # Alterna entre 1 e 2
-
-        segments.append({
-            'start': start / 1000.0,  # Converter para segundos
-            'end': end / 1000.0,
-            'speaker': f"SPEAKER_{current_speaker}"
-        })
-        last_end = end
-
-    return segments
-
-
-def process_audio_segments(audio_path):
-    """Processa o áudio identificando falantes por silêncio e transcrevendo"""
+def segment_from_line(line):
+    """Segmento gravado no journal (JSON; texto '[SPEAKER]: ...' em execuções antigas)"""
+    try:
+        return json.loads(line)
+    except ValueError:
+        speaker, _, text = line.partition("]: ")
+        return {'start': None, 'end': None, 'speaker': speaker.lstrip("["), 'text': text}
+
+
+def diarized_speech(model, samples, segments, diarization, registry=None, speaker_store=None):
+    """Palavras do Whisper atribuídas aos turnos do pyannote; produz (utterance, text)"""
+    # Cada modelo no seu estágio: diarize e align têm os próprios timers
+    with metrics.timer("transcribe", audio_seconds=duration_seconds(samples)):
+        words = list(transcribe_words(model, samples, segments))
+    turns = perform_diarization(samples, registry=registry, **diarization)
+    if speaker_store is not None:
+        # Falantes conhecidos já vêm com o nome salvo; os novos entram no banco
+        names = speaker_store.update(registry)
+        turns = [{**turn, 'speaker': names.get(turn['speaker'], turn['speaker'])} for turn in turns]
+    with metrics.timer("align", words=len(words), turns=len(turns)):
+        speech = align(words, turns)
+    logging.info(f"Aligned {len(words)} words with {len(turns)} speaker turns "
+                 f"into {len(speech)} utterances")
+    for utterance in speech:
+        yield utterance, utterance['text']
+
+
+def transcribe_speech(model, samples, segments, batch_size=0, diarization=None, registry=None,
+                      speaker_store=None):
+    """Transcreve os segmentos de um buffer: em janelas de até 30s, em lotes de
+    turnos de falante quando batch_size > 0, ou alinhando as palavras aos
+    turnos do pyannote quando há opções de diarização"""
+    if diarization is not None:
+        return diarized_speech(model, samples, segments, diarization, registry, speaker_store)
+    if batch_size > 0:
+        results = transcribe_turns(model, samples, segments, batch_size=batch_size)
+    else:
+        results = transcribe_windows(model, samples, segments)
+    # Geradores: só o tempo dentro do Whisper, não o de quem consome os segmentos
+    return metrics.timed(results, "transcribe", audio_seconds=duration_seconds(samples))
+
+
+def transcribe_blocks(model, audio_path, offset, block_seconds, batch_size=0, diarization=None,
+                      registry=None, speaker_store=None):
+    """Decodifica e transcreve em blocos: só um bloco fica em memória por vez"""
+    # Decodificação e VAD de cada bloco, fora do tempo da transcrição
+    blocks = metrics.timed(speech_blocks(audio_path, block_seconds=block_seconds), "decode")
+    for block_offset, samples, segments in blocks:
+        segments = [s for s in segments if s['end'] + block_offset > offset]
+        if not segments:
+            continue
+        for segment, text in transcribe_speech(model, samples, segments, batch_size,
+                                               diarization, registry, speaker_store):
+            yield shift(segment, block_offset), text
+
+
+def process_audio_segments(audio_path, model_size=DEFAULT_MODEL_SIZE, compute_type=None, cpu_threads=0,
+                           journal_path=None, batch_size=0, block_seconds=0, diarization=None,
+                           speaker_store=None, speech_map_method="off", dedup=None, journal_options=None):
+    """Processa o áudio identificando falantes (por silêncio, ou com o pyannote
+    quando diarization traz as opções de diarize) e transcrevendo.
+
+    Com speaker_store, a diarização parte dos falantes conhecidos e os
+    atualiza ao final. Com speech_map_method, só os trechos de fala do mapa
+    do arquivo são transcritos e diarizados (fora do modo em blocos, que já
+    corta nos silêncios). Com dedup, o que outra gravação já transcrita
+    cobre vem da transcrição dela e só o resto passa pelos modelos. O
+    journal só retoma o que foi feito com as mesmas journal_options.
+    """
     logging.info(f"Processing audio: {audio_path}")
 
     try:
-        # 1. Converter para WAV
-        wav_path = convert_audio_to_wav(audio_path)
-
-        # 2. Carregar o áudio
-        audio = AudioSegment.from_file(wav_path)
-
-        # 3. Detectar segmentos por falante
-        logging.info("Detecting speaker segments")
-        speaker_segments = detect_speaker_changes(audio)
-        logging.info(f"Found {len(speaker_segments)} segments")
-
-        # 4. Inicializar Whisper
-        logging.debug("Initializing Whisper model")
-        try:
-            model = WhisperModel("base", device="mps", compute_type="float16")
-            logging.info("Successfully initialized model with MPS")
-        except ValueError:
-            logging.info("Switching to CPU...")
-            model = WhisperModel("base", device="cpu", compute_type="float32")
-            logging.info("Successfully initialized model with CPU")
-
-        # 5. Transcrever cada segmento
-        final_transcription = []
-
-        for idx, segment in enumerate(speaker_segments, 1):
-            try:
-                # Extrair o segmento de áudio
-                start_ms = int(segment['start'] * 1000)
-                end_ms = int(segment['end'] * 1000)
-                audio_segment = audio[start_ms:end_ms]
-
-                # Salvar temporariamente
-                temp_path = f"temp_whisper_{idx}.wav"
-                audio_segment.export(temp_path, format="wav")
-
-                # Transcrever o segmento
-                logging.debug(
-                    f"Transcribing segment {idx} for {segment['speaker']}")
-                result = list(model.transcribe(temp_path, language="pt")[0])
-
-                # Combinar as transcrições do segmento
-                text = " ".join(s.text for s in result)
-                if text.strip():  # Só adiciona se tiver texto
-                    final_transcription.append(
-                        f"[{segment['speaker']}]: {text}")
-
-                # Limpar arquivo temporário
-                os.remove(temp_path)
-
-                logging.debug(
-                    f"Processed segment {idx}/{len(speaker_segments)}")
-
-            except Exception as e:
-                logging.error(f"Failed to process segment {idx}: {e}")
-                continue
-
-        # Limpar arquivo WAV temporário
-        os.remove(wav_path)
-
+        # Retomar do último segmento concluído, se houver checkpoint
+        journal = Journal(journal_path, journal_options) if journal_path else None
+        offset, lines = journal.resume_point(audio_path) if journal else (0.0, [])
+        if journal:
+            journal.start_file(audio_path, lines)
+        final_transcription = [segment_from_line(line) for line in lines]
+
+        # Obter o modelo Whisper residente
+        model = get_whisper_model(model_size, compute_type, cpu_threads)
+        registry = None
+        reused = None
+        if diarization is not None:
+            # Um só registro de falantes: os rótulos valem para a gravação inteira
+            registry = speaker_store.seed() if speaker_store is not None else SpeakerRegistry()
+
+        if block_seconds > 0:
+            # Gravações longas: decodificação, VAD e transcrição bloco a bloco
+            results = transcribe_blocks(model, audio_path, offset, block_seconds, batch_size,
+                                        diarization, registry, speaker_store)
+            total = "?"
+        else:
+            # 1. Decodificar uma única vez para PCM em memória
+            samples = decode_audio_file(audio_path)
+            remainder = None
+            if dedup is not None:
+                reused, regions = reuse_transcript(audio_path, samples, dedup)
+                if reused is not None and not regions:
+                    return reused
+                if reused is not None:
+                    remainder = SpeechMap(regions, duration_seconds(samples), "dedup")
+
+            # 2. Detectar segmentos por falante
+            logging.info("Detecting speaker segments")
+            speaker_segments = detect_speaker_changes(samples)
+            if speech_map_method != "off":
+                # Música e ruído acima do limiar de silêncio ficam de fora
+                speech = speech_map(audio_path, samples, speech_map_method)
+                speaker_segments = speech.clip(speaker_segments)
+                if diarization is not None:
+                    diarization = {**diarization, "speech": speech}
+            if remainder is not None:
+                # Só o que a outra gravação não cobre
+                speaker_segments = remainder.clip(speaker_segments)
+                if diarization is not None:
+                    # Com mapa de fala, o pyannote só vê a fala que a outra gravação não cobre
+                    speech = diarization.get("speech")
+                    diarization = {**diarization,
+                                   "speech": speech.intersect(remainder) if speech is not None else remainder}
+            speaker_segments = [s for s in speaker_segments if s['end'] > offset]
+            logging.info(f"Found {len(speaker_segments)} segments")
+
+            # 3. Transcrever direto do buffer em memória
+            results = transcribe_speech(model, samples, speaker_segments, batch_size,
+                                        diarization, registry, speaker_store)
+            total = len(speaker_segments)
+        start = time.perf_counter()
+        log_segment = SampledLog(every=50)
+        write_time = 0.0
+        idx = 0
+
+        for idx, (segment, text) in enumerate(results, 1):
+            line = None
+            if text:  # Só adiciona se tiver texto
+                final_transcription.append({'start': segment['start'], 'end': segment['end'],
+                                            'speaker': segment['speaker'], 'text': text})
+                line = json.dumps(final_transcription[-1], ensure_ascii=False)
+            if journal:
+                write_start = time.perf_counter()
+                journal.record_segment(audio_path, segment['end'], len(final_transcription), line)
+                write_time += time.perf_counter() - write_start
+            # Amostrado e formatado só quando emitido: não pesa no laço
+            log_segment("Processed segment %d/%s (%.1fs)", idx, total, segment['end'])
+
+        elapsed = time.perf_counter() - start
+        metrics.record_time("write", write_time)
+        metrics.count("segments", idx)
+
+        if reused:
+            # Linhas antigas do journal não têm tempos: vieram do começo já transcrito
+            final_transcription = sorted(final_transcription + reused,
+                                         key=lambda s: (s['start'] is not None, s['start'] or 0.0))
         logging.info(
-            f"Successfully processed {len(final_transcription)} segments")
-        return "\n".join(final_transcription)
+            f"Successfully processed {len(final_transcription)} segments in {elapsed:.2f}s")
+        return final_transcription
 
     except Exception as e:
         logging.error(f"Failed to process audio: {e}")
         raise
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Transcribe every file in audios/ with speaker segmentation")
+    add_model_arguments(parser)
+    add_batch_arguments(parser)
+    add_output_arguments(parser)
+    add_cache_arguments(parser)
+    add_metrics_arguments(parser)
+    add_store_arguments(parser)
+    add_long_audio_arguments(parser)
+    add_speaker_arguments(parser)
+    add_speech_map_arguments(parser)
+    add_fingerprint_arguments(parser)
+    parser.add_argument("--journal", default=DEFAULT_JOURNAL_PATH,
+                        help=f"Checkpoint journal used to resume interrupted runs (default: {DEFAULT_JOURNAL_PATH})")
+    parser.add_argument("--batch-size", type=int, default=0,
+                        help="Decode speaker turns in batches of this size (default: 0, one 30 s window at a time)")
+    parser.add_argument("--diarize", action="store_true",
+                        help="Label speakers with pyannote and align Whisper words to its turns "
+                             "instead of alternating speakers at long pauses")
+    parser.add_argument("--diarization-workers", type=int, default=1,
+                        help="Processes running pyannote on diarization chunks (default: 1)")
+    parser.add_argument("--diarization-chunk", type=float, default=CHUNK_SECONDS,
+                        help=f"Seconds of audio per diarization chunk (default: {CHUNK_SECONDS})")
+    parser.add_argument("--diarization-overlap", type=float, default=OVERLAP_SECONDS,
+                        help=f"Overlap between diarization chunks (default: {OVERLAP_SECONDS})")
+    parser.add_argument("--debug", action="store_true",
+                        help="Also write DEBUG messages to transcription_debug.log")
+    args = parser.parse_args()
+    if not 0 <= args.diarization_overlap < args.diarization_chunk:
+        parser.error("--diarization-overlap must be at least 0 and shorter than --diarization-chunk")
+    return args
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.debug:
+        enable_debug_log()
     logging.info("Starting transcription process...")
 
     try:
-        logging.info("Setting up required models and directories")
-
-        # Tentar inicializar o Pyannote e verificar se foi bem sucedido
-        if setup_pyannote_local() is None:
-            logging.error("Failed to initialize Pyannote pipeline")
-            raise RuntimeError("Failed to initialize Pyannote pipeline")
-
-        logging.info("All required models initialized successfully")
-
+        # O Pyannote só é carregado quando a diarização é usada (get_diarization_pipeline)
         logging.debug("Creating necessary directories")
         os.makedirs("audios", exist_ok=True)
         transcriptions_dir = "transcriptions"
         os.makedirs(transcriptions_dir, exist_ok=True)
+        stage_metrics = metrics.configure(args)
 
-        # Verificar se podemos escrever no diretório de transcrições
-        output_path = os.path.join(transcriptions_dir, "transcriptions.txt")
+        # Abrir o banco de transcrições já verifica se podemos escrever nele
         try:
-            with open(output_path, "a") as f:
-                f.write("")  # Teste de escrita
-            logging.info(
-                f"Successfully verified write access to {output_path}")
+            store = TranscriptStore(args.store)
         except Exception as e:
-            logging.error(f"Cannot write to transcriptions file: {e}")
+            logging.error(f"Cannot open the transcript store: {e}")
             raise
 
-        audio_files = os.listdir("audios")
+        audio_files = list_audio_files("audios")
         logging.info(f"Found {len(audio_files)} audio files to process")
-
-        for idx, file in enumerate(audio_files, 1):
-            logging.info(f"Processing file {idx}/{len(audio_files)}: {file}")
-            try:
-                audio_path = os.path.join("audios", file)
-                logging.debug(f"Full audio path: {audio_path}")
-
-                logging.info("Starting transcription process")
-                transcription = process_audio_segments(audio_path)
-
-                logging.debug(f"Saving transcription to: {output_path}")
-                with open(output_path, "a", encoding='utf-8') as f:
-                    f.write(f"\n# {file}\n\n{transcription}\n\n")
-                logging.info(f"Successfully saved transcription for {file}")
-
-            except Exception as e:
-                logging.error(f"Failed to process {file}: {e}")
-                logging.debug("Error details:", exc_info=True)
-                continue
-
+        engine = "faster-whisper+pyannote" if args.diarize else "faster-whisper+silence"
+
+        def save_transcription(audio_path, segments, error):
+            if error is not None:
+                return
+            file = os.path.basename(audio_path)
+            # Uma transação por arquivo: nada fica pela metade com vários workers
+            transcript_id = store.save(
+                audio_path, segments, engine, args.model_size, cache_options,
+                cache.audio_hash(audio_path) if cache is not None else None)
+            logging.info(f"Successfully saved transcription for {file} (#{transcript_id})")
+            # Saídas pedidas em --formats, gravadas pelo processo principal na ordem dos arquivos
+            save_segments(segments, create_sinks(args.formats, transcriptions_dir, audio_path,
+                                                 TRANSCRIPTIONS_FILE), audio_path)
+
+        audio_paths = [os.path.join("audios", file) for file in audio_files]
+
+        # Resultados em cache são gravados sem decodificar nem carregar modelos
+        cache = open_cache(args)
+        cache_options = {"model": args.model_size, "compute_type": args.compute_type,
+                         "language": "pt", "segmentation": "silence", "format": "segments",
+                         "decoding": "batched" if args.batch_size > 0 else "windows"}
+        diarization = None
+        if args.diarize:
+            # Workers do lote são daemon e não podem abrir outro pool de processos
+            if args.workers > 1 and args.diarization_workers > 1:
+                logging.warning("--diarization-workers is ignored with --workers > 1")
+                args.diarization_workers = 1
+            # A diarização precisa das palavras com tempo: usa sempre as janelas
+            diarization = {"workers": args.diarization_workers,
+                           "chunk_seconds": args.diarization_chunk,
+                           "overlap": args.diarization_overlap}
+            cache_options.update(segmentation="pyannote", decoding="windows")
+        # Falantes conhecidos trocam SPEAKER_NN anônimos por nomes estáveis
+        speaker_store = open_speaker_store(args) if args.diarize else None
+        if speaker_store is not None:
+            cache_options["speakers"] = "known"
+        if args.block_seconds > 0:
+            cache_options["block_seconds"] = args.block_seconds
+        elif args.speech_map != "off":
+            cache_options["speech_map"] = args.speech_map
+        # Cópias e trechos já transcritos em outra gravação são reaproveitados
+        dedup = dedup_options(args, engine, args.model_size) if args.block_seconds <= 0 else None
+        if dedup is not None:
+            cache_options["dedup"] = True
+
+        # Arquivos já concluídos numa execução anterior com as mesmas opções são pulados
+        journal = Journal(args.journal, cache_options)
+        journal.compact()
+        completed = [path for path in audio_paths if journal.is_done(path)]
+        if completed:
+            logging.info(f"Skipping {len(completed)} files completed in a previous run with these options")
+        audio_paths = [path for path in audio_paths if not journal.is_done(path)]
+
+        cache_keys = {}
+        if cache is not None:
+            hits, misses = cache.split(audio_paths, **cache_options)
+            for audio_path, transcription in hits:
+                save_transcription(audio_path, transcription, None)
+                journal.record_done(audio_path)
+            cache_keys = dict(misses)
+            audio_paths = [audio_path for audio_path, _ in misses]
+
+        def on_result(audio_path, transcription, error):
+            save_transcription(audio_path, transcription, error)
+            if error is None:
+                journal.record_done(audio_path)
+            if cache is not None and error is None:
+                cache.put(cache_keys[audio_path], audio_path, cache_options, transcription)
+
+        # Cada worker carrega o Whisper uma única vez e o mantém residente
+        cpu_threads = threads_per_worker(args.workers) if args.workers > 1 else 0
+        stats = run_batch(
+            audio_paths,
+            functools.partial(process_audio_segments, model_size=args.model_size,
+                              compute_type=args.compute_type, cpu_threads=cpu_threads,
+                              journal_path=args.journal, batch_size=args.batch_size,
+                              block_seconds=args.block_seconds, diarization=diarization,
+                              speaker_store=speaker_store, speech_map_method=args.speech_map,
+                              dedup=dedup, journal_options=cache_options),
+            workers=args.workers,
+            initializer=get_whisper_model,
+            initargs=(args.model_size, args.compute_type, cpu_threads),
+            memory_limit_mb=args.max_worker_memory,
+            on_result=on_result)
+
+        log_stats(stats)
+        if args.speech_map != "off" and args.block_seconds <= 0:
+            skipped, total = skipped_report(audio_paths, args.speech_map)
+            logging.info(f"Skipped {skipped:.1f}s of non-speech audio out of {total:.1f}s")
+        if cache is not None:
+            cache.log_stats()
+        if stage_metrics is not None:
+            stage_metrics.log_summary()
         logging.info("Transcription process completed successfully")
 
     except Exception as e:
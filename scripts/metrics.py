@@ -0,0 +1,239 @@
+"""Lightweight per-stage instrumentation.
+
+Stages (decode, vad, model_load, transcribe, write, ...) are wrapped in
+timers and counters that append one JSON record each to a metrics file. The
+file path travels to spawned batch workers through an environment variable,
+so every process writes to the same JSONL file with single O_APPEND writes.
+When no metrics file is configured every call is a cheap no-op.
+
+The optional Prometheus-style endpoint folds new JSONL records into running
+totals on each scrape, so it covers the workers as well as the parent.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_ENV = "TRANSCRIBER_METRICS"
+DEFAULT_METRICS_PATH = os.path.join("transcriptions", "metrics.jsonl")
+
+
+def metrics_path():
+    return os.environ.get(METRICS_ENV)
+
+
+def _emit(record):
+    path = metrics_path()
+    if not path:
+        return
+    record = {"ts": round(time.time(), 3), "pid": os.getpid(), **record}
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+def count(name, value=1, **labels):
+    """Add value to a counter (e.g. cache_hits, segments)"""
+    if value:
+        _emit({"type": "counter", "name": name, "value": value, **labels})
+
+
+def gauge(name, value, **labels):
+    """Record the current value of a gauge (e.g. queue_depth)"""
+    _emit({"type": "gauge", "name": name, "value": value, **labels})
+
+
+@contextmanager
+def timer(name, audio_seconds=None, **labels):
+    """Time a stage; the yielded dict can set audio_seconds once it is known"""
+    info = {"audio_seconds": audio_seconds, **labels}
+    if not metrics_path():
+        yield info
+        return
+    start = time.perf_counter()
+    try:
+        yield info
+    finally:
+        record_time(name, time.perf_counter() - start, **info)
+
+
+def timed(iterable, name, audio_seconds=None, **labels):
+    """Yield from iterable, timing only the work of producing the items.
+
+    Unlike timer() around a loop, what the consumer does between items
+    (other stages, writes) is left out of the stage.
+    """
+    if not metrics_path():
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    done = object()
+    seconds = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            item = next(iterator, done)
+            seconds += time.perf_counter() - start
+            if item is done:
+                return
+            yield item
+    finally:
+        record_time(name, seconds, audio_seconds, **labels)
+
+
+def record_time(name, seconds, audio_seconds=None, **labels):
+    """Record a stage duration measured elsewhere (e.g. summed over a loop)"""
+    record = {"type": "timer", "name": name, "seconds": round(seconds, 6),
+              "audio_seconds": audio_seconds, **labels}
+    if audio_seconds:
+        record["rtf"] = round(seconds / audio_seconds, 6)
+    _emit(record)
+
+
+class SampledLog:
+    """Log one in every `every` calls, formatting the message only when emitted.
+
+    Meant for per-segment progress lines in hot loops: arguments are passed
+    %-style so nothing is formatted for the calls that are skipped.
+    """
+
+    def __init__(self, every=50, level=logging.DEBUG):
+        self.every = every
+        self.level = level
+        self.calls = 0
+
+    def __call__(self, message, *args):
+        self.calls += 1
+        if (self.calls - 1) % self.every:
+            return
+        logger = logging.getLogger()
+        if logger.isEnabledFor(self.level):
+            logger.log(self.level, message, *args)
+
+
+class MetricsAggregator:
+    """Running totals over a metrics JSONL file, read incrementally"""
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.counters = {}
+        self.gauges = {}
+        self.timers = {}  # estágio -> {"count", "seconds", "audio_seconds"}
+        self.lock = threading.Lock()
+
+    def fold(self):
+        """Read the records appended since the last call"""
+        with self.lock:
+            if not os.path.exists(self.path):
+                return
+            with open(self.path, "rb") as f:
+                f.seek(self.offset)
+                data = f.read()
+            # Uma linha ainda sem "\n" está sendo escrita: fica para a próxima leitura
+            complete = data[:data.rfind(b"\n") + 1]
+            self.offset += len(complete)
+            for line in complete.splitlines():
+                try:
+                    self._add(json.loads(line))
+                except ValueError:
+                    continue
+
+    def _add(self, record):
+        name = record["name"]
+        if record["type"] == "counter":
+            self.counters[name] = self.counters.get(name, 0) + record["value"]
+        elif record["type"] == "gauge":
+            self.gauges[name] = record["value"]
+        elif record["type"] == "timer":
+            totals = self.timers.setdefault(name, {"count": 0, "seconds": 0.0, "audio_seconds": 0.0})
+            totals["count"] += 1
+            totals["seconds"] += record["seconds"]
+            totals["audio_seconds"] += record.get("audio_seconds") or 0.0
+
+    def render(self):
+        """Totals in the Prometheus text exposition format"""
+        self.fold()
+        lines = []
+        with self.lock:
+            for metric, kind, field in (("stage_runs_total", "counter", "count"),
+                                        ("stage_seconds_total", "counter", "seconds"),
+                                        ("stage_audio_seconds_total", "counter", "audio_seconds")):
+                lines.append(f"# TYPE transcriber_{metric} {kind}")
+                for stage, totals in sorted(self.timers.items()):
+                    lines.append(f'transcriber_{metric}{{stage="{stage}"}} {totals[field]}')
+            lines.append("# TYPE transcriber_stage_rtf gauge")
+            for stage, totals in sorted(self.timers.items()):
+                if totals["audio_seconds"]:
+                    lines.append(f'transcriber_stage_rtf{{stage="{stage}"}} '
+                                 f'{totals["seconds"] / totals["audio_seconds"]:.6f}')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE transcriber_{name}_total counter")
+                lines.append(f"transcriber_{name}_total {value}")
+            for name, value in sorted(self.gauges.items()):
+                lines.append(f"# TYPE transcriber_{name} gauge")
+                lines.append(f"transcriber_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def log_summary(self):
+        self.fold()
+        for stage, totals in sorted(self.timers.items()):
+            rtf = (f", RTF {totals['seconds'] / totals['audio_seconds']:.3f}"
+                   if totals["audio_seconds"] else "")
+            logging.info(f"Stage {stage}: {totals['count']} runs, {totals['seconds']:.2f}s{rtf}")
+        for name, value in sorted(self.counters.items()):
+            logging.info(f"Counter {name}: {value}")
+
+
+def serve(aggregator, port, host="127.0.0.1"):
+    """Serve aggregator.render() at /metrics from a daemon thread"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = aggregator.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # não poluir o log com cada scrape
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
+
+
+def configure(args):
+    """Enable metrics as set by add_metrics_arguments; returns an aggregator or None"""
+    path = args.metrics or (DEFAULT_METRICS_PATH if args.metrics_port else None)
+    if not path:
+        return None
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Herdado pelos workers criados com spawn
+    os.environ[METRICS_ENV] = path
+    aggregator = MetricsAggregator(path)
+    if os.path.exists(path):
+        aggregator.offset = os.path.getsize(path)  # só esta execução entra nos totais
+    if args.metrics_port:
+        serve(aggregator, args.metrics_port)
+    return aggregator
+
+
+def add_metrics_arguments(parser):
+    """Add the shared instrumentation options to an argparse parser"""
+    parser.add_argument("--metrics", default=None, metavar="PATH",
+                        help="Append per-stage timings and counters to this JSONL file")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve Prometheus-style metrics on this port "
+                             f"(records go to {DEFAULT_METRICS_PATH} unless --metrics is set)")
@@ -0,0 +1,87 @@
+"""Replay an audio file as a live stream, at real-time speed.
+
+Decodes the file to 16 kHz mono 16-bit PCM and sends it in small chunks,
+paced by the wall clock, either to stdout (to pipe into streaming.py
+--stdin) or to the WebSocket of streaming.py --port. In WebSocket mode the
+events are printed as they arrive, followed by the latency of the final
+segments.
+
+    python replay_stream.py meeting.wav | python streaming.py --stdin
+    python replay_stream.py meeting.wav --url ws://127.0.0.1:8766
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from audio_io import SAMPLE_RATE, load_audio, to_int16
+
+CHUNK_SECONDS = 0.1
+
+
+def pcm_chunks(path, chunk_seconds=CHUNK_SECONDS, speed=1.0):
+    """(delay, PCM bytes) pairs; delay is how long to wait before sending the chunk
+
+    The delays pace the chunks so that each one is sent when it would exist
+    in a live stream (times speed).
+    """
+    samples = to_int16(load_audio(path))
+    step = int(SAMPLE_RATE * chunk_seconds)
+    start = time.perf_counter()
+    for offset in range(0, len(samples), step):
+        due = start + offset / SAMPLE_RATE / speed
+        yield max(0.0, due - time.perf_counter()), samples[offset:offset + step].tobytes()
+
+
+def replay_stdout(path, chunk_seconds, speed):
+    out = sys.stdout.buffer
+    for delay, chunk in pcm_chunks(path, chunk_seconds, speed):
+        time.sleep(delay)
+        out.write(chunk)
+        out.flush()
+
+
+async def replay_websocket(path, url, chunk_seconds, speed):
+    import websockets
+
+    latencies = []
+    async with websockets.connect(url, max_size=None) as websocket:
+        async def receive():
+            async for message in websocket:
+                event = json.loads(message)
+                print(json.dumps(event, ensure_ascii=False), flush=True)
+                if event["type"] == "final":
+                    latencies.append(event["latency"])
+
+        receiver = asyncio.create_task(receive())
+        for delay, chunk in pcm_chunks(path, chunk_seconds, speed):
+            await asyncio.sleep(delay)
+            await websocket.send(chunk)
+        await websocket.send("end")
+        await receiver
+
+    if latencies:
+        latencies.sort()
+        print(f"{len(latencies)} final segments; latency mean {sum(latencies) / len(latencies):.2f}s, "
+              f"p90 {latencies[int(0.9 * (len(latencies) - 1))]:.2f}s, max {latencies[-1]:.2f}s",
+              file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Feed an audio file to streaming.py in real time")
+    parser.add_argument("audio", help="Audio file to replay (any format ffmpeg decodes)")
+    parser.add_argument("--url", help="WebSocket of streaming.py; default writes PCM to stdout")
+    parser.add_argument("--chunk", type=float, default=CHUNK_SECONDS,
+                        help=f"Seconds of audio per chunk (default: {CHUNK_SECONDS})")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Playback speed relative to real time (default: 1.0)")
+    args = parser.parse_args()
+
+    if args.url:
+        asyncio.run(replay_websocket(args.audio, args.url, args.chunk, args.speed))
+    else:
+        replay_stdout(args.audio, args.chunk, args.speed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Pack short speech segments into ~30 s windows and map words back to them.
+
+Whisper pads every call to a 30 s window, so transcribing each silence
+delimited segment on its own wastes most of the work. Adjacent segments are
+grouped into windows that are sliced as zero-copy views of the decoded
+buffer, transcribed with word timestamps, and each word is attributed back
+to the segment (and speaker) it falls in.
+"""
+import bisect
+import logging
+from audio_io import SAMPLE_RATE
+
+MAX_WINDOW_SECONDS = 30.0
+
+
+def pack_segments(segments, max_window=MAX_WINDOW_SECONDS):
+    """Group adjacent segments into windows spanning at most max_window seconds.
+
+    A segment longer than max_window gets a window of its own.
+    """
+    windows = []
+    current = []
+    for segment in segments:
+        if current and segment['end'] - current[0]['start'] > max_window:
+            windows.append(current)
+            current = []
+        current.append(segment)
+    if current:
+        windows.append(current)
+    return windows
+
+
+def window_view(samples, window, sampling_rate=SAMPLE_RATE):
+    """Slice of the decoded buffer covering a window (a view, not a copy)"""
+    start = int(window[0]['start'] * sampling_rate)
+    end = int(window[-1]['end'] * sampling_rate)
+    return samples[start:end]
+
+
+def assign_words(window, words, offset):
+    """Distribute words (relative to offset) over the segments of a window.
+
+    Each word goes to the segment containing its midpoint, or to the closest
+    segment when it falls in a gap. Returns one text per segment.
+    """
+    starts = [segment['start'] for segment in window]
+    texts = [[] for _ in window]
+    for word in words:
+        middle = offset + (word.start + word.end) / 2
+        idx = max(0, bisect.bisect_right(starts, middle) - 1)
+        # No silêncio entre dois segmentos, escolhe o mais próximo
+        if (middle > window[idx]['end'] and idx + 1 < len(window)
+                and window[idx + 1]['start'] - middle < middle - window[idx]['end']):
+            idx += 1
+        texts[idx].append(word.word)
+    return ["".join(text).strip() for text in texts]
+
+
+def window_words(model, samples, segments, language="pt",
+                 max_window=MAX_WINDOW_SECONDS, sampling_rate=SAMPLE_RATE):
+    """Transcribe segments window by window; yields (window, offset, words).
+
+    Word timestamps are relative to offset, the start of the window. Windows
+    that fail are logged and skipped.
+    """
+    for idx, window in enumerate(pack_segments(segments, max_window), 1):
+        offset = int(window[0]['start'] * sampling_rate) / sampling_rate
+        try:
+            result, _ = model.transcribe(window_view(samples, window, sampling_rate),
+                                         language=language, word_timestamps=True)
+            words = [word for segment in result for word in (segment.words or [])]
+        except Exception as e:
+            logging.error(f"Failed to process window {idx} ({offset:.1f}s): {e}")
+            continue
+        yield window, offset, words
+
+
+def transcribe_windows(model, samples, segments, language="pt",
+                       max_window=MAX_WINDOW_SECONDS, sampling_rate=SAMPLE_RATE):
+    """Transcribe segments window by window; yields (segment, text) pairs"""
+    for window, offset, words in window_words(model, samples, segments, language,
+                                              max_window, sampling_rate):
+        for segment, text in zip(window, assign_words(window, words, offset)):
+            yield segment, text
+
+
+def transcribe_words(model, samples, segments, language="pt",
+                     max_window=MAX_WINDOW_SECONDS, sampling_rate=SAMPLE_RATE):
+    """Words of all segments as {'start', 'end', 'word'} dicts on the buffer timeline"""
+    for _, offset, words in window_words(model, samples, segments, language,
+                                         max_window, sampling_rate):
+        for word in words:
+            yield {'start': offset + word.start, 'end': offset + word.end, 'word': word.word}
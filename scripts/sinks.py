@@ -0,0 +1,173 @@
+"""Output sinks for streamed transcription segments.
+
+A segment is a dict with 'start' and 'end' (seconds), 'text' and optionally
+'speaker'. Sinks write each segment as soon as it arrives and flush, so the
+outputs can be tailed while a long file is still being transcribed.
+"""
+import json
+import os
+import time
+import metrics
+
+FORMATS = ("txt", "jsonl", "srt", "vtt")
+TRANSCRIPTIONS_FILE = os.path.join("transcriptions", "transcriptions.txt")
+
+
+def format_timestamp(seconds, separator=","):
+    """HH:MM:SS,mmm (SRT) or HH:MM:SS.mmm (VTT)"""
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    secs, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{milliseconds:03d}"
+
+
+def segment_text(segment):
+    text = segment['text'].strip()
+    if segment.get('speaker'):
+        return f"[{segment['speaker']}]: {text}"
+    return text
+
+
+class Sink:
+    """Base sink: begin(source), write(segment) for each segment, end()"""
+
+    def __init__(self, path, mode="w"):
+        self.path = path
+        self.mode = mode
+        self.file = None
+
+    def begin(self, source):
+        self.file = open(self.path, self.mode, encoding='utf-8')
+
+    def write(self, segment):
+        raise NotImplementedError
+
+    def end(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _emit(self, text):
+        self.file.write(text)
+        self.file.flush()
+
+
+class TextSink(Sink):
+    """Appends '# file' followed by the segment texts to transcriptions.txt"""
+
+    def __init__(self, path):
+        super().__init__(path, mode="a")
+        self.first = True
+
+    def begin(self, source):
+        super().begin(source)
+        self.first = True
+        self._emit(f"# {os.path.basename(source)}\n\n")
+
+    def write(self, segment):
+        text = segment_text(segment)
+        if not text:
+            return
+        separator = "" if self.first else ("\n" if segment.get('speaker') else " ")
+        self._emit(separator + text)
+        self.first = False
+
+    def end(self):
+        if self.file is not None:
+            self._emit("\n\n")
+        super().end()
+
+
+class JsonlSink(Sink):
+    """One JSON object per segment"""
+
+    def begin(self, source):
+        super().begin(source)
+        self.source = os.path.basename(source)
+
+    def write(self, segment):
+        record = {"file": self.source, **segment}
+        self._emit(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class SrtSink(Sink):
+    def begin(self, source):
+        super().begin(source)
+        self.index = 0
+
+    def write(self, segment):
+        if segment['start'] is None:
+            # Sem tempos (API sem rótulos, journal antigo) não há legenda
+            return
+        self.index += 1
+        self._emit(f"{self.index}\n"
+                   f"{format_timestamp(segment['start'])} --> {format_timestamp(segment['end'])}\n"
+                   f"{segment_text(segment)}\n\n")
+
+
+class VttSink(Sink):
+    def begin(self, source):
+        super().begin(source)
+        self._emit("WEBVTT\n\n")
+
+    def write(self, segment):
+        if segment['start'] is None:
+            return
+        self._emit(f"{format_timestamp(segment['start'], '.')} --> "
+                   f"{format_timestamp(segment['end'], '.')}\n"
+                   f"{segment_text(segment)}\n\n")
+
+
+def create_sinks(formats, output_dir, source, text_path=None):
+    """Sinks for the requested formats; per-file outputs are named after source.
+
+    The shared text file is only written when text_path is given.
+    """
+    base = os.path.join(output_dir, os.path.splitext(os.path.basename(source))[0])
+    sinks = []
+    for output_format in formats:
+        if output_format == "txt":
+            if text_path is not None:
+                sinks.append(TextSink(text_path))
+        elif output_format == "jsonl":
+            sinks.append(JsonlSink(base + ".jsonl"))
+        elif output_format == "srt":
+            sinks.append(SrtSink(base + ".srt"))
+        elif output_format == "vtt":
+            sinks.append(VttSink(base + ".vtt"))
+        else:
+            raise ValueError(f"Unknown output format: {output_format}")
+    return sinks
+
+
+def write_segments(segments, sinks, source):
+    """Drain a segment generator into every sink; yields segments through"""
+    for sink in sinks:
+        sink.begin(source)
+    # Só o tempo gasto nos sinks, não o do gerador de segmentos
+    write_time = 0.0
+    try:
+        for segment in segments:
+            start = time.perf_counter()
+            for sink in sinks:
+                sink.write(segment)
+            write_time += time.perf_counter() - start
+            yield segment
+    finally:
+        for sink in sinks:
+            sink.end()
+        metrics.record_time("write", write_time)
+
+
+def save_segments(segments, sinks, source):
+    """Write the segments of a finished file to every sink at once"""
+    for _ in write_segments(iter(segments), sinks, source):
+        pass
+
+
+def add_output_arguments(parser):
+    """Add the shared output format option to an argparse parser"""
+    parser.add_argument("--formats", nargs="*", choices=FORMATS, default=[],
+                        help="Outputs to write as segments arrive, besides the transcript store "
+                             "(txt appends to transcriptions.txt)")
@@ -0,0 +1,226 @@
+"""Known speakers, kept across meetings.
+
+pyannote labels speakers anonymously on every run, so the same team shows
+up as SPEAKER_00/01 in a different order each week. This store keeps one
+centroid embedding per speaker seen so far: a float32 matrix (one row per
+speaker) and its index in speakers.json (name, accumulated speech seconds,
+meetings, last update), in transcriptions/speakers/ by default. Every save
+writes a new matrix file and then swaps the index to point to it, so a
+crash never leaves the index and the rows out of step.
+
+Before diarizing, the known centroids seed the SpeakerRegistry that
+reconciles the chunk labels, so every local speaker is matched against the
+known ones with one vectorized cosine similarity and takes their name; only
+unmatched speakers get a new SPEAKER_NN, numbered after the ones already
+known. After diarizing, the centroids of the run are merged back into the
+store. Known speakers can be renamed from the command line, and the new
+name is used from the next run on:
+
+    python speaker_store.py list
+    python speaker_store.py rename SPEAKER_03 "Ana"
+"""
+import argparse
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import time
+import numpy as np
+from diarization import SpeakerRegistry
+
+DEFAULT_SPEAKERS_DIR = os.path.join("transcriptions", "speakers")
+
+# Peso máximo (segundos de fala) de um centróide: reuniões novas continuam
+# movendo o centróide em vez de serem diluídas por meses de histórico
+MAX_WEIGHT = 600.0
+
+
+class SpeakerStore:
+    """Speaker centroids on disk; seed() before diarizing and update() after"""
+
+    def __init__(self, directory=DEFAULT_SPEAKERS_DIR, max_weight=MAX_WEIGHT):
+        self.directory = directory
+        self.max_weight = max_weight
+        self.index_path = os.path.join(directory, "speakers.json")
+        os.makedirs(directory, exist_ok=True)
+        self._start_recording()
+
+    def _start_recording(self):
+        # Centróides e pesos de cada rótulo no momento do último seed/update
+        self._seeds = {}
+        # Rótulo do registro -> nome salvo (difere se dois processos criaram o mesmo)
+        self._names = {}
+        # Falantes cuja contagem de reuniões já inclui esta gravação
+        self._counted = set()
+
+    @contextlib.contextmanager
+    def _locked(self, operation=fcntl.LOCK_EX):
+        """Lock for concurrent batch workers: exclusive around read-merge-write,
+        shared (LOCK_SH) around plain reads, so a save cannot remove the
+        matrix file between reading the index and loading it"""
+        with open(os.path.join(self.directory, ".lock"), "a") as lock:
+            fcntl.flock(lock, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def load(self):
+        """(index dict, centroid matrix) as currently on disk"""
+        if not os.path.exists(self.index_path):
+            return {"next_id": 0, "generation": 0, "speakers": []}, np.empty((0, 0), dtype=np.float32)
+        with open(self.index_path, encoding="utf-8") as f:
+            index = json.load(f)
+        return index, np.load(os.path.join(self.directory, index["matrix"]))
+
+    def _save(self, index, matrix):
+        previous = index.get("matrix")
+        index["generation"] += 1
+        index["matrix"] = f"speakers-{index['generation']}.npy"
+        # Matriz nova primeiro; o índice só passa a apontar para ela no os.replace
+        np.save(os.path.join(self.directory, index["matrix"]), np.asarray(matrix, dtype=np.float32))
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, self.index_path)
+        if previous:
+            os.remove(os.path.join(self.directory, previous))
+
+    def seed(self, registry=None):
+        """A SpeakerRegistry (or the given one) preloaded with the known speakers.
+
+        Call once per recording, before diarizing it.
+        """
+        registry = registry or SpeakerRegistry()
+        self._start_recording()
+        with self._locked(fcntl.LOCK_SH):
+            index, matrix = self.load()
+        for speaker, centroid in zip(index["speakers"], matrix):
+            registry.add(speaker["name"], centroid, speaker["weight"])
+            self._seeds[speaker["name"]] = (np.asarray(centroid, dtype=np.float64), speaker["weight"])
+        registry.next_index = max(registry.next_index, index["next_id"])
+        if index["speakers"]:
+            logging.info(f"Seeded diarization with {len(index['speakers'])} known speakers")
+        return registry
+
+    def update(self, registry):
+        """Merge the registry centroids into the store; returns {label: stored name}.
+
+        Only what the run added since the last seed/update is merged, so
+        calling it after every block of a recording counts each turn once.
+        """
+        with self._locked():
+            index, matrix = self.load()
+            rows = {speaker["name"]: row for row, speaker in enumerate(index["speakers"])}
+            centroids = list(matrix)
+            now = time.time()
+            for label, centroid, weight in zip(registry.labels, registry.centroids, registry.weights):
+                seed_centroid, seed_weight = self._seeds.get(label, (0.0, 0.0))
+                added = weight - seed_weight
+                if added <= 0:
+                    continue
+                # Só a contribuição desta execução: outro processo pode ter
+                # atualizado o mesmo falante depois do seed
+                contribution = (centroid * weight - seed_centroid * seed_weight) / added
+                name = self._names.get(label, label)
+                if label not in self._seeds and name in rows and label not in self._names:
+                    # Rótulo novo que outro processo já salvou: pega o próximo número
+                    name = f"SPEAKER_{index['next_id']:02d}"
+                self._names[label] = name
+                row = rows.get(name)
+                if row is None:
+                    rows[name] = len(centroids)
+                    centroids.append(contribution)
+                    index["speakers"].append({"name": name, "weight": min(added, self.max_weight),
+                                              "meetings": 1, "created": now, "updated": now})
+                else:
+                    speaker = index["speakers"][row]
+                    total = speaker["weight"] + added
+                    centroids[row] = (centroids[row] * speaker["weight"] + contribution * added) / total
+                    speaker["weight"] = min(total, self.max_weight)
+                    if name not in self._counted:
+                        speaker["meetings"] += 1
+                    speaker["updated"] = now
+                self._counted.add(name)
+                if name.startswith("SPEAKER_") and name[8:].isdigit():
+                    index["next_id"] = max(index["next_id"], int(name[8:]) + 1)
+                self._seeds[label] = (np.asarray(centroid, dtype=np.float64), weight)
+            if centroids:
+                self._save(index, np.stack(centroids))
+        return {label: self._names.get(label, label) for label in registry.labels}
+
+    def rename(self, old, new):
+        with self._locked():
+            index, matrix = self.load()
+            names = [speaker["name"] for speaker in index["speakers"]]
+            if old not in names:
+                raise KeyError(old)
+            if new in names:
+                raise ValueError(f"{new} already exists")
+            index["speakers"][names.index(old)]["name"] = new
+            self._save(index, matrix)
+
+    def remove(self, name):
+        with self._locked():
+            index, matrix = self.load()
+            names = [speaker["name"] for speaker in index["speakers"]]
+            if name not in names:
+                raise KeyError(name)
+            row = names.index(name)
+            del index["speakers"][row]
+            self._save(index, np.delete(matrix, row, axis=0))
+
+
+def add_speaker_arguments(parser):
+    """Add the known-speaker store options to an argparse parser"""
+    parser.add_argument("--speakers", default=DEFAULT_SPEAKERS_DIR,
+                        help=f"Known speaker embeddings, matched and updated by --diarize "
+                             f"(default: {DEFAULT_SPEAKERS_DIR})")
+    parser.add_argument("--no-known-speakers", action="store_true",
+                        help="Label speakers anonymously, without reading or updating --speakers")
+
+
+def open_speaker_store(args):
+    """Speaker store configured by add_speaker_arguments, or None when disabled"""
+    if args.no_known_speakers:
+        return None
+    return SpeakerStore(args.speakers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the known speakers")
+    parser.add_argument("--speakers", default=DEFAULT_SPEAKERS_DIR,
+                        help=f"Speaker store directory (default: {DEFAULT_SPEAKERS_DIR})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List the known speakers")
+    rename = commands.add_parser("rename", help="Give a known speaker a name")
+    rename.add_argument("old")
+    rename.add_argument("new")
+    remove = commands.add_parser("remove", help="Forget a speaker")
+    remove.add_argument("name")
+    args = parser.parse_args()
+
+    store = SpeakerStore(args.speakers)
+    try:
+        if args.command == "list":
+            with store._locked(fcntl.LOCK_SH):
+                index, _ = store.load()
+            for speaker in index["speakers"]:
+                updated = time.strftime("%Y-%m-%d %H:%M", time.localtime(speaker["updated"]))
+                print(f"{speaker['name']:<20} {speaker['weight']:6.0f}s  "
+                      f"{speaker['meetings']:3d} meetings  last {updated}")
+        elif args.command == "rename":
+            store.rename(args.old, args.new)
+            print(f"{args.old} is now {args.new}")
+        elif args.command == "remove":
+            store.remove(args.name)
+            print(f"Removed {args.name}")
+    except KeyError as e:
+        parser.exit(1, f"Unknown speaker {e}\n")
+    except ValueError as e:
+        parser.exit(1, f"{e}\n")
+
+
+if __name__ == "__main__":
+    main()
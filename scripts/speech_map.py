@@ -0,0 +1,227 @@
+"""Speech/non-speech map of a recording, computed once and reused.
+
+Meetings often start and end with minutes of silence, music or screen-share
+noise. A cheap pre-pass finds the regions that contain speech (Silero VAD
+from faster-whisper when available, the silence segmenter otherwise), pads
+and merges them, and saves them as a small JSON file. Transcription and
+diarization then run only on the speech regions, concatenated into one
+buffer, and their timestamps are mapped back to the original timeline.
+
+Maps are kept in transcriptions/speech_maps/, one per audio file, and are
+recomputed when the file changes (size or mtime) or another method is
+asked for. audios/ stays untouched: every file there is taken as audio.
+"""
+import bisect
+import json
+import logging
+import os
+import time
+import numpy as np
+from audio_io import SAMPLE_RATE
+import metrics
+
+DEFAULT_MAP_DIR = os.path.join("transcriptions", "speech_maps")
+METHODS = ("auto", "silero", "energy")
+
+# Margem mantida em volta de cada trecho de fala
+PAD_SECONDS = 0.3
+# Pausas menores que isto ficam dentro do trecho (não corta palavras)
+MIN_GAP_SECONDS = 1.0
+
+
+def silero_regions(samples, sampling_rate=SAMPLE_RATE):
+    """Speech regions (seconds) found by the Silero VAD bundled with faster-whisper"""
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+    options = VadOptions(min_silence_duration_ms=int(MIN_GAP_SECONDS * 1000), speech_pad_ms=0)
+    return [(chunk['start'] / sampling_rate, chunk['end'] / sampling_rate)
+            for chunk in get_speech_timestamps(samples, options)]
+
+
+def energy_regions(samples, sampling_rate=SAMPLE_RATE):
+    """Non-silent regions (seconds); cannot tell music from speech"""
+    from vad import detect_nonsilent_ranges
+    return [(start / 1000, end / 1000) for start, end in
+            detect_nonsilent_ranges(samples, int(MIN_GAP_SECONDS * 1000), -40, sampling_rate)]
+
+
+def tidy(regions, duration, pad=PAD_SECONDS, min_gap=MIN_GAP_SECONDS):
+    """Pad regions, clip them to the recording and merge the close ones"""
+    merged = []
+    for start, end in sorted(regions):
+        start, end = max(0.0, start - pad), min(duration, end + pad)
+        if merged and start - merged[-1][1] < min_gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        elif end > start:
+            merged.append([start, end])
+    return [(round(start, 3), round(end, 3)) for start, end in merged]
+
+
+class SpeechMap:
+    """Speech regions of a recording and the mapping to/from their concatenation"""
+
+    def __init__(self, regions, duration, method):
+        self.regions = [tuple(region) for region in regions]
+        self.duration = duration
+        self.method = method
+        # Início de cada região no áudio concatenado (arredondado: as
+        # junções precisam bater com os tempos devolvidos pelos modelos)
+        self.offsets = [0.0]
+        for start, end in self.regions:
+            self.offsets.append(round(self.offsets[-1] + end - start, 6))
+
+    @property
+    def speech_seconds(self):
+        return self.offsets[-1]
+
+    @property
+    def skipped_seconds(self):
+        return self.duration - self.speech_seconds
+
+    def collect(self, samples, sampling_rate=SAMPLE_RATE):
+        """Only the speech regions of a buffer, back to back"""
+        if not self.regions:
+            return samples[:0]
+        return np.concatenate([samples[int(start * sampling_rate):int(end * sampling_rate)]
+                               for start, end in self.regions])
+
+    def to_original(self, t, end=False):
+        """Time in the concatenated speech -> time in the recording.
+
+        A time on a junction is the start of the next region, or the end of
+        the previous one when end is set.
+        """
+        if not self.regions:
+            return t
+        position = bisect.bisect_left(self.offsets, t) if end else bisect.bisect_right(self.offsets, t)
+        idx = max(0, min(position - 1, len(self.regions) - 1))
+        return round(self.regions[idx][0] + t - self.offsets[idx], 6)
+
+    def map_segment(self, segment):
+        """A transcribed segment (and its words) on the recording timeline (kept whole)"""
+        mapped = {**segment, 'start': self.to_original(segment['start']),
+                  'end': self.to_original(segment['end'], end=True)}
+        if 'words' in segment:
+            mapped['words'] = [{**word, 'start': self.to_original(word['start']),
+                                'end': self.to_original(word['end'], end=True)}
+                               for word in segment['words']]
+        return mapped
+
+    def remap(self, segments):
+        """Segments of the concatenated speech on the recording timeline.
+
+        A segment that spans a junction between two regions is split there,
+        so it never covers the audio that was skipped.
+        """
+        remapped = []
+        for segment in segments:
+            first = max(0, bisect.bisect_right(self.offsets, segment['start']) - 1)
+            last = max(first, bisect.bisect_left(self.offsets, segment['end']) - 1)
+            for idx in range(first, min(last, len(self.regions) - 1) + 1):
+                start = max(segment['start'], self.offsets[idx])
+                end = min(segment['end'], self.offsets[idx + 1])
+                if end > start or segment['start'] == segment['end']:
+                    shift = self.regions[idx][0] - self.offsets[idx]
+                    remapped.append({**segment, 'start': round(start + shift, 6),
+                                     'end': round(end + shift, 6)})
+        return remapped
+
+    def clip(self, segments):
+        """Original-timeline segments cut down to the speech regions"""
+        starts = [start for start, _ in self.regions]
+        clipped = []
+        for segment in segments:
+            idx = max(0, bisect.bisect_right(starts, segment['start']) - 1)
+            while idx < len(self.regions) and self.regions[idx][0] < segment['end']:
+                start = max(segment['start'], self.regions[idx][0])
+                end = min(segment['end'], self.regions[idx][1])
+                if end > start:
+                    clipped.append({**segment, 'start': start, 'end': end})
+                idx += 1
+        return clipped
+
+    def intersect(self, other):
+        """Map of the audio inside the regions of both maps"""
+        both = self.clip([{'start': start, 'end': end} for start, end in other.regions])
+        return SpeechMap([(segment['start'], segment['end']) for segment in both], self.duration,
+                         f"{self.method}+{other.method}")
+
+    def to_json(self, audio_path):
+        stat = os.stat(audio_path)
+        return {"file": os.path.basename(audio_path), "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns, "method": self.method,
+                "duration": self.duration, "regions": self.regions}
+
+
+def map_path(audio_path, directory=DEFAULT_MAP_DIR):
+    return os.path.join(directory, os.path.basename(audio_path) + ".speech.json")
+
+
+def load_map(audio_path, method="auto", directory=DEFAULT_MAP_DIR):
+    """Saved map of a file, or None when missing or stale"""
+    try:
+        with open(map_path(audio_path, directory), encoding="utf-8") as f:
+            saved = json.load(f)
+        stat = os.stat(audio_path)
+    except (OSError, ValueError):
+        return None
+    if (saved["size"], saved["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+        return None
+    if method != "auto" and saved["method"] != method:
+        return None
+    return SpeechMap(saved["regions"], saved["duration"], saved["method"])
+
+
+def compute_map(samples, method="auto", sampling_rate=SAMPLE_RATE):
+    duration = len(samples) / sampling_rate
+    regions = None
+    if method in ("auto", "silero"):
+        try:
+            regions, method = silero_regions(samples, sampling_rate), "silero"
+        except ImportError as e:
+            if method == "silero":
+                raise
+            logging.debug(f"Silero VAD unavailable ({e}), using the energy speech map")
+    if regions is None:
+        regions, method = energy_regions(samples, sampling_rate), "energy"
+    return SpeechMap(tidy(regions, duration), duration, method)
+
+
+def speech_map(audio_path, samples, method="auto", directory=DEFAULT_MAP_DIR,
+               sampling_rate=SAMPLE_RATE):
+    """Map of a decoded file: the saved one when still valid, else computed and saved"""
+    start = time.perf_counter()
+    result = load_map(audio_path, method, directory)
+    if result is None:
+        with metrics.timer("speech_map", audio_seconds=len(samples) / sampling_rate):
+            result = compute_map(samples, method, sampling_rate)
+        os.makedirs(directory, exist_ok=True)
+        path = map_path(audio_path, directory)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(result.to_json(audio_path), f)
+        os.replace(temp_path, path)
+    metrics.count("skipped_seconds", round(result.skipped_seconds, 3))
+    logging.info(
+        f"Speech map ({result.method}) of {os.path.basename(audio_path)}: "
+        f"{result.speech_seconds:.1f}s of speech in {len(result.regions)} regions, "
+        f"skipping {result.skipped_seconds:.1f}s of {result.duration:.1f}s "
+        f"({time.perf_counter() - start:.2f}s)")
+    return result
+
+
+def skipped_report(audio_paths, method="auto", directory=DEFAULT_MAP_DIR):
+    """(skipped seconds, total seconds) over the saved maps of these files"""
+    skipped = total = 0.0
+    for audio_path in audio_paths:
+        saved = load_map(audio_path, method, directory)
+        if saved is not None:
+            skipped += saved.skipped_seconds
+            total += saved.duration
+    return skipped, total
+
+
+def add_speech_map_arguments(parser):
+    parser.add_argument("--speech-map", choices=("off",) + METHODS, default="off",
+                        help="Send only the speech regions of each file to the models: "
+                             "auto (Silero VAD, else silence detection), silero or energy "
+                             "(default: off)")
@@ -0,0 +1,300 @@
+"""Real-time transcription of a live PCM stream.
+
+Audio arrives as 16 kHz mono 16-bit little-endian PCM, either on stdin or as
+binary messages on a local WebSocket. It is appended to a rolling buffer and
+run through the streaming silence segmenter. Each time a stretch of speech
+is closed by a pause, that stretch alone is transcribed and emitted as a
+final segment, and the buffer is trimmed. While speech is still going on,
+the uncommitted tail is re-transcribed about once per --partial-interval and
+emitted as a partial segment. Speech that runs past --max-buffer without a
+pause is committed anyway, so Whisper never sees more than one window.
+
+Events are JSON objects, one per line on stdout (or one per WebSocket text
+message):
+
+    {"type": "partial", "start": 12.3, "end": 14.1, "text": "..."}
+    {"type": "final", "start": 12.3, "end": 15.0, "text": "...", "latency": 0.8}
+
+latency is how long after the audio that closed it arrived the final segment
+was emitted.
+
+    ffmpeg -i meeting.webm -f s16le -ac 1 -ar 16000 - | python streaming.py --stdin
+    python streaming.py --port 8766
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import numpy as np
+from audio_io import SAMPLE_RATE
+from sinks import add_output_arguments, create_sinks
+from vad import SilenceSegmenter
+from whisper_models import add_model_arguments, get_whisper_model, transcribe_segments
+import metrics
+
+# Logs vão para stderr: stdout carrega os eventos
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stderr)
+    ]
+)
+
+MIN_SILENCE_MS = 500
+SILENCE_THRESH = -40
+PARTIAL_INTERVAL = 1.0
+MAX_BUFFER_SECONDS = 20.0
+# Margem de áudio mantida antes e depois de cada trecho de fala
+PAD_SECONDS = 0.2
+# Texto confirmado passado como contexto ao Whisper
+PROMPT_CHARS = 200
+
+
+class StreamingTranscriber:
+    """Rolling-buffer transcriber; feed() PCM chunks and collect events"""
+
+    def __init__(self, model, language="pt", sampling_rate=SAMPLE_RATE,
+                 min_silence_len=MIN_SILENCE_MS, silence_thresh=SILENCE_THRESH,
+                 partial_interval=PARTIAL_INTERVAL, max_buffer=MAX_BUFFER_SECONDS):
+        self.model = model
+        self.language = language
+        self.sampling_rate = sampling_rate
+        self.partial_interval = partial_interval
+        self.max_buffer = max_buffer
+        self.segmenter = SilenceSegmenter(min_silence_len, silence_thresh, sampling_rate)
+        self.threshold = 10 ** (silence_thresh / 20)
+
+        self.buffer = np.empty(0, dtype=np.float32)
+        self.buffer_offset = 0   # índice absoluto (amostras) de buffer[0]
+        self.committed = 0       # tudo antes disto já foi emitido como final
+        self.received = 0        # total de amostras recebidas
+        self.received_at = None  # relógio quando a última amostra chegou
+        self.last_partial = 0
+        self.context = ""
+        self.carry = b""         # byte ímpar do último pedaço, metade de uma amostra
+
+    def _seconds(self, samples):
+        return samples / self.sampling_rate
+
+    def _view(self, start, end):
+        return self.buffer[start - self.buffer_offset:end - self.buffer_offset]
+
+    def _transcribe(self, start, end, **options):
+        """Segments of [start, end) (absolute samples) on the stream timeline"""
+        offset = self._seconds(start)
+        for segment in transcribe_segments(self.model, self._view(start, end), self.language,
+                                           condition_on_previous_text=False, **options):
+            if segment['text']:
+                yield {"start": round(offset + segment['start'], 2),
+                       "end": round(offset + segment['end'], 2), "text": segment['text']}
+
+    def _commit(self, end):
+        """Emit [committed, end) as final segments and drop it from the buffer"""
+        events = []
+        if end > self.committed:
+            start = time.perf_counter()
+            segments = list(self._transcribe(self.committed, end,
+                                             initial_prompt=self.context[-PROMPT_CHARS:] or None))
+            # Atraso em relação ao momento em que o áudio até `end` chegou
+            latency = time.time() - self.received_at + self._seconds(self.received - end)
+            for segment in segments:
+                events.append({"type": "final", **segment, "latency": round(latency, 2)})
+                self.context += " " + segment['text']
+            audio_seconds = self._seconds(end - self.committed)
+            metrics.record_time("stream_commit", time.perf_counter() - start,
+                                audio_seconds=audio_seconds)
+            self.committed = end
+        # Só o que ainda não foi confirmado continua no buffer
+        self.buffer = self.buffer[self.committed - self.buffer_offset:]
+        self.buffer_offset = self.committed
+        self.last_partial = max(self.last_partial, self.committed)
+        return events
+
+    def _has_speech(self, start, end):
+        """Whether any 100 ms frame of [start, end) is above the silence threshold"""
+        view = self._view(start, end)
+        frame = self.sampling_rate // 10
+        frames = len(view) // frame
+        if frames == 0:
+            return len(view) > 0 and np.sqrt(np.mean(view ** 2)) > self.threshold
+        energy = (view[:frames * frame].astype(np.float64) ** 2).reshape(frames, frame).mean(axis=1)
+        return bool(np.sqrt(energy.max()) > self.threshold)
+
+    def feed(self, pcm):
+        """Consume 16-bit PCM bytes (or a sample array); returns new events"""
+        if isinstance(pcm, (bytes, bytearray)):
+            # Mensagens podem cortar uma amostra ao meio: o byte que sobra vai
+            # para o próximo pedaço, senão o resto do stream sairia desalinhado
+            pcm = self.carry + pcm
+            usable = len(pcm) // 2 * 2
+            self.carry = bytes(pcm[usable:])
+            samples = np.frombuffer(pcm, dtype=np.int16, count=usable // 2)
+        else:
+            samples = np.asarray(pcm)
+        if samples.dtype == np.int16:
+            samples = samples.astype(np.float32) / 32768
+        self.buffer = np.concatenate([self.buffer, samples.astype(np.float32)])
+        self.received += len(samples)
+        self.received_at = time.time()
+
+        events = []
+        pad = int(PAD_SECONDS * self.sampling_rate)
+        for start_ms, end_ms in self.segmenter.feed(samples):
+            end = min(end_ms * self.sampling_rate // 1000 + pad, self.received)
+            start = start_ms * self.sampling_rate // 1000 - pad
+            if start > self.committed:
+                # Silêncio antes da fala não precisa ser transcrito
+                self.committed = min(start, end)
+            events += self._commit(end)
+
+        if self._seconds(self.received - self.committed) >= self.max_buffer:
+            if not self._has_speech(self.committed, self.received):
+                # Só silêncio: descarta sem transcrever (evita alucinações do Whisper)
+                self.committed = self.received
+            events += self._commit(self.received)
+        elif (self._seconds(self.received - self.last_partial) >= self.partial_interval
+                and self._has_speech(self.committed, self.received)):
+            self.last_partial = self.received
+            text = " ".join(s['text'] for s in self._transcribe(self.committed, self.received,
+                                                                beam_size=1))
+            if text:
+                events.append({"type": "partial", "start": round(self._seconds(self.committed), 2),
+                               "end": round(self._seconds(self.received), 2), "text": text})
+        return events
+
+    def finish(self):
+        """Flush the stream: everything still buffered becomes final"""
+        events = []
+        if self._has_speech(self.committed, self.received):
+            events += self._commit(self.received)
+        return events
+
+
+class EventWriter:
+    """Print events as JSON lines and write final segments to the sinks"""
+
+    def __init__(self, sinks=(), source="stream"):
+        self.sinks = list(sinks)
+        self.latencies = []
+        for sink in self.sinks:
+            sink.begin(source)
+
+    def __call__(self, events, send=None):
+        for event in events:
+            if event["type"] == "final":
+                self.latencies.append(event["latency"])
+                for sink in self.sinks:
+                    sink.write(event)
+            line = json.dumps(event, ensure_ascii=False)
+            if send is None:
+                print(line, flush=True)
+            else:
+                send(line)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.end()
+        if self.latencies:
+            logging.info(f"{len(self.latencies)} final segments, latency "
+                         f"mean {np.mean(self.latencies):.2f}s, max {max(self.latencies):.2f}s")
+
+
+def run_stdin(engine, writer, chunk_bytes=3200):
+    """Read PCM from stdin until EOF (3200 bytes = 100 ms)"""
+    stream = sys.stdin.buffer
+    while True:
+        data = stream.read(chunk_bytes)
+        if not data:
+            break
+        writer(engine.feed(data))
+    writer(engine.finish())
+
+
+async def serve_websocket(make_engine, make_writer, host, port):
+    """One engine per connection: binary messages are PCM, "end" flushes"""
+    import websockets
+
+    async def handle(websocket):
+        engine, writer = make_engine(), make_writer()
+        logging.info("Stream connected")
+        pending = []
+        finished = False
+        try:
+            async for message in websocket:
+                if isinstance(message, str):
+                    if message.strip() != "end":
+                        continue
+                    events = await asyncio.to_thread(engine.finish)
+                    finished = True
+                else:
+                    events = await asyncio.to_thread(engine.feed, message)
+                writer(events, pending.append)
+                for line in pending:
+                    await websocket.send(line)
+                pending.clear()
+                if finished:
+                    break
+        finally:
+            if not finished:
+                # Conexão caiu: confirma o resto só para os arquivos de saída
+                writer(engine.finish(), pending.append)
+            writer.close()
+            logging.info("Stream closed")
+
+    async with websockets.serve(handle, host, port, max_size=None):
+        logging.info(f"Streaming transcription on ws://{host}:{port}")
+        await asyncio.Future()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Transcribe a live 16 kHz mono PCM stream")
+    add_model_arguments(parser)
+    add_output_arguments(parser)
+    parser.set_defaults(formats=[])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--stdin", action="store_true", help="Read s16le PCM from stdin")
+    source.add_argument("--port", type=int, help="Accept PCM over a WebSocket on this port")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--cpu-threads", type=int, default=0)
+    parser.add_argument("--partial-interval", type=float, default=PARTIAL_INTERVAL,
+                        help=f"Seconds between partial results (default: {PARTIAL_INTERVAL})")
+    parser.add_argument("--max-buffer", type=float, default=MAX_BUFFER_SECONDS,
+                        help=f"Commit speech without a pause after this many seconds (default: {MAX_BUFFER_SECONDS})")
+    parser.add_argument("--min-silence", type=int, default=MIN_SILENCE_MS, metavar="MS",
+                        help=f"Pause that closes a segment (default: {MIN_SILENCE_MS})")
+    parser.add_argument("--name", default="stream",
+                        help="Base name of the --formats outputs in transcriptions/")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    model = get_whisper_model(args.model_size, args.compute_type, args.cpu_threads)
+
+    def make_engine():
+        return StreamingTranscriber(model, min_silence_len=args.min_silence,
+                                    partial_interval=args.partial_interval,
+                                    max_buffer=args.max_buffer)
+
+    os.makedirs("transcriptions", exist_ok=True)
+
+    def make_writer():
+        sinks = create_sinks(args.formats, "transcriptions", args.name,
+                             os.path.join("transcriptions", "transcriptions.txt"))
+        return EventWriter(sinks, args.name)
+
+    if args.stdin:
+        writer = make_writer()
+        try:
+            run_stdin(make_engine(), writer)
+        finally:
+            writer.close()
+    else:
+        try:
+            asyncio.run(serve_websocket(make_engine, make_writer, args.host, args.port))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Os scripts usam imports planos e rodam de dentro de scripts/; stand_in.py fica aqui
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,104 @@
+"""Local stand-in for the AssemblyAI upload -> transcript -> poll API."""
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from worker_service import read_chunked
+
+
+class StandIn:
+    """Upload -> transcript -> poll API; transcripts finish after a few polls.
+
+    Files whose content starts with b"error" end in an error transcript and
+    with b"stuck" never finish. The first reject_uploads uploads get a 429
+    and the first reject_submits transcript requests a 503. Completed
+    transcripts carry utterances when given (AssemblyAI format, times in ms).
+    """
+
+    def __init__(self, polls_to_finish=2, reject_uploads=0, reject_submits=0, bad_bodies=0,
+                 utterances=None):
+        self.polls_to_finish = polls_to_finish
+        self.utterances = utterances
+        self.reject_uploads = reject_uploads
+        self.reject_submits = reject_submits
+        self.bad_bodies = bad_bodies
+        self.lock = threading.Lock()
+        self.uploads = {}
+        self.transcripts = {}
+        self.active = 0
+        self.max_active = 0
+        self.upload_attempts = 0
+        self.submit_attempts = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _json(self, status, body, headers=None):
+                data = json.dumps(body).encode() if not isinstance(body, bytes) else body
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                if self.path == "/v2/upload":
+                    if "chunked" in self.headers.get("Transfer-Encoding", ""):
+                        body = b"".join(read_chunked(self.rfile))
+                    else:
+                        body = self.rfile.read(int(self.headers["Content-Length"]))
+                    with api.lock:
+                        api.upload_attempts += 1
+                        if api.reject_uploads:
+                            api.reject_uploads -= 1
+                            return self._json(429, {"error": "busy"}, {"Retry-After": "0"})
+                        upload_id = uuid.uuid4().hex
+                        api.uploads[upload_id] = body
+                    return self._json(200, {"upload_url": f"{api.base_url}/uploads/{upload_id}"})
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with api.lock:
+                    api.submit_attempts += 1
+                    if api.reject_submits:
+                        api.reject_submits -= 1
+                        return self._json(503, {"error": "unavailable"})
+                    body = api.uploads[request["audio_url"].rsplit("/", 1)[-1]]
+                    transcript_id = uuid.uuid4().hex
+                    api.transcripts[transcript_id] = {"body": body, "polls": 0, "done": False}
+                    api.active += 1
+                    api.max_active = max(api.max_active, api.active)
+                self._json(200, {"id": transcript_id, "status": "queued"})
+
+            def do_GET(self):
+                transcript_id = self.path.rsplit("/", 1)[-1]
+                with api.lock:
+                    if api.bad_bodies:
+                        api.bad_bodies -= 1
+                        return self._json(200, b"<html>proxy error</html>")
+                    job = api.transcripts[transcript_id]
+                    job["polls"] += 1
+                    if job["body"].startswith(b"stuck") or job["polls"] < api.polls_to_finish:
+                        return self._json(200, {"id": transcript_id, "status": "processing"})
+                    if not job["done"]:
+                        job["done"] = True
+                        api.active -= 1
+                if job["body"].startswith(b"error"):
+                    return self._json(200, {"id": transcript_id, "status": "error", "error": "bad audio"})
+                self._json(200, {"id": transcript_id, "status": "completed",
+                                 "text": job["body"].decode(), "utterances": api.utterances})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,79 @@
+"""AsyncTranscriber against a local stand-in of the upload/transcript API."""
+import asyncio
+import pytest
+from assemblyai_client import AsyncTranscriber, transcribe_many
+from stand_in import StandIn
+
+
+def audio_files(tmp_path, *contents):
+    paths = []
+    for i, content in enumerate(contents):
+        path = tmp_path / f"{i}.wav"
+        path.write_bytes(content)
+        paths.append(str(path))
+    return paths
+
+
+def run(api, paths, timeout=10, **options):
+    transcriber = AsyncTranscriber("key", base_url=api.base_url, poll_interval=0.01,
+                                   max_poll_interval=0.05, retry_backoff=0.01, **options)
+    return asyncio.run(asyncio.wait_for(transcriber.transcribe_many(paths, {"language_code": "pt"}), timeout))
+
+
+def test_in_flight_limit_and_ordered_callbacks(tmp_path):
+    paths = audio_files(tmp_path, *(f"file {i}".encode() for i in range(6)))
+    seen = []
+    with StandIn() as api:
+        transcriber = AsyncTranscriber("key", max_in_flight=2, base_url=api.base_url,
+                                       poll_interval=0.01, max_poll_interval=0.05)
+        results = asyncio.run(transcriber.transcribe_many(
+            paths, {"language_code": "pt"}, on_result=lambda path, transcript, error: seen.append(path)))
+    assert api.max_active == 2
+    assert seen == paths
+    assert [transcript["text"] for _, transcript, _ in results] == [f"file {i}" for i in range(6)]
+    assert all(error is None for _, _, error in results)
+
+
+def test_retries_429_and_5xx(tmp_path):
+    paths = audio_files(tmp_path, b"a", b"b")
+    with StandIn(reject_uploads=2, reject_submits=1) as api:
+        results = run(api, paths)
+    assert all(error is None for _, _, error in results)
+    assert api.upload_attempts == 4
+    assert api.submit_attempts == 3
+
+
+def test_error_transcript_fails_only_that_file(tmp_path):
+    paths = audio_files(tmp_path, b"ok", b"error", b"ok too")
+    with StandIn() as api:
+        results = run(api, paths)
+    errors = [error for _, _, error in results]
+    assert errors[0] is None and errors[2] is None
+    assert isinstance(errors[1], RuntimeError) and "bad audio" in str(errors[1])
+
+
+def test_poller_survives_invalid_bodies(tmp_path):
+    paths = audio_files(tmp_path, b"a", b"b")
+    with StandIn(bad_bodies=3) as api:
+        results = run(api, paths)
+    assert all(error is None for _, _, error in results)
+
+
+def test_stuck_transcript_times_out(tmp_path):
+    paths = audio_files(tmp_path, b"stuck", b"fine")
+    with StandIn() as api:
+        results = run(api, paths, max_wait=0.2)
+    assert isinstance(results[0][2], TimeoutError)
+    assert results[1][2] is None
+
+
+def test_failing_callback_does_not_hang(tmp_path):
+    paths = audio_files(tmp_path, b"a", b"stuck", b"c")
+
+    def on_result(path, transcript, error):
+        raise ValueError("callback failed")
+
+    with StandIn() as api:
+        with pytest.raises(ValueError):
+            transcribe_many("key", paths, {"language_code": "pt"}, max_in_flight=3,
+                            base_url=api.base_url, on_result=on_result, poll_interval=0.01)
@@ -0,0 +1,29 @@
+"""run_batch with worker processes that die"""
+import os
+import threading
+import time
+from batch import run_batch
+
+
+def die_after_returning(path):
+    """Handler (picklable for spawn): 'slow' takes a while, 'die' kills its worker once idle"""
+    if path.endswith("slow"):
+        time.sleep(3)
+    elif path.endswith("die"):
+        # O resultado é entregue; o processo morre já sem tarefa, como num OOM kill
+        threading.Timer(0.5, os._exit, (1,)).start()
+    return os.path.basename(path)
+
+
+def test_a_worker_dying_between_files_does_not_abort_the_batch(tmp_path):
+    slow, die = tmp_path / "slow", tmp_path / "die"
+    # Maiores primeiro: cada worker pega um arquivo
+    slow.write_bytes(b"x" * 100)
+    die.write_bytes(b"x")
+    results = []
+
+    stats = run_batch([str(slow), str(die)], die_after_returning, workers=2,
+                      on_result=lambda path, result, error: results.append((result, error)))
+
+    assert results == [("slow", None), ("die", None)]
+    assert stats["completed"] == 2 and stats["failed"] == 0
@@ -0,0 +1,17 @@
+"""Diarization chunk planning"""
+import pytest
+from diarization import split_audio
+
+
+def test_chunks_tile_the_recording():
+    chunks = split_audio(100.0, segment_duration=40.0, overlap=10.0)
+
+    assert [(c['start'], c['end']) for c in chunks] == [(0.0, 40.0), (30.0, 70.0), (60.0, 100.0)]
+    assert chunks[0]['core_start'] == 0.0 and chunks[-1]['core_end'] == 100.0
+    assert all(a['core_end'] == b['core_start'] for a, b in zip(chunks, chunks[1:]))
+
+
+@pytest.mark.parametrize("overlap", [40.0, 50.0, -1.0])
+def test_overlap_must_be_shorter_than_the_chunk(overlap):
+    with pytest.raises(ValueError):
+        split_audio(100.0, segment_duration=40.0, overlap=overlap)
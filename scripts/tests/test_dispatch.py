@@ -0,0 +1,99 @@
+"""Routing plan, segment schema and the remote path of dispatch.py."""
+import argparse
+import json
+import pytest
+from dispatch import REMOTE_OVERHEAD_SECONDS, DispatchStats, ResultWriter, normalize_segments, plan_routes, run_remote
+from stand_in import StandIn
+
+
+def jobs(*minutes):
+    return [{"path": f"{i}.wav", "duration": m * 60.0} for i, m in enumerate(minutes)]
+
+
+def routes(planned):
+    return {job["path"]: job["route"] for job in planned}
+
+
+def test_everything_local_without_api_or_budget():
+    planned = plan_routes(jobs(60, 30, 10), local_rtf=0.5, remote_rtf=0.1, deadline=600)
+    assert set(routes(planned).values()) == {"local"}
+    planned = plan_routes(jobs(60, 30, 10), local_rtf=0.5, remote_rtf=0.1, remote_slots=4,
+                          deadline=600, budget=0.0)
+    assert set(routes(planned).values()) == {"local"}
+    assert planned[0]["reason"] == "over budget"
+
+
+def test_files_that_miss_the_deadline_go_remote_within_budget():
+    # 60 min locais a 0.5 = 30 min; o resto só caberia depois do prazo de 35 min
+    planned = plan_routes(jobs(60, 30, 10), local_rtf=0.5, remote_rtf=0.1, remote_slots=4,
+                          deadline=35 * 60, budget=10.0, price_per_hour=0.4)
+    assert routes(planned) == {"0.wav": "local", "1.wav": "remote", "2.wav": "local"}
+    assert planned[0]["path"] == "0.wav"  # mais longo primeiro
+    remote = next(job for job in planned if job["route"] == "remote")
+    assert remote["cost"] == pytest.approx(0.2)
+    assert remote["eta"] == pytest.approx(REMOTE_OVERHEAD_SECONDS + 30 * 60 * 0.1)
+
+
+def test_budget_caps_remote_spending():
+    planned = plan_routes(jobs(60, 60, 60), local_rtf=1.0, remote_rtf=0.1, remote_slots=4,
+                          deadline=60, budget=0.5, price_per_hour=0.4)
+    assert sum(job["cost"] for job in planned) <= 0.5
+    assert sorted(routes(planned).values()) == ["local", "local", "remote"]
+
+
+def test_watch_backlog_delays_local_work():
+    free = plan_routes(jobs(10), local_rtf=0.5, remote_rtf=0.1, remote_slots=1,
+                       deadline=600, budget=1.0)
+    busy = plan_routes(jobs(10), local_rtf=0.5, remote_rtf=0.1, remote_slots=1,
+                       deadline=600, budget=1.0, backlog=3600)
+    assert routes(free) == {"0.wav": "local"}
+    assert routes(busy) == {"0.wav": "remote"}
+
+
+def test_forced_routes():
+    planned = plan_routes(jobs(1, 2), local_rtf=0.5, remote_rtf=0.1, remote_slots=2, route="remote")
+    assert set(routes(planned).values()) == {"remote"}
+    planned = plan_routes(jobs(1, 2), local_rtf=5.0, remote_rtf=0.1, remote_slots=2, deadline=1,
+                          budget=100.0, route="local")
+    assert set(routes(planned).values()) == {"local"}
+
+
+def test_normalize_renumbers_anonymous_speakers():
+    segments = [{"start": 0.12345, "end": 1.0, "speaker": "B", "text": " oi "},
+                {"start": 1.0, "end": 2.0, "speaker": "A", "text": "tudo bem"},
+                {"start": 2.0, "end": 3.0, "speaker": "B", "text": "sim"}]
+    assert normalize_segments(segments) == [
+        {"start": 0.123, "end": 1.0, "speaker": "SPEAKER_00", "text": "oi"},
+        {"start": 1.0, "end": 2.0, "speaker": "SPEAKER_01", "text": "tudo bem"},
+        {"start": 2.0, "end": 3.0, "speaker": "SPEAKER_00", "text": "sim"}]
+    silence = [{"start": 0, "end": 1, "speaker": "SPEAKER_2", "text": "a"},
+               {"start": 1, "end": 2, "speaker": "SPEAKER_1", "text": "b"}]
+    assert [s["speaker"] for s in normalize_segments(silence)] == ["SPEAKER_00", "SPEAKER_01"]
+
+
+def test_normalize_keeps_named_speakers_fills_times_and_drops_empty_text():
+    segments = [{"start": None, "end": None, "speaker": None, "text": "texto todo"},
+                {"start": 1, "end": 2, "speaker": "Ana", "text": "  "},
+                {"start": 3, "end": 4, "speaker": "SPEAKER_07", "text": "olá"}]
+    assert normalize_segments(segments, duration=90.0) == [
+        {"start": 0.0, "end": 90.0, "speaker": None, "text": "texto todo"},
+        {"start": 3, "end": 4, "speaker": "SPEAKER_07", "text": "olá"}]
+
+
+def test_run_remote_round_trip(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "reuniao.wav").write_bytes(b"audio")
+    (tmp_path / "transcriptions").mkdir()
+    utterances = [{"start": 0, "end": 1500, "speaker": "A", "text": "bom dia"},
+                  {"start": 1500, "end": 2750, "speaker": "B", "text": "bom dia a todos"}]
+    with StandIn(polls_to_finish=1, utterances=utterances) as api:
+        args = argparse.Namespace(remote_concurrency=2, api_base_url=api.base_url, no_cache=True,
+                                  formats=["jsonl"], store=str(tmp_path / "transcripts.sqlite3"))
+        stats = DispatchStats(str(tmp_path / "stats.json"))
+        run_remote([{"path": "reuniao.wav", "duration": 2.75}], args, "key", ResultWriter(args), stats)
+    with open(tmp_path / "transcriptions" / "reuniao.jsonl", encoding="utf-8") as f:
+        written = [json.loads(line) for line in f]
+    assert written == [
+        {"file": "reuniao.wav", "start": 0.0, "end": 1.5, "speaker": "SPEAKER_00", "text": "bom dia"},
+        {"file": "reuniao.wav", "start": 1.5, "end": 2.75, "speaker": "SPEAKER_01", "text": "bom dia a todos"}]
+    assert stats.data["remote"]["samples"] == 1
@@ -0,0 +1,27 @@
+"""Resume records only apply to runs with the same options"""
+from journal import Journal
+
+PLAIN = {"model": "small", "segmentation": "silence"}
+DIARIZED = {"model": "small", "segmentation": "pyannote"}
+
+
+def test_done_files_are_redone_with_other_options(tmp_path):
+    audio = tmp_path / "meeting.wav"
+    audio.write_bytes(b"RIFF")
+    path = str(tmp_path / "journal.jsonl")
+    Journal(path, PLAIN).record_done(str(audio))
+
+    assert Journal(path, PLAIN).is_done(str(audio))
+    assert not Journal(path, DIARIZED).is_done(str(audio))
+
+
+def test_partial_progress_is_not_spliced_across_options(tmp_path):
+    audio = tmp_path / "meeting.wav"
+    audio.write_bytes(b"RIFF")
+    path = str(tmp_path / "journal.jsonl")
+    journal = Journal(path, PLAIN)
+    journal.start_file(str(audio), [])
+    journal.record_segment(str(audio), 12.5, 1, '{"start": 0.0, "end": 12.5, "text": "oi"}')
+
+    assert Journal(path, PLAIN).resume_point(str(audio)) == (12.5, ['{"start": 0.0, "end": 12.5, "text": "oi"}'])
+    assert Journal(path, DIARIZED).resume_point(str(audio)) == (0.0, [])
@@ -0,0 +1,63 @@
+"""long_audio.speech_blocks keeps memory bounded by the block size"""
+import json
+import os
+import subprocess
+import sys
+import wave
+import numpy as np
+import pytest
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RATE = 16000
+
+# Pico do processo novo pelo VmHWM (bench.peak_rss_mb): o ru_maxrss sobrevive
+# ao fork/exec e traria o pico do próprio pytest
+MEASURE = """
+import json, sys
+from bench import peak_rss_mb
+from long_audio import speech_blocks
+blocks = samples_out = 0
+for offset, samples, segments in speech_blocks(sys.argv[1], block_seconds=120):
+    blocks += 1
+    samples_out += len(samples)
+print(json.dumps({"blocks": blocks, "samples": samples_out,
+                  "peak_mb": peak_rss_mb()}))
+"""
+
+
+def write_meeting(path, minutes):
+    """16-bit WAV of tone bursts (speech) separated by 1 s pauses, written a minute at a time"""
+    rng = np.random.default_rng(0)
+    t = np.arange(RATE * 4) / RATE
+    burst = (0.3 * np.sin(2 * np.pi * 220 * t) * 32767).astype(np.int16)
+    pause = np.zeros(RATE, dtype=np.int16)
+    minute = np.concatenate([np.concatenate([burst[:RATE * rng.integers(1, 5)], pause]) for _ in range(20)])
+    minute = minute[:RATE * 60]
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(RATE)
+        for _ in range(minutes):
+            f.writeframes(minute.tobytes())
+
+
+def stream(path):
+    result = subprocess.run([sys.executable, "-c", MEASURE, str(path)], cwd=SCRIPTS_DIR,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="needs VmHWM from /proc")
+def test_peak_memory_does_not_grow_with_the_recording(tmp_path):
+    short, long = tmp_path / "short.wav", tmp_path / "long.wav"
+    write_meeting(short, 5)
+    write_meeting(long, 90)
+
+    small = stream(short)
+    large = stream(long)
+
+    assert large["samples"] == 90 * 60 * RATE
+    assert large["blocks"] >= 90 * 60 // 120
+    # A gravação inteira decodificada ocuparia ~330 MB (float32 a 16 kHz);
+    # em blocos de 120 s o pico fica no patamar do arquivo curto
+    assert large["peak_mb"] - small["peak_mb"] < 40
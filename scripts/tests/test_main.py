@@ -0,0 +1,48 @@
+"""main.process_file with --dedup and --speech-map together"""
+import numpy as np
+import main
+from audio_io import SAMPLE_RATE
+from speech_map import SpeechMap
+
+
+def test_partial_copy_transcribes_only_the_uncovered_speech(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    audio = np.zeros(60 * SAMPLE_RATE, dtype=np.float32)
+    reused = [{'start': 0.0, 'end': 30.0, 'speaker': None, 'text': "já transcrito"}]
+    sent = []
+
+    def fake_whisper(samples, *args):
+        sent.append(len(samples) / SAMPLE_RATE)
+        yield {'start': 0.0, 'end': 5.0, 'speaker': None, 'text': "novo"}
+
+    monkeypatch.setattr(main, "load_audio", lambda path: audio)
+    # A outra gravação cobre os primeiros 30 s; fala só em 35-40 s e 50-55 s
+    monkeypatch.setattr(main, "reuse_transcript", lambda path, samples, dedup: (reused, [(30.0, 60.0)]))
+    monkeypatch.setattr(main, "speech_map",
+                        lambda path, samples, method: SpeechMap([(0.0, 20.0), (35.0, 40.0), (50.0, 55.0)],
+                                                                60.0, method))
+    monkeypatch.setattr(main, "transcribe_audio", fake_whisper)
+
+    segments = main.process_file("meeting.wav", formats=(), stream_text=False,
+                                 speech_map_method="energy", dedup={})
+
+    assert sent == [10.0]
+    assert [segment['text'] for segment in segments] == ["já transcrito", "novo"]
+    assert segments[1]['start'] == 35.0
+
+
+def test_partial_copy_without_speech_map_transcribes_the_whole_remainder(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sent = []
+
+    def fake_whisper(samples, *args):
+        sent.append(len(samples) / SAMPLE_RATE)
+        return iter([])
+
+    monkeypatch.setattr(main, "load_audio", lambda path: np.zeros(60 * SAMPLE_RATE, dtype=np.float32))
+    monkeypatch.setattr(main, "reuse_transcript", lambda path, samples, dedup: ([], [(30.0, 60.0)]))
+    monkeypatch.setattr(main, "transcribe_audio", fake_whisper)
+
+    main.process_file("meeting.wav", formats=(), stream_text=False, dedup={})
+
+    assert sent == [30.0]
@@ -0,0 +1,37 @@
+"""Stage timers that leave out the time of the consumer"""
+import json
+import time
+import metrics
+
+
+def test_timed_counts_only_the_producer(tmp_path, monkeypatch):
+    path = tmp_path / "metrics.jsonl"
+    monkeypatch.setenv(metrics.METRICS_ENV, str(path))
+
+    def produce():
+        for item in range(3):
+            time.sleep(0.02)
+            yield item
+
+    items = []
+    for item in metrics.timed(produce(), "transcribe", audio_seconds=6.0):
+        # Outro estágio (diarização, escrita) rodando entre os itens
+        time.sleep(0.1)
+        items.append(item)
+
+    assert items == [0, 1, 2]
+    record, = [json.loads(line) for line in path.read_text().splitlines()]
+    assert record["name"] == "transcribe" and record["audio_seconds"] == 6.0
+    assert 0.06 <= record["seconds"] < 0.2
+
+
+def test_timed_records_a_stage_left_early(tmp_path, monkeypatch):
+    path = tmp_path / "metrics.jsonl"
+    monkeypatch.setenv(metrics.METRICS_ENV, str(path))
+
+    results = metrics.timed(iter(range(10)), "decode")
+    next(results)
+    results.close()
+
+    record, = [json.loads(line) for line in path.read_text().splitlines()]
+    assert record["name"] == "decode"
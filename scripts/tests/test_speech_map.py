@@ -0,0 +1,14 @@
+"""Speech regions combined with the parts left by dedup"""
+from speech_map import SpeechMap
+
+
+def test_intersect_keeps_only_audio_in_both_maps():
+    speech = SpeechMap([(0.0, 10.0), (20.0, 40.0), (50.0, 60.0)], 60.0, "silero")
+    remainder = SpeechMap([(5.0, 25.0), (45.0, 55.0)], 60.0, "dedup")
+
+    both = speech.intersect(remainder)
+
+    assert both.regions == [(5.0, 10.0), (20.0, 25.0), (50.0, 55.0)]
+    assert both.speech_seconds == 15.0
+    assert both.duration == 60.0
+    assert speech.intersect(SpeechMap([], 60.0, "dedup")).regions == []
@@ -0,0 +1,19 @@
+"""StreamingTranscriber input framing"""
+import numpy as np
+from streaming import StreamingTranscriber
+
+
+def test_odd_sized_frames_keep_samples_aligned():
+    # Silêncio abaixo do limiar: nada chega ao modelo
+    samples = (np.arange(1001, dtype=np.int16) % 7 - 3)
+    data = samples.astype("<i2").tobytes()
+    engine = StreamingTranscriber(model=None)
+
+    events = []
+    for cut in range(0, len(data), 333):
+        events += engine.feed(data[cut:cut + 333])
+
+    assert events == []
+    assert engine.received == len(samples)
+    assert engine.carry == b""
+    np.testing.assert_array_equal(engine.buffer, samples.astype(np.float32) / 32768)
@@ -0,0 +1,57 @@
+"""InboxWorker: outputs, store records and where the files end up"""
+import sys
+import pytest
+import watch
+from transcript_store import TranscriptStore
+
+SEGMENTS = [{'start': 0.0, 'end': 2.0, 'speaker': "SPEAKER_1", 'text': "bom dia"},
+            {'start': 3.0, 'end': 5.0, 'speaker': "SPEAKER_2", 'text': "olá"}]
+
+
+@pytest.fixture
+def inbox(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "audios").mkdir()
+    (tmp_path / "transcriptions").mkdir()
+    (tmp_path / "audios" / "meeting.wav").write_bytes(b"RIFF")
+    return tmp_path
+
+
+def make_worker(monkeypatch, *options):
+    monkeypatch.setattr(sys, "argv", ["watch.py", "--no-cache", *options])
+    args = watch.parse_args()
+    monkeypatch.setattr(watch, "transcribe_local", lambda path, *a, **kw: list(SEGMENTS))
+    return watch.InboxWorker(args, watch.JobQueue(), watch.Inbox(args.inbox))
+
+
+def job():
+    return {"file": "meeting.wav", "audio_seconds": 5.0, "size": 4, "seen": 0.0}
+
+
+def test_speaker_modes_write_the_requested_outputs(inbox, monkeypatch):
+    worker = make_worker(monkeypatch, "--mode", "speakers", "--formats", "txt", "srt")
+    store = TranscriptStore("transcriptions/transcripts.sqlite3")
+
+    worker.process(job(), None, store)
+
+    text = (inbox / "transcriptions" / "transcriptions.txt").read_text(encoding="utf-8")
+    assert text == "# meeting.wav\n\n[SPEAKER_1]: bom dia\n[SPEAKER_2]: olá\n\n"
+    assert "00:00:03,000 --> 00:00:05,000" in (inbox / "transcriptions" / "meeting.srt").read_text()
+    assert (inbox / "audios_done" / "meeting.wav").exists()
+    store.close()
+
+
+def test_a_failed_save_leaves_the_file_in_failed_dir(inbox, monkeypatch):
+    worker = make_worker(monkeypatch, "--mode", "speakers")
+
+    class BrokenStore:
+        def save(self, *args, **kwargs):
+            raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        worker.process(job(), None, BrokenStore())
+    worker.fail(job(), "OSError: disk full")
+
+    assert not (inbox / "audios_done" / "meeting.wav").exists()
+    assert (inbox / "audios_failed" / "meeting.wav").exists()
+    assert (inbox / "audios_failed" / "meeting.wav.error.txt").read_text() == "OSError: disk full\n"
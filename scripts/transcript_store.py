@@ -0,0 +1,298 @@
+"""Indexed transcript store.
+
+Every transcribed file becomes one record (file, path, content hash, date,
+engine, model and options) with its segments (start, end, speaker, text), in
+a local SQLite database. Records are written in a single transaction, so
+parallel workers and concurrent runs never leave half-written transcripts.
+Lookups by file, hash or date go through regular indexes, and segment text
+is indexed with FTS5 for full-text search.
+
+transcriptions.txt is no longer appended to by default; it can be
+regenerated from the store:
+
+    python transcript_store.py search "orçamento 2024"
+    python transcript_store.py find --file reuniao.mp3 --since 2024-01-01
+    python transcript_store.py show 42
+    python transcript_store.py export transcriptions/transcriptions.txt
+    python transcript_store.py import-txt transcriptions/transcriptions.txt
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime
+from cache import hash_file
+
+DEFAULT_STORE_PATH = os.path.join("transcriptions", "transcripts.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    id INTEGER PRIMARY KEY,
+    file TEXT NOT NULL,
+    path TEXT NOT NULL,
+    audio_hash TEXT,
+    created REAL NOT NULL,
+    duration REAL,
+    engine TEXT NOT NULL,
+    model TEXT,
+    options TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transcripts_file ON transcripts (file);
+CREATE INDEX IF NOT EXISTS transcripts_hash ON transcripts (audio_hash);
+CREATE INDEX IF NOT EXISTS transcripts_created ON transcripts (created);
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    transcript_id INTEGER NOT NULL REFERENCES transcripts (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    start REAL,
+    end REAL,
+    speaker TEXT,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segments_transcript ON segments (transcript_id, position);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(
+    text, content='segments', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+"""
+
+
+def parse_date(value):
+    """Timestamp for 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM'"""
+    for fmt in ("%Y-%m-%d", "%Y-%m-%d %H:%M"):
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid date: {value}")
+
+
+class TranscriptStore:
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        self.db.executescript(SCHEMA)
+        try:
+            self.db.executescript(FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            logging.warning("SQLite without FTS5: search falls back to LIKE")
+            self.fts = False
+
+    def save(self, audio_path, segments, engine, model=None, options=None,
+             audio_hash=None, duration=None, replace=True):
+        """Store one transcript atomically; returns its id.
+
+        With replace, an earlier transcript of the same content by the same
+        engine and model is removed in the same transaction.
+        """
+        if audio_hash is None and os.path.exists(audio_path):
+            audio_hash = hash_file(audio_path)
+        segments = [s for s in segments if s.get('text')]
+        text = " ".join(s['text'] for s in segments)
+        if duration is None and segments and segments[-1].get('end') is not None:
+            duration = segments[-1]['end']
+
+        with self.db:
+            if replace and audio_hash:
+                for row in self.db.execute(
+                        "SELECT id FROM transcripts WHERE audio_hash = ? AND engine = ? AND model IS ?",
+                        (audio_hash, engine, model)).fetchall():
+                    self._delete(row["id"])
+            cursor = self.db.execute(
+                "INSERT INTO transcripts (file, path, audio_hash, created, duration, engine, model, options, text) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (os.path.basename(audio_path), os.path.abspath(audio_path), audio_hash, time.time(),
+                 duration, engine, model, json.dumps(options or {}, sort_keys=True), text))
+            transcript_id = cursor.lastrowid
+            for position, segment in enumerate(segments):
+                cursor = self.db.execute(
+                    "INSERT INTO segments (transcript_id, position, start, end, speaker, text) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (transcript_id, position, segment.get('start'), segment.get('end'),
+                     segment.get('speaker'), segment['text']))
+                if self.fts:
+                    self.db.execute("INSERT INTO segments_fts (rowid, text) VALUES (?, ?)",
+                                    (cursor.lastrowid, segment['text']))
+        return transcript_id
+
+    def _delete(self, transcript_id):
+        if self.fts:
+            # Tabela FTS com conteúdo externo: remoção explícita com os valores antigos
+            self.db.execute(
+                "INSERT INTO segments_fts (segments_fts, rowid, text) "
+                "SELECT 'delete', id, text FROM segments WHERE transcript_id = ?", (transcript_id,))
+        self.db.execute("DELETE FROM segments WHERE transcript_id = ?", (transcript_id,))
+        self.db.execute("DELETE FROM transcripts WHERE id = ?", (transcript_id,))
+
+    def delete(self, transcript_id):
+        with self.db:
+            self._delete(transcript_id)
+
+    def get(self, transcript_id):
+        """Transcript record with its segments, or None"""
+        row = self.db.execute("SELECT * FROM transcripts WHERE id = ?", (transcript_id,)).fetchone()
+        if row is None:
+            return None
+        record = dict(row)
+        record["options"] = json.loads(record["options"])
+        record["segments"] = [dict(s) for s in self.db.execute(
+            "SELECT start, end, speaker, text FROM segments WHERE transcript_id = ? ORDER BY position",
+            (transcript_id,))]
+        return record
+
+    def find(self, file=None, audio_hash=None, since=None, until=None, limit=50):
+        """Transcript records (without segments), newest first"""
+        clauses, params = [], []
+        if file:
+            clauses.append("file = ?")
+            params.append(os.path.basename(file))
+        if audio_hash:
+            clauses.append("audio_hash = ?")
+            params.append(audio_hash)
+        if since is not None:
+            clauses.append("created >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.db.execute(
+            f"SELECT id, file, path, audio_hash, created, duration, engine, model FROM transcripts "
+            f"{where} ORDER BY created DESC LIMIT ?", (*params, limit))
+        return [dict(row) for row in rows]
+
+    def has(self, audio_hash, engine, model=None):
+        """Whether this content was already transcribed by this engine and model"""
+        return self.db.execute(
+            "SELECT 1 FROM transcripts WHERE audio_hash = ? AND engine = ? AND model IS ?",
+            (audio_hash, engine, model)).fetchone() is not None
+
+    def search(self, query, limit=20):
+        """Segments matching a full-text query, best matches first"""
+        if self.fts:
+            sql = ("SELECT t.id AS transcript_id, t.file, t.created, s.start, s.end, s.speaker, "
+                   "snippet(segments_fts, 0, '[', ']', '...', 12) AS snippet "
+                   "FROM segments_fts JOIN segments s ON s.id = segments_fts.rowid "
+                   "JOIN transcripts t ON t.id = s.transcript_id "
+                   "WHERE segments_fts MATCH ? ORDER BY rank LIMIT ?")
+            try:
+                rows = self.db.execute(sql, (query, limit)).fetchall()
+            except sqlite3.OperationalError:
+                # Texto livre que não é uma consulta FTS5 válida: busca como frase
+                rows = self.db.execute(sql, ('"' + query.replace('"', '""') + '"', limit)).fetchall()
+        else:
+            rows = self.db.execute(
+                "SELECT t.id AS transcript_id, t.file, t.created, s.start, s.end, s.speaker, "
+                "s.text AS snippet FROM segments s JOIN transcripts t ON t.id = s.transcript_id "
+                "WHERE s.text LIKE ? LIMIT ?", (f"%{query}%", limit))
+        return [dict(row) for row in rows]
+
+    def export_text(self, output_path):
+        """Write every transcript in the old transcriptions.txt layout"""
+        temp_path = output_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for (transcript_id,) in self.db.execute("SELECT id FROM transcripts ORDER BY created"):
+                record = self.get(transcript_id)
+                lines = [f"[{s['speaker']}]: {s['text']}" if s['speaker'] else s['text']
+                         for s in record["segments"]]
+                separator = "\n" if any(s['speaker'] for s in record["segments"]) else " "
+                f.write(f"\n# {record['file']}\n\n{separator.join(lines)}\n\n")
+        os.replace(temp_path, output_path)
+
+    def import_text(self, text_path):
+        """Load the '# file' blocks of an old transcriptions.txt; returns the count"""
+        with open(text_path, encoding="utf-8") as f:
+            content = f.read()
+        count = 0
+        for match in re.finditer(r"^# (.+?)\n\n(.*?)(?=^# |\Z)", content, re.S | re.M):
+            file, body = match.group(1).strip(), match.group(2).strip().rstrip("-").strip()
+            segments = []
+            for line in body.splitlines():
+                speaker = re.match(r"\[(?:Speaker )?([^\]]+)\]: (.*)", line)
+                if speaker:
+                    segments.append({"speaker": speaker.group(1), "text": speaker.group(2).strip()})
+                elif line.strip():
+                    segments.append({"text": line.strip()})
+            self.save(file, segments, engine="import", options={"source": text_path}, replace=False)
+            count += 1
+        return count
+
+    def close(self):
+        self.db.close()
+
+
+def add_store_arguments(parser):
+    """Add the shared transcript store option to an argparse parser"""
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH,
+                        help=f"Transcript database (default: {DEFAULT_STORE_PATH})")
+
+
+def format_time(seconds):
+    return "--:--" if seconds is None else f"{int(seconds // 60):02d}:{seconds % 60:04.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the transcript store")
+    add_store_arguments(parser)
+    commands = parser.add_subparsers(dest="command", required=True)
+    search = commands.add_parser("search", help="Full-text search over segment text")
+    search.add_argument("query")
+    search.add_argument("--limit", type=int, default=20)
+    find = commands.add_parser("find", help="List transcripts by file, hash or date")
+    find.add_argument("--file")
+    find.add_argument("--hash")
+    find.add_argument("--since", help="YYYY-MM-DD")
+    find.add_argument("--until", help="YYYY-MM-DD")
+    find.add_argument("--limit", type=int, default=50)
+    show = commands.add_parser("show", help="Print one transcript")
+    show.add_argument("id", type=int)
+    export = commands.add_parser("export", help="Write all transcripts as transcriptions.txt")
+    export.add_argument("output")
+    import_txt = commands.add_parser("import-txt", help="Import an old transcriptions.txt")
+    import_txt.add_argument("input")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    store = TranscriptStore(args.store)
+    start = time.perf_counter()
+    if args.command == "search":
+        for hit in store.search(args.query, args.limit):
+            speaker = f" {hit['speaker']}" if hit['speaker'] else ""
+            print(f"#{hit['transcript_id']} {hit['file']} {format_time(hit['start'])}{speaker}: {hit['snippet']}")
+    elif args.command == "find":
+        for record in store.find(args.file, args.hash,
+                                 parse_date(args.since) if args.since else None,
+                                 parse_date(args.until) if args.until else None, args.limit):
+            created = datetime.fromtimestamp(record["created"]).strftime("%Y-%m-%d %H:%M")
+            engine = " ".join(filter(None, (record['engine'], record['model'])))
+            print(f"#{record['id']} {created} {record['file']} ({engine})")
+    elif args.command == "show":
+        record = store.get(args.id)
+        if record is None:
+            parser.exit(1, f"Transcript {args.id} not found\n")
+        print(f"# {record['file']}\n")
+        for segment in record["segments"]:
+            speaker = f"[{segment['speaker']}] " if segment['speaker'] else ""
+            print(f"{format_time(segment['start'])} {speaker}{segment['text']}")
+    elif args.command == "export":
+        store.export_text(args.output)
+        print(f"Exported to {args.output}")
+    elif args.command == "import-txt":
+        print(f"Imported {store.import_text(args.input)} transcripts")
+    logging.info(f"{args.command} took {(time.perf_counter() - start) * 1000:.1f} ms")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Vectorized silence segmentation.
+
+Drop-in replacement for pydub's detect_nonsilent: the same
+min_silence_len / silence_thresh semantics and the same [start_ms, end_ms]
+output, but the RMS of every min_silence_len window (one per millisecond) is
+computed from per-millisecond energies with a cumulative sum instead of a
+Python loop over AudioSegment slices. Audio can be fed in chunks, so long
+recordings never need a full-length float copy.
+"""
+import numpy as np
+from audio_io import SAMPLE_RATE, to_int16
+
+# Amplitude máxima de PCM 16 bits, a mesma referência usada pelo pydub
+MAX_AMPLITUDE = 1 << 15
+
+# Tamanho dos blocos usados por detect_nonsilent_ranges
+CHUNK_SECONDS = 60
+
+
+class SilenceSegmenter:
+    """Streaming non-silent range detector.
+
+    feed() accepts consecutive chunks of 16-bit (or float in [-1, 1]) mono
+    samples and returns the non-silent ranges that can no longer change;
+    finish() returns the rest. Ranges are [start_ms, end_ms] lists, exactly
+    as pydub.silence.detect_nonsilent(seek_step=1) would report them.
+    """
+
+    def __init__(self, min_silence_len=700, silence_thresh=-40, sampling_rate=SAMPLE_RATE):
+        self.min_silence_len = min_silence_len
+        self.sampling_rate = sampling_rate
+        self.threshold = 10 ** (silence_thresh / 20) * MAX_AMPLITUDE
+
+        self._pending = np.empty(0, dtype=np.int16)  # amostras sem ms completo
+        self._pending_offset = 0   # índice absoluto de _pending[0]
+        self._frames = 0           # ms completos já processados
+        self._carry_energy = np.empty(0)
+        self._carry_count = np.empty(0)
+        self._carry_start = 0      # ms do primeiro quadro em _carry_*
+        self._prev_start = None    # último início de janela silenciosa
+        self._first_range_start = None
+        self._silent_ranges = 0
+
+    def _boundary(self, ms):
+        return ms * self.sampling_rate // 1000
+
+    def feed(self, samples):
+        """Consume a chunk; returns the newly completed non-silent ranges"""
+        samples = np.asarray(samples)
+        if samples.dtype != np.int16:
+            samples = to_int16(samples)
+        data = np.concatenate([self._pending, samples])
+        total = self._pending_offset + len(data)
+
+        # Último ms cujo fim já está disponível
+        last = ((total + 1) * 1000 - 1) // self.sampling_rate
+        if last <= self._frames:
+            self._pending = data
+            return []
+
+        bounds = self._boundary(np.arange(self._frames, last + 1)) - self._pending_offset
+        energy, count = self._frame_energy(data, bounds)
+        self._pending = data[bounds[-1]:]
+        self._pending_offset += int(bounds[-1])
+        self._frames = last
+        return self._process(energy, count)
+
+    def finish(self):
+        """Flush the stream and return the remaining non-silent ranges"""
+        total = self._pending_offset + len(self._pending)
+        length_ms = int(round(total * 1000 / self.sampling_rate))
+        ranges = []
+        if length_ms > self._frames and len(self._pending):
+            # Último ms parcial, como no arredondamento de len(AudioSegment)
+            squares = self._pending.astype(np.float64) ** 2
+            ranges = self._process(np.array([squares.sum()]),
+                                   np.array([float(len(self._pending))]))
+
+        if self._silent_ranges == 0:
+            return ranges + [[0, length_ms]]
+
+        last_end = self._prev_start + self.min_silence_len
+        if self._silent_ranges == 1 and self._first_range_start == 0 and last_end == length_ms:
+            return []
+        if last_end != length_ms:
+            ranges.append([last_end, length_ms])
+        return ranges
+
+    def _frame_energy(self, data, bounds):
+        squares = data[bounds[0]:bounds[-1]].astype(np.float64) ** 2
+        energy = np.add.reduceat(squares, bounds[:-1] - bounds[0])
+        return energy, np.diff(bounds).astype(np.float64)
+
+    def _process(self, energy, count):
+        energy = np.concatenate([self._carry_energy, energy])
+        count = np.concatenate([self._carry_count, count])
+        msl = self.min_silence_len
+
+        starts = np.empty(0, dtype=np.int64)
+        if len(energy) >= msl:
+            energy_sum = np.concatenate([[0.0], np.cumsum(energy)])
+            count_sum = np.concatenate([[0.0], np.cumsum(count)])
+            window_energy = energy_sum[msl:] - energy_sum[:-msl]
+            window_count = count_sum[msl:] - count_sum[:-msl]
+            # audioop.rms trunca a raiz para inteiro
+            rms = np.floor(np.sqrt(window_energy / window_count))
+            starts = np.flatnonzero(rms <= self.threshold) + self._carry_start
+
+        keep = max(0, msl - 1)
+        dropped = len(energy) - min(keep, len(energy))
+        self._carry_energy = energy[dropped:]
+        self._carry_count = count[dropped:]
+        self._carry_start += dropped
+        return self._combine(starts)
+
+    def _combine(self, starts):
+        """Turn silent window starts into closed non-silent ranges"""
+        if len(starts) == 0:
+            return []
+        msl = self.min_silence_len
+        previous = np.concatenate([[self._prev_start if self._prev_start is not None else -msl - 1],
+                                   starts[:-1]])
+        # Um novo trecho silencioso começa quando o salto passa de min_silence_len
+        new_range = np.flatnonzero(starts - previous > msl)
+
+        range_starts = starts[new_range]
+        nonsilent_starts = previous[new_range] + msl
+        first = self._silent_ranges == 0 and len(new_range) > 0
+        if first:
+            nonsilent_starts[0] = 0
+            self._first_range_start = int(range_starts[0])
+        self._silent_ranges += len(new_range)
+        self._prev_start = int(starts[-1])
+
+        ranges = [[int(s), int(e)] for s, e in zip(nonsilent_starts, range_starts)]
+        if first and ranges[0] == [0, 0]:
+            ranges.pop(0)
+        return ranges
+
+
+def detect_nonsilent_ranges(samples, min_silence_len=700, silence_thresh=-40,
+                            sampling_rate=SAMPLE_RATE, chunk_seconds=CHUNK_SECONDS):
+    """Non-silent [start_ms, end_ms] ranges of a whole buffer"""
+    segmenter = SilenceSegmenter(min_silence_len, silence_thresh, sampling_rate)
+    step = chunk_seconds * sampling_rate
+    ranges = []
+    for offset in range(0, len(samples), step):
+        ranges.extend(segmenter.feed(samples[offset:offset + step]))
+    ranges.extend(segmenter.finish())
+    return ranges
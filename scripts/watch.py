@@ -0,0 +1,500 @@
+"""Watch the audios/ inbox and transcribe recordings as they arrive.
+
+Instead of rerunning main.py / main_di.py by hand, this daemon keeps the
+models loaded and picks up every new file dropped in audios/ (by the
+Electron client or anyone else). Changes are noticed through inotify when
+the optional inotify_simple package is installed, by listing the directory
+every few seconds otherwise. A file is only taken once its size and mtime
+have not changed for --settle seconds, so recordings still being written
+are left alone.
+
+Settled files wait in a priority queue, shortest recording first (duration
+read from the container header) for fast feedback, or in arrival order
+with --order fifo. Each one is transcribed like main.py (--mode plain) or
+main_di.py (--mode speakers / diarize), saved in the transcript store and
+the cache, and then moved out of the inbox: to audios_done/ when it
+worked, to audios_failed/ with an .error.txt next to it when it did not.
+Both live outside audios/ because every file there is taken as audio.
+
+Throughput and queue lag are written to transcriptions/watch_status.json
+every second and printed by the status command:
+
+    python watch.py --mode speakers
+    python watch.py --order fifo --formats txt srt
+    python watch.py status
+"""
+import argparse
+import collections
+import heapq
+import itertools
+import json
+import logging
+import os
+import shutil
+import signal
+import stat
+import threading
+import time
+from audio_io import probe_duration
+from cache import add_cache_arguments, open_cache
+from local_pipeline import add_mode_argument, cache_options, engine_name, transcribe_local, warm_up
+from long_audio import add_long_audio_arguments
+from metrics import add_metrics_arguments
+from sinks import TRANSCRIPTIONS_FILE, add_output_arguments, create_sinks, save_segments
+from speaker_store import add_speaker_arguments, open_speaker_store
+from speech_map import add_speech_map_arguments
+from transcript_store import TranscriptStore, add_store_arguments
+from whisper_models import add_model_arguments
+import metrics
+
+DEFAULT_INBOX = "audios"
+DEFAULT_DONE_DIR = "audios_done"
+DEFAULT_FAILED_DIR = "audios_failed"
+DEFAULT_STATUS_PATH = os.path.join("transcriptions", "watch_status.json")
+ORDERS = ("shortest", "fifo")
+
+SETTLE_SECONDS = 5.0
+POLL_SECONDS = 2.0
+# Mesmo com inotify a pasta é relida de tempos em tempos (eventos perdidos)
+RESCAN_SECONDS = 60.0
+STATUS_INTERVAL = 1.0
+# Jobs concluídos mostrados no status
+RECENT_JOBS = 20
+
+# Arquivos temporários de quem ainda está gravando/baixando
+PARTIAL_SUFFIXES = (".tmp", ".part", ".partial", ".crdownload", ".download")
+
+
+def is_candidate(name):
+    return not name.startswith(".") and not name.lower().endswith(PARTIAL_SUFFIXES)
+
+
+class PollingWatcher:
+    """Fallback watcher: nothing to wait on, the inbox is listed every interval"""
+    name = "polling"
+
+    def __init__(self, interval=POLL_SECONDS):
+        self.interval = interval
+
+    def wait(self, timeout):
+        """Names that changed, or None when the whole directory must be listed"""
+        time.sleep(min(timeout, self.interval))
+        return None
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    name = "inotify"
+
+    def __init__(self, directory):
+        from inotify_simple import INotify, flags
+        self.flags = flags
+        self.inotify = INotify()
+        self.inotify.add_watch(directory, flags.CREATE | flags.MODIFY | flags.CLOSE_WRITE
+                               | flags.MOVED_TO | flags.ATTRIB)
+
+    def wait(self, timeout):
+        events = self.inotify.read(timeout=int(timeout * 1000))
+        if any(event.mask & self.flags.Q_OVERFLOW for event in events):
+            return None
+        return {event.name for event in events if event.name}
+
+    def close(self):
+        self.inotify.close()
+
+
+def open_watcher(directory, poll_interval=POLL_SECONDS, polling=False):
+    """inotify watcher when available, else the polling one"""
+    if not polling:
+        try:
+            return InotifyWatcher(directory)
+        except (ImportError, OSError) as e:
+            logging.info(f"inotify unavailable ({e}), polling {directory} every {poll_interval:g}s")
+    return PollingWatcher(poll_interval)
+
+
+class Inbox:
+    """Files of the inbox directory, each released once it stops changing"""
+
+    def __init__(self, directory, settle=SETTLE_SECONDS):
+        self.directory = directory
+        self.settle = settle
+        # nome -> ((tamanho, mtime), parado desde, visto em); None até o primeiro stat
+        self.pending = {}
+        # Já entregues à fila (ou ignorados, como diretórios) enquanto estiverem na pasta
+        self.taken = set()
+
+    def scan(self, names=None):
+        """Start tracking new names (all the directory entries when names is None)"""
+        if names is None:
+            names = os.listdir(self.directory)
+            # Entradas que sumiram da pasta podem voltar com o mesmo nome
+            self.taken &= set(names)
+        for name in names:
+            if is_candidate(name) and name not in self.taken and name not in self.pending:
+                self.pending[name] = None
+
+    def settled(self, now):
+        """[(name, first seen, size)] of the files unchanged for settle seconds"""
+        ready = []
+        for name, state in list(self.pending.items()):
+            try:
+                info = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                del self.pending[name]
+                continue
+            if not stat.S_ISREG(info.st_mode):
+                del self.pending[name]
+                self.taken.add(name)
+                continue
+            signature = (info.st_size, info.st_mtime_ns)
+            if state is None or state[0] != signature:
+                self.pending[name] = (signature, now, state[2] if state else now)
+            elif now - state[1] >= self.settle and info.st_size > 0:
+                del self.pending[name]
+                self.taken.add(name)
+                ready.append((name, state[2], info.st_size))
+        return ready
+
+    def release(self, name):
+        """The file left the inbox; the name may be used again"""
+        self.taken.discard(name)
+
+
+class JobQueue:
+    """Settled files waiting for the model, shortest or oldest first"""
+
+    def __init__(self, order="shortest"):
+        self.order = order
+        self.heap = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+
+    def priority(self, job):
+        if self.order == "fifo":
+            return (job["seen"],)
+        # Duração desconhecida vai para o fim, ordenada pelo tamanho
+        if job["audio_seconds"] is not None:
+            return (0, job["audio_seconds"])
+        return (1, job["size"])
+
+    def put(self, *jobs):
+        # Arquivos que assentam juntos entram juntos, já na ordem de prioridade
+        with self.condition:
+            for job in jobs:
+                heapq.heappush(self.heap, (self.priority(job), next(self.counter), job))
+            self.condition.notify()
+
+    def get(self, timeout):
+        with self.condition:
+            if not self.heap:
+                self.condition.wait(timeout)
+            if not self.heap:
+                return None
+            return heapq.heappop(self.heap)[-1]
+
+    def snapshot(self):
+        with self.condition:
+            return [job for _, _, job in self.heap]
+
+
+def move_to(path, directory):
+    """Move a file into directory without overwriting; returns the new path"""
+    os.makedirs(directory, exist_ok=True)
+    name = os.path.basename(path)
+    target = os.path.join(directory, name)
+    if os.path.exists(target):
+        stem, extension = os.path.splitext(name)
+        target = os.path.join(directory, f"{stem}-{time.strftime('%Y%m%d-%H%M%S')}{extension}")
+    shutil.move(path, target)
+    return target
+
+
+class InboxWorker:
+    """Transcribes queued files with the resident models and files them away"""
+
+    def __init__(self, args, jobs, inbox):
+        self.args = args
+        self.jobs = jobs
+        self.inbox = inbox
+        self.options = cache_options(args)
+        self.lock = threading.Lock()
+        self.processing = None
+        self.totals = {"completed": 0, "failed": 0, "audio_seconds": 0.0, "busy_seconds": 0.0}
+        self.recent = collections.deque(maxlen=RECENT_JOBS)
+        self.speaker_store = open_speaker_store(args) if args.mode == "diarize" else None
+
+    def warm_up(self):
+        warm_up(self.args.model_size, self.args.compute_type, self.args.cpu_threads, self.args.mode)
+
+    def transcribe(self, path):
+        return transcribe_local(path, self.args, self.args.cpu_threads, self.speaker_store,
+                                formats=self.args.formats, stream_text="txt" in self.args.formats)
+
+    def process(self, job, cache, store):
+        path = os.path.join(self.inbox.directory, job["file"])
+        key = cache.key(path, **self.options) if cache is not None else None
+        segments = cache.get(key) if cache is not None else None
+        # O modo plain grava as saídas enquanto transcreve; os outros só no fim
+        written = False
+        if segments is None:
+            segments = self.transcribe(path)
+            written = self.args.mode == "plain"
+            if cache is not None:
+                cache.put(key, path, self.options, segments)
+        if not written:
+            sinks = create_sinks(self.args.formats, "transcriptions", path, TRANSCRIPTIONS_FILE)
+            save_segments(segments, sinks, path)
+        audio_hash = cache.audio_hash(path) if cache is not None else None
+        done_path = move_to(path, self.args.done_dir)
+        try:
+            transcript_id = store.save(done_path, segments, engine_name(self.args.mode),
+                                       self.args.model_size, self.options, audio_hash,
+                                       duration=job["audio_seconds"])
+        except Exception:
+            # Sem registro o arquivo não fica em audios_done: volta e fail() o leva para audios_failed
+            shutil.move(done_path, path)
+            raise
+        self.inbox.release(job["file"])
+        if job["audio_seconds"] is None and segments:
+            job["audio_seconds"] = segments[-1]['end']
+        logging.info(f"Transcribed {job['file']} (#{transcript_id}), moved to {self.args.done_dir}")
+
+    def fail(self, job, error):
+        path = os.path.join(self.inbox.directory, job["file"])
+        try:
+            failed_path = move_to(path, self.args.failed_dir)
+            with open(failed_path + ".error.txt", "w", encoding="utf-8") as f:
+                f.write(error + "\n")
+        except OSError as e:
+            logging.error(f"Could not move {job['file']} to {self.args.failed_dir}: {e}")
+        self.inbox.release(job["file"])
+        logging.error(f"Failed to transcribe {job['file']}: {error}")
+
+    def run(self, stop):
+        """Job loop; runs in its own thread until stop is set"""
+        # Conexões SQLite pertencem à thread que as abriu
+        cache = open_cache(self.args)
+        store = TranscriptStore(self.args.store)
+        while not stop.is_set():
+            job = self.jobs.get(timeout=0.5)
+            if job is None:
+                continue
+            job["started"] = time.time()
+            with self.lock:
+                self.processing = job
+            start = time.perf_counter()
+            try:
+                self.process(job, cache, store)
+                status, error = "completed", None
+            except Exception as e:
+                status, error = "failed", f"{type(e).__name__}: {e}"
+                self.fail(job, error)
+            seconds = time.perf_counter() - start
+            with self.lock:
+                self.processing = None
+                self.totals[status] += 1
+                self.totals["busy_seconds"] += seconds
+                if status == "completed":
+                    self.totals["audio_seconds"] += job["audio_seconds"] or 0.0
+                self.recent.appendleft({
+                    "file": job["file"], "status": status, "error": error,
+                    "audio_seconds": job["audio_seconds"], "seconds": round(seconds, 3),
+                    "waited": round(job["started"] - job["seen"], 3), "finished": time.time()})
+            metrics.count("jobs_completed" if status == "completed" else "jobs_failed")
+        if cache is not None:
+            cache.close()
+        store.close()
+
+    def status(self, now):
+        with self.lock:
+            processing = self.processing
+            totals = dict(self.totals)
+            recent = list(self.recent)
+        return {
+            "processing": None if processing is None else {
+                "file": processing["file"], "audio_seconds": processing["audio_seconds"],
+                "seconds": round(now - processing["started"], 3)},
+            **totals,
+            # Segundos de áudio por segundo de processamento (1 = tempo real)
+            "speed": totals["audio_seconds"] / totals["busy_seconds"] if totals["busy_seconds"] else None,
+            "recent": recent,
+        }
+
+
+def write_status(path, status):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(status, f, ensure_ascii=False, indent=1)
+    os.replace(temp_path, path)
+
+
+def watch(args):
+    os.makedirs(args.inbox, exist_ok=True)
+    os.makedirs(os.path.dirname(args.status_file) or ".", exist_ok=True)
+    metrics.configure(args)
+
+    inbox = Inbox(args.inbox, args.settle)
+    jobs = JobQueue(args.order)
+    worker = InboxWorker(args, jobs, inbox)
+    logging.info("Loading models...")
+    worker.warm_up()
+
+    watcher = open_watcher(args.inbox, args.poll_interval, args.polling)
+    stop = threading.Event()
+    thread = threading.Thread(target=worker.run, args=(stop,), daemon=True)
+    thread.start()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    started = time.time()
+    logging.info(f"Watching {args.inbox} ({watcher.name}, {args.order} first, {args.mode} mode)")
+
+    names, last_scan, last_status = None, 0.0, 0.0
+    try:
+        while not stop.is_set():
+            now = time.time()
+            if names is None or now - last_scan >= RESCAN_SECONDS:
+                inbox.scan()
+                last_scan = now
+            else:
+                inbox.scan(names)
+            settled = [{"file": name, "seen": seen, "size": size,
+                        "audio_seconds": probe_duration(os.path.join(args.inbox, name))}
+                       for name, seen, size in inbox.settled(now)]
+            for job in settled:
+                logging.info(f"Queued {job['file']}" + (f" ({job['audio_seconds']:.0f}s)"
+                                                        if job["audio_seconds"] is not None else ""))
+            jobs.put(*settled)
+
+            if now - last_status >= STATUS_INTERVAL:
+                queued = jobs.snapshot()
+                lag = max((now - job["seen"] for job in queued), default=0.0)
+                metrics.gauge("queue_depth", len(queued))
+                metrics.gauge("queue_lag", round(lag, 3))
+                write_status(args.status_file, {
+                    "pid": os.getpid(), "started": started, "updated": now,
+                    "watcher": watcher.name, "mode": args.mode, "order": args.order,
+                    "inbox": args.inbox, "settling": len(inbox.pending),
+                    "queued": len(queued), "queue_lag": lag,
+                    "queued_audio_seconds": sum(job["audio_seconds"] or 0.0 for job in queued),
+                    **worker.status(now)})
+                last_status = now
+            # Arquivos ainda assentando são conferidos de novo a cada volta
+            names = watcher.wait(STATUS_INTERVAL)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        logging.info("Stopping after the current file...")
+        thread.join()
+        watcher.close()
+        logging.info("Watch mode stopped")
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "?"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def print_status(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        print(f"No watch status in {path}")
+        return 1
+    now = time.time()
+    updated = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(status["updated"]))
+    if is_running(status["pid"]) and now - status["updated"] < 10 * STATUS_INTERVAL + 5:
+        print(f"Watching {status['inbox']} (pid {status['pid']}, {status['watcher']}, "
+              f"{status['mode']} mode, {status['order']} first), "
+              f"up {format_duration(status['updated'] - status['started'])}")
+    else:
+        print(f"Not running (last update {updated})")
+    print(f"Queue: {status['queued']} files, {format_duration(status['queued_audio_seconds'])} of audio, "
+          f"oldest waiting {format_duration(status['queue_lag'])}; {status['settling']} still being written")
+    if status["processing"]:
+        processing = status["processing"]
+        print(f"Processing: {processing['file']} ({format_duration(processing['audio_seconds'])} of audio) "
+              f"for {format_duration(processing['seconds'])}")
+    uptime = max(status["updated"] - status["started"], 1.0)
+    speed = f"{status['speed']:.1f}x real time" if status["speed"] else "no speed yet"
+    print(f"Done: {status['completed']} completed, {status['failed']} failed; "
+          f"{format_duration(status['audio_seconds'])} of audio in "
+          f"{format_duration(status['busy_seconds'])} ({speed}), "
+          f"{status['completed'] * 3600 / uptime:.1f} files/hour")
+    if status["recent"]:
+        waits = [job["waited"] for job in status["recent"]]
+        print(f"Recent (mean wait {format_duration(sum(waits) / len(waits))}):")
+        for job in status["recent"]:
+            finished = time.strftime("%H:%M:%S", time.localtime(job["finished"]))
+            print(f"  {finished} {job['status']:<9} {job['file']}: "
+                  f"{format_duration(job['audio_seconds'])} of audio in {format_duration(job['seconds'])}, "
+                  f"waited {format_duration(job['waited'])}")
+    return 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Transcribe new files in the audios/ inbox as they arrive")
+    parser.add_argument("command", nargs="?", choices=("run", "status"), default="run",
+                        help="run the watcher (default) or print the status of the running one")
+    add_model_arguments(parser)
+    add_output_arguments(parser)
+    add_cache_arguments(parser)
+    add_metrics_arguments(parser)
+    add_store_arguments(parser)
+    add_long_audio_arguments(parser)
+    add_speaker_arguments(parser)
+    add_speech_map_arguments(parser)
+    add_mode_argument(parser)
+    parser.add_argument("--order", choices=ORDERS, default="shortest",
+                        help="Transcribe the shortest queued recording first, or in arrival order "
+                             "(default: shortest)")
+    parser.add_argument("--inbox", default=DEFAULT_INBOX)
+    parser.add_argument("--done-dir", default=DEFAULT_DONE_DIR,
+                        help=f"Where transcribed files are moved (default: {DEFAULT_DONE_DIR})")
+    parser.add_argument("--failed-dir", default=DEFAULT_FAILED_DIR,
+                        help=f"Where files that failed are moved (default: {DEFAULT_FAILED_DIR})")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                        help=f"Seconds a file must stay unchanged before it is taken (default: {SETTLE_SECONDS:g})")
+    parser.add_argument("--poll-interval", type=float, default=POLL_SECONDS,
+                        help=f"Seconds between listings without inotify (default: {POLL_SECONDS:g})")
+    parser.add_argument("--polling", action="store_true", help="Poll even when inotify is available")
+    parser.add_argument("--status-file", default=DEFAULT_STATUS_PATH,
+                        help=f"Status written by the watcher and read by the status command "
+                             f"(default: {DEFAULT_STATUS_PATH})")
+    parser.add_argument("--cpu-threads", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('transcription.log'),
+            logging.StreamHandler()
+        ]
+    )
+    args = parse_args()
+    if args.command == "status":
+        raise SystemExit(print_status(args.status_file))
+    watch(args)
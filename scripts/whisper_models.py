@@ -0,0 +1,90 @@
+import logging
+import time
+import metrics
+
+MODEL_SIZES = ("tiny", "base", "small", "medium", "large-v2", "large-v3")
+COMPUTE_TYPES = ("int8", "int8_float16", "int8_float32", "float16", "float32")
+DEFAULT_MODEL_SIZE = "base"
+
+# Modelos residentes, indexados por (tamanho, device, compute_type, cpu_threads)
+WHISPER_MODELS = {}
+
+# Tempo de carregamento de cada modelo, em segundos
+LOAD_TIMES = {}
+
+# Device escolhido uma única vez por processo
+SELECTED_DEVICE = None
+
+
+def select_device():
+    """Pick the Whisper device once per process.
+
+    CTranslate2 has no MPS backend, so the old per-file MPS attempt always
+    failed before falling back to CPU. Only CUDA is probed here.
+    """
+    global SELECTED_DEVICE
+    if SELECTED_DEVICE is None:
+        try:
+            import ctranslate2
+            cuda_devices = ctranslate2.get_cuda_device_count()
+        except Exception as e:
+            logging.debug(f"CUDA probe failed: {e}")
+            cuda_devices = 0
+        SELECTED_DEVICE = "cuda" if cuda_devices > 0 else "cpu"
+        logging.info(f"Selected Whisper device: {SELECTED_DEVICE}")
+    return SELECTED_DEVICE
+
+
+def default_compute_type(device):
+    """Compute type used when none is requested"""
+    return "float16" if device == "cuda" else "float32"
+
+
+def get_whisper_model(size=DEFAULT_MODEL_SIZE, compute_type=None, cpu_threads=0):
+    """Return a resident WhisperModel, loading it on first use"""
+    device = select_device()
+    compute_type = compute_type or default_compute_type(device)
+    key = (size, device, compute_type, cpu_threads)
+
+    model = WHISPER_MODELS.get(key)
+    if model is None:
+        from faster_whisper import WhisperModel
+        logging.info(
+            f"Loading Whisper model '{size}' on {device} ({compute_type})")
+        start = time.perf_counter()
+        model = WhisperModel(size, device=device, compute_type=compute_type,
+                             cpu_threads=cpu_threads)
+        LOAD_TIMES[key] = time.perf_counter() - start
+        metrics.record_time("model_load", LOAD_TIMES[key], model=size)
+        WHISPER_MODELS[key] = model
+        logging.info(f"Model loaded in {LOAD_TIMES[key]:.2f}s")
+    return model
+
+
+def total_load_time():
+    """Total time spent loading models in this process"""
+    return sum(LOAD_TIMES.values())
+
+
+def add_model_arguments(parser):
+    """Add the shared model selection options to an argparse parser"""
+    parser.add_argument("--model-size", default=DEFAULT_MODEL_SIZE,
+                        help=f"Whisper model size or path (default: {DEFAULT_MODEL_SIZE}; "
+                             f"e.g. {', '.join(MODEL_SIZES)})")
+    parser.add_argument("--compute-type", choices=COMPUTE_TYPES, default=None,
+                        help="Quantization / compute type (default: float16 on CUDA, float32 on CPU)")
+
+
+def transcribe_segments(model, audio, language="pt", **options):
+    """Generator of timestamped segment dicts, produced as Whisper decodes them.
+
+    With word_timestamps=True each segment also has its 'words', as
+    {'start', 'end', 'word'} dicts.
+    """
+    segments, _ = model.transcribe(audio, language=language, **options)
+    for segment in segments:
+        record = {"start": segment.start, "end": segment.end, "text": segment.text.strip()}
+        if options.get("word_timestamps"):
+            record["words"] = [{"start": word.start, "end": word.end, "word": word.word}
+                               for word in segment.words or []]
+        yield record
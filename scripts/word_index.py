@@ -0,0 +1,315 @@
+"""Word-level timestamps of a recording, stored as columns and searchable.
+
+main.py --words keeps the timestamp of every word Whisper decodes and saves
+them per recording in transcriptions/words/<file>.words.npz, as parallel
+arrays instead of one dict per word:
+
+    start, end    float32 seconds of each word
+    offsets       int32, n + 1 byte offsets of each word in text
+    text          uint8, the UTF-8 words back to back
+    segment       int32, index of the segment each word came from
+    speaker       int16, index into speakers (-1 = none)
+
+An hour of meeting is ~10k words, ~250 kB on disk, loaded by one np.load.
+Loaded indexes answer phrase searches (accent- and case-insensitive) and
+time ranges without scanning, stream SRT/VTT subtitles regrouped from the
+words, and cut the audio of a hit straight from the recording (the decoder
+seeks to it instead of decoding the file from the start):
+
+    python word_index.py search "orçamento do projeto"
+    python word_index.py search "prazo" --clip
+    python word_index.py range reuniao.m4a 600 660
+    python word_index.py subtitles reuniao.m4a --format vtt
+    python word_index.py clip audios/reuniao.m4a 612.5 631
+"""
+import argparse
+import glob
+import logging
+import os
+import re
+import unicodedata
+import wave
+import numpy as np
+from audio_io import read_range
+from sinks import SrtSink, VttSink, format_timestamp, write_segments
+
+DEFAULT_WORDS_DIR = os.path.join("transcriptions", "words")
+DEFAULT_CLIP_DIR = os.path.join("transcriptions", "clips")
+
+# Limites de cada legenda gerada a partir das palavras
+CUE_MAX_CHARS = 42
+CUE_MAX_SECONDS = 5.0
+CUE_MAX_GAP = 1.0
+# Margem em volta de cada trecho recortado
+CLIP_PAD_SECONDS = 0.5
+# Palavras de contexto mostradas em volta de cada ocorrência
+CONTEXT_WORDS = 6
+
+PUNCTUATION = re.compile(r"[^\w]+")
+
+
+def normalize_token(word):
+    """Search form of a word: no accents, punctuation or case"""
+    decomposed = unicodedata.normalize("NFKD", word)
+    return PUNCTUATION.sub("", "".join(c for c in decomposed if not unicodedata.combining(c))).casefold()
+
+
+class WordIndex:
+    """Columns of one recording's words plus an in-memory inverted index"""
+
+    def __init__(self, start, end, offsets, text, segment, speaker, speakers):
+        self.start = start
+        self.end = end
+        self.offsets = offsets
+        self.text = text
+        self.segment = segment
+        self.speaker = speaker
+        self.speakers = list(speakers)
+        # Fim máximo até cada palavra: busca binária por tempo mesmo com sobreposições
+        self.reach = np.maximum.accumulate(end) if len(end) else end
+        self._token_ids = None
+        self._postings = None
+        self._vocabulary = None
+
+    @classmethod
+    def from_segments(cls, segments):
+        """Index of the 'words' of transcribed segments (segments without words are skipped)"""
+        starts, ends, chunks, segment_ids, speaker_ids = [], [], [], [], []
+        speakers = {}
+        for position, segment in enumerate(segments):
+            speaker = segment.get('speaker')
+            speaker_id = -1 if speaker is None else speakers.setdefault(speaker, len(speakers))
+            for word in segment.get('words') or []:
+                starts.append(word['start'])
+                ends.append(word['end'])
+                chunks.append(word['word'].encode("utf-8"))
+                segment_ids.append(position)
+                speaker_ids.append(speaker_id)
+        order = np.argsort(np.asarray(starts, dtype=np.float64), kind="stable")
+        chunks = [chunks[i] for i in order]
+        offsets = np.zeros(len(chunks) + 1, dtype=np.int32)
+        np.cumsum([len(chunk) for chunk in chunks], out=offsets[1:])
+        return cls(np.asarray(starts, dtype=np.float32)[order], np.asarray(ends, dtype=np.float32)[order],
+                   offsets, np.frombuffer(b"".join(chunks), dtype=np.uint8),
+                   np.asarray(segment_ids, dtype=np.int32)[order],
+                   np.asarray(speaker_ids, dtype=np.int16)[order], speakers)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["start"], data["end"], data["offsets"], data["text"], data["segment"],
+                       data["speaker"], data["speakers"].tolist())
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(f, start=self.start, end=self.end, offsets=self.offsets, text=self.text,
+                     segment=self.segment, speaker=self.speaker,
+                     speakers=np.asarray(self.speakers, dtype=str))
+        os.replace(temp_path, path)
+
+    def __len__(self):
+        return len(self.start)
+
+    def word(self, i):
+        return self.text[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def phrase(self, first, last):
+        """Text of words first..last-1, as Whisper spelled it"""
+        return self.text[self.offsets[first]:self.offsets[last]].tobytes().decode("utf-8").strip()
+
+    def speaker_of(self, i):
+        return None if self.speaker[i] < 0 else self.speakers[self.speaker[i]]
+
+    def _build(self):
+        # Cada palavra vira um id; as posições de cada id ficam contíguas após o argsort
+        vocabulary = {}
+        # Palavras se repetem muito: normaliza cada grafia uma vez só
+        spellings = {}
+
+        def token_id(word):
+            if word not in spellings:
+                spellings[word] = vocabulary.setdefault(normalize_token(word), len(vocabulary))
+            return spellings[word]
+
+        self._token_ids = np.fromiter((token_id(self.word(i)) for i in range(len(self))),
+                                      dtype=np.int32, count=len(self))
+        order = np.argsort(self._token_ids, kind="stable")
+        bounds = np.searchsorted(self._token_ids[order], np.arange(len(vocabulary) + 1))
+        self._postings = {token: order[bounds[token_id]:bounds[token_id + 1]]
+                          for token, token_id in vocabulary.items()}
+        self._vocabulary = vocabulary
+
+    def find(self, query):
+        """Word positions (first, last + 1) where the phrase occurs"""
+        if self._postings is None:
+            self._build()
+        tokens = [token for token in map(normalize_token, query.split()) if token]
+        if not tokens or tokens[0] not in self._postings:
+            return []
+        candidates = self._postings[tokens[0]]
+        for k, token in enumerate(tokens[1:], 1):
+            token_id = self._vocabulary.get(token)
+            if token_id is None:
+                return []
+            candidates = candidates[candidates + k < len(self)]
+            candidates = candidates[self._token_ids[candidates + k] == token_id]
+        return [(int(first), int(first) + len(tokens)) for first in candidates]
+
+    def between(self, start, end):
+        """Positions lo, hi of the words that overlap [start, end)"""
+        lo = int(np.searchsorted(self.reach, start, side="right"))
+        hi = int(np.searchsorted(self.start, end, side="left"))
+        return lo, max(lo, hi)
+
+    def hits(self, query, context=CONTEXT_WORDS):
+        """Occurrences of a phrase with their times and a few words around them"""
+        return [{"start": round(float(self.start[first]), 3), "end": round(float(self.end[last - 1]), 3),
+                 "speaker": self.speaker_of(first),
+                 "text": self.phrase(max(0, first - context), min(len(self), last + context))}
+                for first, last in self.find(query)]
+
+    def cues(self, lo=0, hi=None, shift=0.0, max_chars=CUE_MAX_CHARS,
+             max_seconds=CUE_MAX_SECONDS, max_gap=CUE_MAX_GAP):
+        """Subtitle cues (segment dicts) regrouped from words lo..hi-1.
+
+        A cue ends at a change of speaker, a pause longer than max_gap, or
+        when it would pass max_chars or max_seconds. Times are moved by
+        -shift (subtitles for a clip that starts at shift).
+        """
+        hi = len(self) if hi is None else hi
+        first = lo
+        for i in range(lo, hi + 1):
+            if i > first and (
+                    i == hi or self.speaker[i] != self.speaker[first]
+                    or self.start[i] - self.end[i - 1] > max_gap
+                    or self.offsets[i + 1] - self.offsets[first] > max_chars
+                    or self.end[i] - self.start[first] > max_seconds):
+                yield {'start': round(max(float(self.start[first]) - shift, 0.0), 3),
+                       'end': round(max(float(self.end[i - 1]) - shift, 0.0), 3),
+                       'speaker': self.speaker_of(first), 'text': self.phrase(first, i)}
+                first = i
+
+
+def index_path(audio_path, directory=DEFAULT_WORDS_DIR):
+    return os.path.join(directory, os.path.basename(audio_path) + ".words.npz")
+
+
+def save_word_index(audio_path, segments, directory=DEFAULT_WORDS_DIR):
+    """Index the words of a transcribed file; returns the index"""
+    index = WordIndex.from_segments(segments)
+    index.save(index_path(audio_path, directory))
+    logging.info(f"Indexed {len(index)} words of {os.path.basename(audio_path)}")
+    return index
+
+
+def load_indexes(directory=DEFAULT_WORDS_DIR, name=None):
+    """{file name: WordIndex} of the saved indexes (only name when given)"""
+    pattern = index_path(name, directory) if name else os.path.join(directory, "*.words.npz")
+    return {os.path.basename(path)[:-len(".words.npz")]: WordIndex.load(path)
+            for path in sorted(glob.glob(pattern))}
+
+
+def write_subtitles(index, path, output_format="srt", lo=0, hi=None, shift=0.0):
+    """Stream the cues of words lo..hi-1 to an SRT or VTT file"""
+    sink = (SrtSink if output_format == "srt" else VttSink)(path)
+    count = 0
+    for _ in write_segments(index.cues(lo, hi, shift), [sink], path):
+        count += 1
+    return count
+
+
+def extract_clip(audio_path, start, end, output_path):
+    """Write [start, end) of a recording to a WAV file, seeking to start"""
+    samples, rate = read_range(audio_path, start, end)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with wave.open(output_path, "wb") as f:
+        f.setnchannels(samples.shape[1])
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(np.ascontiguousarray(samples).tobytes())
+    return len(samples) / rate
+
+
+def clip_name(name, start, end):
+    stem = os.path.splitext(name)[0]
+    return f"{stem}_{format_timestamp(start, '.').replace(':', '')}-{format_timestamp(end, '.').replace(':', '')}.wav"
+
+
+def cut(index, audio_path, start, end, clip_dir, pad=CLIP_PAD_SECONDS, subtitles=True):
+    """Clip of [start - pad, end + pad] plus its subtitles (times from the clip start)"""
+    start, end = max(start - pad, 0.0), end + pad
+    output_path = os.path.join(clip_dir, clip_name(os.path.basename(audio_path), start, end))
+    seconds = extract_clip(audio_path, start, end, output_path)
+    if subtitles and index is not None:
+        lo, hi = index.between(start, end)
+        write_subtitles(index, os.path.splitext(output_path)[0] + ".srt", "srt", lo, hi, shift=start)
+    return output_path, seconds
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Search and export the word timestamps saved by main.py --words")
+    parser.add_argument("--words-dir", default=DEFAULT_WORDS_DIR,
+                        help=f"Saved word indexes (default: {DEFAULT_WORDS_DIR})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    search = commands.add_parser("search", help="Where a phrase was said, in every indexed recording")
+    search.add_argument("query")
+    search.add_argument("--file", default=None, help="Only this recording")
+    search.add_argument("--clip", action="store_true", help="Cut the audio of every hit")
+    search.add_argument("--audio-dir", default="audios", help="Where the recordings are (default: audios)")
+    search.add_argument("--clip-dir", default=DEFAULT_CLIP_DIR)
+    search.add_argument("--pad", type=float, default=CLIP_PAD_SECONDS)
+    span = commands.add_parser("range", help="Words said between two times (seconds)")
+    span.add_argument("file")
+    span.add_argument("start", type=float)
+    span.add_argument("end", type=float)
+    subtitles = commands.add_parser("subtitles", help="Subtitles regrouped from the words")
+    subtitles.add_argument("file")
+    subtitles.add_argument("--format", choices=("srt", "vtt"), default="srt")
+    subtitles.add_argument("--output", default=None)
+    clip = commands.add_parser("clip", help="Cut a time range (seconds) of a recording to WAV")
+    clip.add_argument("audio_path")
+    clip.add_argument("start", type=float)
+    clip.add_argument("end", type=float)
+    clip.add_argument("--clip-dir", default=DEFAULT_CLIP_DIR)
+    clip.add_argument("--pad", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.command == "search":
+        total = 0
+        for name, index in load_indexes(args.words_dir, args.file).items():
+            for hit in index.hits(args.query):
+                total += 1
+                speaker = f" [{hit['speaker']}]" if hit["speaker"] else ""
+                print(f"{name} {format_timestamp(hit['start'], '.')}{speaker}: {hit['text']}")
+                if args.clip:
+                    path, _ = cut(index, os.path.join(args.audio_dir, name), hit["start"], hit["end"],
+                                  args.clip_dir, args.pad)
+                    print(f"  -> {path}")
+        print(f"{total} hits")
+    elif args.command in ("range", "subtitles"):
+        indexes = load_indexes(args.words_dir, os.path.basename(args.file))
+        if not indexes:
+            parser.error(f"No word index for {args.file}; transcribe it with main.py --words")
+        index = next(iter(indexes.values()))
+        if args.command == "range":
+            lo, hi = index.between(args.start, args.end)
+            for cue in index.cues(lo, hi):
+                print(f"{format_timestamp(cue['start'], '.')} --> {format_timestamp(cue['end'], '.')} "
+                      f"{cue['text']}")
+        else:
+            output = args.output or os.path.join(
+                "transcriptions", os.path.splitext(os.path.basename(args.file))[0] + ".words." + args.format)
+            count = write_subtitles(index, output, args.format)
+            print(f"{count} cues written to {output}")
+    else:
+        indexes = load_indexes(args.words_dir, os.path.basename(args.audio_path))
+        index = next(iter(indexes.values()), None)
+        path, seconds = cut(index, args.audio_path, args.start, args.end, args.clip_dir, args.pad)
+        print(f"{seconds:.1f}s written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+"""Long-running local transcription service.
+
+Keeps the Whisper model loaded and accepts jobs over HTTP (TCP or a Unix
+socket) with the same shape as the AssemblyAI upload -> transcript -> poll
+flow, so the backend can point ASSEMBLYAI_BASE_URL at it:
+
+    POST /v2/upload              raw audio body      -> {"upload_url"}
+    POST /v2/transcript          {"audio_url", ...}  -> {"id", "status": "queued"}
+    GET  /v2/transcript/<id>                         -> {"id", "status", "text", "utterances", ...}
+    GET  /v2/status                                  -> queue depth, capacity, jobs
+
+Jobs go through a bounded queue; when it is full new uploads and
+transcripts are rejected with 429 and a Retry-After header instead of
+piling up. "audio_url" may also be an absolute path on this machine, which
+avoids copying the bytes for callers running on the same box, but only
+under the directories given with --local-dir. Uploads that are not
+transcribed within an hour are deleted.
+
+    python worker_service.py --port 8765
+    python worker_service.py --socket /tmp/transcriber.sock
+"""
+import argparse
+import collections
+import json
+import logging
+import os
+import queue
+import shutil
+import signal
+import socketserver
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from audio_io import duration_seconds, load_audio
+from cache import add_cache_arguments, open_cache
+from metrics import add_metrics_arguments
+from whisper_models import DEFAULT_MODEL_SIZE, add_model_arguments, get_whisper_model, transcribe_segments
+import metrics
+
+UPLOAD_DIR = os.path.join("transcriptions", "service_uploads")
+DEFAULT_QUEUE_SIZE = 8
+# Uploads nunca enviados para transcrição são apagados depois disto
+UPLOAD_TTL_SECONDS = 3600
+# Jobs concluídos mantidos para consulta antes de serem descartados
+FINISHED_JOBS_KEPT = 1000
+
+
+def transcribe_plain(audio, model):
+    """Whisper only: text plus segments, like main.py"""
+    segments = list(transcribe_segments(model, audio, language="pt"))
+    return {"text": " ".join(s['text'] for s in segments if s['text']), "segments": segments}
+
+
+def transcribe_with_speakers(audio, model):
+    """Silence-based speaker turns, like main_di.py, returned as utterances"""
+    from main_di import detect_speaker_changes
+    from segment_windows import transcribe_windows
+
+    utterances = []
+    for segment, text in transcribe_windows(model, audio, detect_speaker_changes(audio)):
+        if text:
+            utterances.append({"speaker": segment['speaker'], "text": text,
+                               "start": int(segment['start'] * 1000),
+                               "end": int(segment['end'] * 1000)})
+    return {"text": " ".join(u['text'] for u in utterances), "utterances": utterances}
+
+
+class TranscriptionService:
+    """Bounded job queue in front of one resident model"""
+
+    def __init__(self, model_size=DEFAULT_MODEL_SIZE, compute_type=None, cpu_threads=0,
+                 queue_size=DEFAULT_QUEUE_SIZE, cache_args=None, local_dirs=()):
+        self.model_options = (model_size, compute_type, cpu_threads)
+        self.local_dirs = [os.path.realpath(directory) for directory in local_dirs]
+        self.jobs = collections.OrderedDict()
+        # Uploads ainda não enviados para transcrição: id -> quando chegaram
+        self.uploads = {}
+        self.lock = threading.Lock()
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.cache_args = cache_args
+        self.processing = None
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+    def warm_up(self):
+        get_whisper_model(*self.model_options)
+
+    def queue_full(self):
+        return self.queue.full()
+
+    def save_upload(self, stream, length):
+        """Copy an upload body to disk; returns its local path.
+
+        length=None reads a chunked body (what assemblyai_client sends).
+        """
+        self.expire_uploads()
+        upload_id = uuid.uuid4().hex
+        path = os.path.join(UPLOAD_DIR, upload_id)
+        with open(path, "wb") as f:
+            for chunk in (read_chunked(stream) if length is None else read_exactly(stream, length)):
+                f.write(chunk)
+        with self.lock:
+            self.uploads[upload_id] = time.time()
+        return path
+
+    def upload_path(self, upload_id):
+        """Path of a pending upload of this service; None if unknown or expired"""
+        with self.lock:
+            if upload_id not in self.uploads:
+                return None
+        return os.path.join(UPLOAD_DIR, upload_id)
+
+    def expire_uploads(self, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            expired = [upload_id for upload_id, created in self.uploads.items()
+                       if now - created > UPLOAD_TTL_SECONDS]
+            for upload_id in expired:
+                del self.uploads[upload_id]
+        for upload_id in expired:
+            path = os.path.join(UPLOAD_DIR, upload_id)
+            if os.path.exists(path):
+                os.remove(path)
+            logging.info(f"Deleted upload {upload_id}, never transcribed")
+
+    def local_path(self, audio_url):
+        """Real path of a local file under one of the allowed directories, else None"""
+        path = os.path.realpath(audio_url)
+        for directory in self.local_dirs:
+            if os.path.commonpath([path, directory]) == directory:
+                return path
+        return None
+
+    def submit(self, audio_path, speaker_labels=False, owned=False):
+        """Queue a job; raises queue.Full when there is no room"""
+        job = {"id": uuid.uuid4().hex, "status": "queued", "audio_path": audio_path,
+               "speaker_labels": speaker_labels, "owned": owned, "created": time.time(),
+               "text": None, "utterances": None, "error": None}
+        with self.lock:
+            self.queue.put_nowait(job["id"])
+            self.jobs[job["id"]] = job
+            if owned:
+                # O job apaga o upload quando termina
+                self.uploads.pop(os.path.basename(audio_path), None)
+            self._forget_old_jobs()
+        metrics.gauge("queue_depth", self.queue.qsize())
+        logging.info(f"Queued job {job['id']} for {os.path.basename(audio_path)} "
+                     f"({self.queue.qsize()}/{self.queue.maxsize} in queue)")
+        return job
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items()
+                    if job["status"] in ("completed", "error")]
+        for job_id in finished[:max(0, len(finished) - FINISHED_JOBS_KEPT)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def status(self):
+        with self.lock:
+            counts = collections.Counter(job["status"] for job in self.jobs.values())
+        return {"queue_depth": self.queue.qsize(), "queue_size": self.queue.maxsize,
+                "processing": self.processing, "jobs": dict(counts)}
+
+    def run(self, stop):
+        """Job loop; runs in its own thread until stop is set"""
+        cache = open_cache(self.cache_args) if self.cache_args else None
+        model_size, compute_type, _ = self.model_options
+        while not stop.is_set():
+            try:
+                job_id = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                self.expire_uploads()
+                continue
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if job is None:
+                    continue
+                job["status"] = "processing"
+            self.processing = job_id
+            metrics.gauge("queue_depth", self.queue.qsize())
+            start = time.perf_counter()
+            try:
+                options = {"model": model_size, "compute_type": compute_type, "language": "pt",
+                           "service": "speakers" if job["speaker_labels"] else "plain"}
+                key = cache.key(job["audio_path"], **options) if cache else None
+                result = cache.get(key) if cache else None
+                if result is None:
+                    audio = load_audio(job["audio_path"])
+                    model = get_whisper_model(*self.model_options)
+                    with metrics.timer("transcribe", audio_seconds=duration_seconds(audio)):
+                        result = (transcribe_with_speakers(audio, model) if job["speaker_labels"]
+                                  else transcribe_plain(audio, model))
+                    result["audio_duration"] = duration_seconds(audio)
+                    if cache:
+                        cache.put(key, job["audio_path"], options, result)
+                with self.lock:
+                    job.update(status="completed", text=result["text"],
+                               utterances=result.get("utterances"),
+                               audio_duration=result["audio_duration"], completed=time.time())
+                metrics.count("jobs_completed")
+                logging.info(f"Job {job_id} completed in {time.perf_counter() - start:.2f}s")
+            except Exception as e:
+                with self.lock:
+                    job.update(status="error", error=f"{type(e).__name__}: {e}", completed=time.time())
+                metrics.count("jobs_failed")
+                logging.error(f"Job {job_id} failed: {e}")
+            finally:
+                self.processing = None
+                if job["owned"] and os.path.exists(job["audio_path"]):
+                    os.remove(job["audio_path"])
+        if cache:
+            cache.close()
+
+
+def read_exactly(stream, length):
+    remaining = length
+    while remaining > 0:
+        chunk = stream.read(min(remaining, 1 << 20))
+        if not chunk:
+            break
+        yield chunk
+        remaining -= len(chunk)
+
+
+def read_chunked(stream):
+    """Body of a Transfer-Encoding: chunked request"""
+    while True:
+        size = int(stream.readline().split(b";")[0], 16)
+        if size == 0:
+            # Trailers opcionais até a linha vazia
+            while stream.readline() not in (b"\r\n", b"\n", b""):
+                pass
+            return
+        yield from read_exactly(stream, size)
+        stream.readline()
+
+
+def public_job(job):
+    """Job fields in the shape of an AssemblyAI transcript"""
+    return {key: job.get(key) for key in
+            ("id", "status", "text", "utterances", "error", "audio_duration")}
+
+
+def make_handler(service, base_url):
+    class Handler(BaseHTTPRequestHandler):
+        def _json(self, status, body, headers=None):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _busy(self):
+            metrics.count("jobs_rejected")
+            self._json(429, {"error": "Transcription queue is full"}, {"Retry-After": "5"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if self.path == "/v2/upload":
+                if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+                    length = None
+                if service.queue_full():
+                    for _ in read_chunked(self.rfile) if length is None else read_exactly(self.rfile, length):
+                        pass
+                    return self._busy()
+                path = service.save_upload(self.rfile, length)
+                return self._json(200, {"upload_url": f"{base_url}/uploads/{os.path.basename(path)}"})
+
+            if self.path == "/v2/transcript":
+                try:
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    return self._json(400, {"error": "Invalid JSON body"})
+                audio_url = request.get("audio_url") or ""
+                owned = audio_url.startswith(f"{base_url}/uploads/")
+                if owned:
+                    audio_path = service.upload_path(audio_url[len(f"{base_url}/uploads/"):])
+                elif os.path.isabs(audio_url):
+                    audio_path = service.local_path(audio_url)
+                else:
+                    return self._json(400, {"error": "audio_url must be an upload_url or a local path"})
+                if audio_path is None or not os.path.exists(audio_path):
+                    return self._json(400, {"error": f"Audio not found: {audio_url}"})
+                try:
+                    job = service.submit(audio_path, bool(request.get("speaker_labels")), owned)
+                except queue.Full:
+                    return self._busy()
+                return self._json(200, public_job(job))
+
+            self._json(404, {"error": "Not found"})
+
+        def do_GET(self):
+            if self.path == "/v2/status":
+                return self._json(200, service.status())
+            if self.path.startswith("/v2/transcript/"):
+                job = service.get(self.path.rsplit("/", 1)[-1])
+                if job is None:
+                    return self._json(404, {"error": "Transcript not found"})
+                return self._json(200, public_job(job))
+            self._json(404, {"error": "Not found"})
+
+        def log_message(self, format, *args):
+            logging.debug(format % args)
+
+    return Handler
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("unix", 0)  # BaseHTTPRequestHandler espera (host, porta)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Serve local transcriptions with the models kept in memory")
+    add_model_arguments(parser)
+    add_cache_arguments(parser)
+    add_metrics_arguments(parser)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", default=None,
+                        help="Listen on this Unix socket instead of TCP")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help=f"Jobs accepted before answering 429 (default: {DEFAULT_QUEUE_SIZE})")
+    parser.add_argument("--cpu-threads", type=int, default=0)
+    parser.add_argument("--local-dir", action="append", default=[],
+                        help="Directory whose files may be sent as a local audio_url path "
+                             "(repeatable; by default only uploads are accepted)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('transcription_service.log'),
+            logging.StreamHandler()
+        ]
+    )
+    args = parse_args()
+    os.makedirs("transcriptions", exist_ok=True)
+    metrics.configure(args)
+
+    service = TranscriptionService(args.model_size, args.compute_type, args.cpu_threads,
+                                   args.queue_size, None if args.no_cache else args, args.local_dir)
+    logging.info("Loading models...")
+    service.warm_up()
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = UnixHTTPServer(args.socket, make_handler(service, "http://localhost"))
+        address = f"unix:{args.socket}"
+    else:
+        base_url = f"http://{args.host}:{args.port}"
+        server = ThreadingHTTPServer((args.host, args.port), make_handler(service, base_url))
+        address = base_url
+
+    stop = threading.Event()
+    worker = threading.Thread(target=service.run, args=(stop,), daemon=True)
+    worker.start()
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+
+    logging.info(f"Transcription service listening on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        worker.join()
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+        shutil.rmtree(UPLOAD_DIR, ignore_errors=True)
+        logging.info("Transcription service stopped")